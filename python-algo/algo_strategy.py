@@ -15,8 +15,8 @@ Advanced strategy tips:
   - You can analyze action frames by modifying on_action_frame function
 
   - The GameState.map object can be manually manipulated to create hypothetical
-  board states. Though, we recommended making a copy of the map to preserve
-  the actual current map state.
+  board states. Though, we recommended making a copy to preserve the actual
+  current map state, which game_state.fork() does cheaply.
 """
 
 class AlgoStrategy(gamelib.AlgoCore):
@@ -53,7 +53,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         self.destructor_locations = [[3,13],[24,13],[10,13],[17,13]]
         self.destructors_nextturn = []
 
-    def on_turn(self, turn_state):
+    def on_turn(self, turn_state, parsed_state=None):
         """
         This function is called every turn with the game state wrapper as
         an argument. The wrapper stores the state of the arena and has methods
@@ -61,7 +61,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         unit deployments, and transmitting your intended deployments to the
         game engine.
         """
-        game_state = gamelib.GameState(self.config, turn_state)
+        game_state = gamelib.GameState(self.config, turn_state, parsed_state)
         gamelib.debug_write('Performing turn {} of your custom algo strategy'.format(game_state.turn_number))
         game_state.suppress_warnings(True)  #Comment or remove this line to enable warnings.
         if game_state.turn_number > 0:
@@ -100,11 +100,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         # Get the damage estimate each path will take
         for location in location_coordinates:
             path = game_state.find_path_to_edge(location)
-            damage = 0
-            for path_location in path:
-                # Get number of enemy destructors that can attack the final location and multiply by destructor damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(DESTRUCTOR, game_state.config).damage
-            damages.append(damage)
+            # Sum the damage of the enemy destructors that can attack each location on the path
+            damages.append(game_state.game_map.path_damage(path, 0))
 
         # Now just return the location that takes the least damage
         return location_coordinates[damages.index(min(damages))]
@@ -334,11 +331,8 @@ class AlgoStrategy(gamelib.AlgoCore):
         # Get the damage estimate each path will take
         for location in location_options:
             path = game_state.find_path_to_edge(location)
-            damage = 0
-            for path_location in path:
-                # Get number of enemy destructors that can attack the final location and multiply by destructor damage
-                damage += len(game_state.get_attackers(path_location, 0)) * gamelib.GameUnit(DESTRUCTOR, game_state.config).damage
-            damages.append(damage)
+            # Sum the damage of the enemy destructors that can attack each location on the path
+            damages.append(game_state.game_map.path_damage(path, 0))
 
         # Now just return the location that takes the least damage
         return location_options[damages.index(min(damages))]
@@ -359,7 +353,7 @@ class AlgoStrategy(gamelib.AlgoCore):
                 filtered.append(location)
         return filtered
 
-    def on_action_frame(self, turn_string):
+    def on_action_frame(self, turn_string, parsed_state=None):
         """
         This is the action frame of the game. This function could be called
         hundreds of times per turn and could slow the algo down so avoid putting slow code here.
@@ -367,7 +361,7 @@ class AlgoStrategy(gamelib.AlgoCore):
         Full doc on format of a game frame at: https://docs.c1games.com/json-docs.html
         """
         # Let's record at what position we get scored on
-        state = json.loads(turn_string)
+        state = json.loads(turn_string) if parsed_state is None else parsed_state
         events = state["events"]
         breaches = events["breach"]
         for breach in breaches:
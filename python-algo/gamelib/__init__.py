@@ -6,7 +6,16 @@ from .algocore import AlgoCore
 from .util import debug_write
 from .game_state import GameState
 from .unit import GameUnit
-from .game_map import GameMap
+from .game_map import GameMap, TurnChanges
+from .board_arrays import BoardArrays
+from .simulator import ActionSimulator, SimulationResult
+from .worker_pool import WorkerPool
+from .budget import TurnBudget
+from .speculation import Speculator, Speculation
+from .frame_tracker import FrameTracker
+from .recorder import GameRecorder, GameRecording
+from .instrument import Instrumentation
+from .projection import ResourceProjection
 
-__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util"]
+__all__ = ["algocore", "game_state", "game_map", "navigation", "unit", "util", "board_arrays", "simulator", "worker_pool", "budget", "speculation", "frame_tracker", "recorder", "instrument", "projection", "config"]
  
\ No newline at end of file
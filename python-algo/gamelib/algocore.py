@@ -1,17 +1,44 @@
-import json
+import inspect
+import time
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 
 from .game_state import GameState
-from .util import get_command, debug_write, BANNER_TEXT, send_command
+from .budget import TurnBudget, active_budget
+from .speculation import Speculator, board_signature
+from .recorder import GameRecorder
+from . import instrument
+from .util import get_command, debug_write, BANNER_TEXT, send_command, classify_message, set_command_recorder, read_turn_info, \
+    CONFIG_MESSAGE, TURN_MESSAGE, ACTION_FRAME_MESSAGE, END_MESSAGE, UNKNOWN_MESSAGE
+
+def _accepts_parsed_state(handler):
+    """
+    True if handler takes a parsed_state keyword argument, which opts it in to receiving the parsed message.
+    """
+    try:
+        parameters = inspect.signature(handler).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(parameter.name == "parsed_state" or parameter.kind == inspect.Parameter.VAR_KEYWORD
+               for parameter in parameters)
 
 class AlgoCore(object):
     """This class handles communication with the game itself. Your strategy should subclass it.
 
     Attributes:
         * config (JSON): json object containing information about the game
+        * budget (:obj: TurnBudget): The time budget of the turn being played, set while on_turn runs
+        * speculation (:obj: Speculation): The still valid result of speculate for the turn being played, set while on_turn runs.
+          None if speculate is not overridden, had no result in time, or the board changed since the frame it planned against
 
     """
     def __init__(self):
         self.config = None
+        self.budget = None
+        self.speculation = None
 
     def on_game_start(self, config):
         """
@@ -23,7 +50,9 @@ class AlgoCore(object):
     def on_turn(self, game_state):
         """
         This step function is called every turn and is passed a string containing
-        the current game state, which can be used to initialize a new GameMap
+        the current game state, which can be used to initialize a new GameMap.
+        Define it as on_turn(self, turn_string, parsed_state) to also be passed the already parsed
+        json object, which can be given to GameState so the turn is not parsed twice.
         """
         self.submit_default_turn()
     
@@ -32,11 +61,58 @@ class AlgoCore(object):
         This function is called every action frame and is passed a string containing
         the current game state, which can also be used to initialize a new GameMap.
         Be careful about going over your compute time as this is potentially called hundreds of 
-        times per turn
+        times per turn.
+        Define it as on_action_frame(self, turn_string, parsed_state) to also be passed the already parsed json object.
+        Action frames are not parsed or dispatched at all unless this function is overridden.
         """
         pass
 
+    def speculate(self, game_state):
+        """
+        Override this to plan the next turn in a background thread while the action phase plays out, off the turn clock.
+        It is passed a GameState of the latest action frame, which it may change, and whatever it returns is available
+        to on_turn as self.speculation.result if the firewalls on the board have not changed since that frame.
+        It is run again on the newest frame each time it finishes, so it should take well under the length of an action phase.
+        A long search should return early once gamelib.speculation.cancelled() is True, which it becomes when the turn arrives.
+        The plan is checked with gamelib.speculation.board_signature, override speculation_signature to check something else.
+        """
+        return None
+
+    def speculation_signature(self, parsed_state):
+        """
+        Override this to change what must match between an action frame and the next turn for a plan made by speculate
+        to be used. Is passed the frame or turn parsed as json. Defaults to gamelib.speculation.board_signature.
+        """
+        return board_signature(parsed_state)
+
+    def get_recording_path(self):
+        """
+        Override this to return a file path to record the game to, see gamelib.recorder. Every line received from the game and
+        every command sent is written to it, compressed, from a background thread. Defaults to None, which records nothing.
+        """
+        return None
+
+    def get_instrumentation_output(self):
+        """
+        Override this to return a file path, or a file object such as sys.stderr, to write a line of call counts and timings of the
+        main gamelib entry points to at the end of each turn, see gamelib.instrument. Defaults to None, which turns instrumentation off.
+        """
+        return None
+
+    def get_turn_time_limit(self):
+        """
+        Override this to change the number of seconds on_turn may take before the watchdog of self.budget
+        submits the best plan registered with self.budget.set_best. Defaults to 90% of the config's soft time limit.
+        Turns of a strategy that never calls set_best are never submitted by the watchdog.
+        """
+        timing = (self.config or {}).get("timingAndReplay", {})
+        return timing.get("waitTimeBotSoft", 5000) / 1000 * 0.9
+
     def submit_default_turn(self):
+        budget = active_budget()
+        if budget is not None:
+            budget.submit([], [])
+            return
         send_command("")
         send_command("")
 
@@ -48,43 +124,102 @@ class AlgoCore(object):
         """
         debug_write(BANNER_TEXT)
 
-        while True:
-            # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
-            # manually kill this Python program.
-            game_state_string = get_command()
-            if "replaySave" in game_state_string:
-                """
-                This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
-                """
-                parsed_config = json.loads(game_state_string)
-                self.on_game_start(parsed_config)
-            elif "turnInfo" in game_state_string:
-                state = json.loads(game_state_string)
-                stateType = int(state.get("turnInfo")[0])
-                if stateType == 0:
+        # Action frames arrive hundreds of times per turn, so lines are classified without parsing them and
+        # each line is parsed at most once, only when a handler asked for the parsed json object.
+        on_turn = self.on_turn
+        on_action_frame = self.on_action_frame
+        turn_wants_state = _accepts_parsed_state(on_turn)
+        frame_wants_state = _accepts_parsed_state(on_action_frame)
+        frames_subscribed = type(self).on_action_frame is not AlgoCore.on_action_frame
+        speculating = type(self).speculate is not AlgoCore.speculate
+        speculator = None
+
+        recording_path = self.get_recording_path()
+        recorder = GameRecorder(recording_path) if recording_path else None
+        if recorder is not None:
+            set_command_recorder(recorder)
+        instrumentation_output = self.get_instrumentation_output()
+        instrumentation = instrument.enable(instrumentation_output) if instrumentation_output is not None else None
+
+        try:
+            while True:
+                # Note: Python blocks and hangs on stdin. Can cause issues if connections aren't setup properly and may need to
+                # manually kill this Python program.
+                game_state_string = get_command()
+                received = time.perf_counter()
+                if recorder is not None:
+                    recorder.record_received(game_state_string)
+                message_type = classify_message(game_state_string)
+                if message_type == ACTION_FRAME_MESSAGE:
+                    """
+                    This game_state_string string represents a single frame of an action phase
+                    """
+                    parsed_state = None
+                    if frames_subscribed:
+                        if frame_wants_state:
+                            parsed_state = loads(game_state_string)
+                            on_action_frame(game_state_string, parsed_state=parsed_state)
+                        else:
+                            on_action_frame(game_state_string)
+                    if speculator is not None:
+                        speculator.offer(game_state_string, parsed_state)
+                elif message_type == TURN_MESSAGE:
                     """
                     This is the game turn game state message. Algo must now print to stdout 2 lines, one for build phase one for
                     deploy phase. Printing is handled by the provided functions.
                     """
-                    self.on_turn(game_state_string)
-                elif stateType == 1:
+                    self.budget = TurnBudget(self.get_turn_time_limit(), received)
+                    self.budget.start_watchdog()
+                    if instrumentation is not None:
+                        instrumentation.reset()
+                    try:
+                        parsed_state = None
+                        if speculator is not None:
+                            # A plan still being made is waited for with part of the turn, it is likely to be valid
+                            parsed_state = loads(game_state_string)
+                            self.speculation = speculator.collect(parsed_state, self.budget.remaining() / 4)
+                        if turn_wants_state:
+                            if parsed_state is None:
+                                parsed_state = loads(game_state_string)
+                            on_turn(game_state_string, parsed_state=parsed_state)
+                        else:
+                            on_turn(game_state_string)
+                        if not self.budget.submitted and self.budget.has_best():
+                            self.budget.submit_best()
+                    finally:
+                        self.budget.stop_watchdog()
+                        self.speculation = None
+                        if instrumentation is not None:
+                            instrumentation.write_turn(read_turn_info(game_state_string)[1], self.budget.elapsed())
+                elif message_type == CONFIG_MESSAGE:
                     """
-                    If stateType == 1, this game_state_string string represents a single frame of an action phase
+                    This means this must be the config file. So, load in the config file as a json and add it to your AlgoStrategy class.
                     """
-                    self.on_action_frame(game_state_string)
-                elif stateType == 2:
+                    parsed_config = loads(game_state_string)
+                    self.on_game_start(parsed_config)
+                    if speculating and speculator is None:
+                        speculator = Speculator(parsed_config, self.speculate, self.speculation_signature)
+                elif message_type == END_MESSAGE:
                     """
                     This is the end game message. This means the game is over so break and finish the program.
                     """
                     debug_write("Got end state quitting bot.")
                     break
-                else:
+                elif message_type is not UNKNOWN_MESSAGE:
                     """
                     Something is wrong? Received an incorrect or improperly formatted string.
                     """
                     debug_write("Got unexpected string with turnInfo: {}".format(game_state_string))
-            else:
-                """
-                Something is wrong? Received an incorrect or improperly formatted string.
-                """
-                debug_write("Got unexpected string : {}".format(game_state_string))
+                else:
+                    """
+                    Something is wrong? Received an incorrect or improperly formatted string.
+                    """
+                    debug_write("Got unexpected string : {}".format(game_state_string))
+        finally:
+            if instrumentation is not None:
+                instrument.disable()
+            if speculator is not None:
+                speculator.close()
+            if recorder is not None:
+                set_command_recorder(None)
+                recorder.close()
@@ -0,0 +1,359 @@
+"""
+Benchmarks for gamelib hot paths. Run from the algo folder with
+
+    python -m gamelib.bench [--filter get_attackers] [--save baseline.json] [--baseline baseline.json]
+
+Boards are generated from a fixed seed so runs are comparable. The board level benchmarks run on every fixture in
+FIXTURES, from an empty board to a dense late game one, and on turns taken from a game recorded with GameRecorder
+when --recording is given. Each result is the best of a few repeats, in operations per second. --save writes the
+results to a json file, and --baseline compares against one saved earlier, exiting with status 1 when any
+benchmark is slower than the baseline by more than the tolerance.
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import timeit
+
+from .algocore import AlgoCore
+from .game_state import GameState
+from .game_map import ARENA_SIZE, ARENA_BOUNDS
+from .simulator import ActionSimulator
+from .unit import GameUnit
+from .recorder import GameRecording, CONFIG_BLOCK, RECEIVED
+from .util import read_turn_info, TURN_MESSAGE
+from .config import DEFAULT_CONFIG
+
+"""
+The generated boards the board level benchmarks run on, as (name, seed, firewalls per player, turn number),
+from an empty board through the opening to a dense late game board with most of each half built.
+"""
+FIXTURES = [
+    ("empty", 0, 0, 0),
+    ("opening", 1, 15, 2),
+    ("midgame", 2, 60, 20),
+    ("late game", 3, 120, 45),
+    ("dense", 4, 180, 80),
+]
+
+DEFAULT_TOLERANCE = 0.15
+
+def random_turn_string(seed, firewalls_per_player, turn_number=40, removals=5):
+    """Builds a turn string with randomly placed firewalls on each side of the board
+
+    Args:
+        * seed: The random seed, the same seed always gives the same board
+        * firewalls_per_player: The number of firewalls each player has
+        * turn_number: The turn number to report
+        * removals: The number of each player's firewalls flagged for removal
+
+    Returns:
+        A turn string in the format sent by the game engine
+
+    """
+    rng = random.Random(seed)
+    unit_id = 0
+    player_units = []
+    for player_index in range(2):
+        half = [[x, y] for x in range(ARENA_SIZE) for y in range(ARENA_SIZE)
+                if ARENA_BOUNDS[x][y] and (y < ARENA_SIZE // 2) == (player_index == 0)]
+        locations = rng.sample(half, min(firewalls_per_player, len(half)))
+        units = [[] for _ in range(7)]
+        for x, y in locations:
+            type_index = rng.choice([0, 0, 1, 2, 2])
+            stability = DEFAULT_CONFIG["unitInformation"][type_index]["stability"]
+            unit_id += 1
+            units[type_index].append([x, y, float(rng.randint(1, int(stability))), str(unit_id)])
+        for x, y in locations[:removals]:
+            unit_id += 1
+            units[6].append([x, y, 0.0, str(unit_id)])
+        player_units.append(units)
+
+    return json.dumps({
+        "p1Units": player_units[0],
+        "p2Units": player_units[1],
+        "turnInfo": [0, turn_number, -1],
+        "p1Stats": [20.0, 12.0, 14.3, 1532],
+        "p2Stats": [17.0, 9.0, 11.8, 1764],
+        "events": {"selfDestruct": [], "breach": [], "damage": [], "shield": [], "move": [], "spawn": [], "death": [], "attack": [], "melee": []}
+    })
+
+def max_frame_string(seed, mobile_units=200, events_per_type=100):
+    """Builds an action frame string about as large as the game sends, with both halves of the board full of firewalls
+
+    Args:
+        * seed: The random seed, the same seed always gives the same frame
+        * mobile_units: The number of mobile units each player has on the board
+        * events_per_type: The number of events of each type in the frame
+
+    Returns:
+        An action frame string in the format sent by the game engine
+
+    """
+    rng = random.Random(seed)
+    state = json.loads(random_turn_string(seed, ARENA_SIZE * ARENA_SIZE, removals=0))
+    state["turnInfo"] = [1, 40, 50]
+    unit_id = 100000
+    for units in [state["p1Units"], state["p2Units"]]:
+        for _ in range(mobile_units):
+            unit_id += 1
+            units[rng.randint(3, 5)].append([rng.randrange(ARENA_SIZE), rng.randrange(ARENA_SIZE), 15.0, str(unit_id)])
+    for events in state["events"].values():
+        for _ in range(events_per_type):
+            unit_id += 1
+            events.append([[rng.randrange(ARENA_SIZE), rng.randrange(ARENA_SIZE)], [rng.randrange(ARENA_SIZE), rng.randrange(ARENA_SIZE)],
+                           4.0, rng.randint(0, 5), str(unit_id), rng.randint(1, 2)])
+    return json.dumps(state)
+
+def fixture_boards(recording=None, recorded_turns=3):
+    """Gets the boards the board level benchmarks run on
+
+    Args:
+        * recording: A GameRecording to take boards from as well as FIXTURES, or None
+        * recorded_turns: The number of turns taken from the recording, spread evenly over the game
+
+    Returns:
+        A list of (name, config, turn string) tuples
+
+    """
+    boards = [(name, DEFAULT_CONFIG, random_turn_string(seed, firewalls, turn_number))
+              for name, seed, firewalls, turn_number in FIXTURES]
+    if recording is None:
+        return boards
+    config = json.loads(next(line for direction, line in recording.read_block(CONFIG_BLOCK) if direction == RECEIVED))
+    turns = recording.turns()
+    if recorded_turns > 1 and len(turns) > 1:
+        picked = sorted({turns[position * (len(turns) - 1) // (recorded_turns - 1)] for position in range(recorded_turns)})
+    else:
+        picked = turns[-1:]
+    for turn_number in picked:
+        for direction, line in recording.read_block(turn_number):
+            turn_info = read_turn_info(line) if direction == RECEIVED else None
+            if turn_info is not None and turn_info[0] == TURN_MESSAGE:
+                boards.append(("recorded turn {}".format(turn_number), config, line))
+                break
+    return boards
+
+class BenchResults:
+    """Times benchmarks and writes each result as it is measured
+
+    Attributes:
+        * ops_per_sec (dict): Maps the name of each benchmark run to its operations per second
+        * repeat (int): The number of times each benchmark is repeated, the fastest repeat is kept
+        * name_filter (str): Only benchmarks whose name contains it are run, all of them if None
+
+    """
+    def __init__(self, repeat=3, name_filter=None, out=None):
+        self.ops_per_sec = {}
+        self.repeat = repeat
+        self.name_filter = name_filter
+        self.out = out or sys.stdout
+
+    def time(self, name, func, runs, ops_per_run=1):
+        """Times a benchmark, unless it is filtered out
+
+        Args:
+            * name: The name of the benchmark, the key of its result in saved baselines
+            * func: The function to time, called with no arguments
+            * runs: The number of calls to func in each repeat
+            * ops_per_run: The number of operations one call to func does, such as the number of locations it checks
+
+        """
+        if self.name_filter is not None and self.name_filter not in name:
+            return
+        seconds = min(timeit.repeat(func, number=runs, repeat=self.repeat))
+        ops = runs * ops_per_run
+        self.ops_per_sec[name] = ops / seconds
+        self.out.write("{:<56} {:>12.1f} ops/sec {:>10.2f} us/op\n".format(name, ops / seconds, seconds / ops * 1e6))
+
+def bench_parse(results, runs=200):
+    """Times GameState construction on late game boards, with and without touching every location
+    """
+    for firewalls in [0, 60, 150]:
+        turn_string = random_turn_string(firewalls, firewalls)
+
+        def parse():
+            GameState(DEFAULT_CONFIG, turn_string)
+
+        def parse_and_touch():
+            game_state = GameState(DEFAULT_CONFIG, turn_string)
+            for location in game_state.game_map:
+                game_state.game_map[location]
+
+        results.time("parse {} firewalls per player".format(firewalls), parse, runs)
+        results.time("parse {} firewalls per player, touch all".format(firewalls), parse_and_touch, runs)
+
+def bench_boards(results, boards):
+    """Times the GameState and GameMap queries a strategy makes each turn on each board
+
+    Every query is made from every location it applies to, and one operation is one query. Pathing goes through
+    navigate_multiple_endpoints without a PathingContext, so each path scans the board for walls as a single call
+    from a strategy would. attempt_spawn is timed on a fork of the board, so its operations include a share of the fork.
+
+    Args:
+        * boards: The boards as returned by fixture_boards
+
+    """
+    all_locations = [[x, y] for x in range(ARENA_SIZE) for y in range(ARENA_SIZE) if ARENA_BOUNDS[x][y]]
+    for board_name, config, turn_string in boards:
+        shorthands = [info["shorthand"] for info in config["unitInformation"]]
+        game_state = GameState(config, turn_string)
+        game_state.suppress_warnings(True)
+        game_map = game_state.game_map
+        own_half = [location for location in all_locations if location[1] < game_state.HALF_ARENA]
+        open_locations = [location for location in all_locations if not game_state.contains_stationary_unit(location)]
+        units = [GameUnit(shorthands[3], config, location[1] >= game_state.HALF_ARENA, None, *location) for location in open_locations]
+        starts = [location for location in game_map.get_edge_locations(game_map.BOTTOM_LEFT) + game_map.get_edge_locations(game_map.BOTTOM_RIGHT)
+                  if not game_state.contains_stationary_unit(location)]
+        path_finder = game_state._shortest_path_finder
+
+        def can_spawn():
+            for location in own_half:
+                game_state.can_spawn(shorthands[2], location)
+
+        def attempt_spawn():
+            game_state.fork().attempt_spawn(shorthands[0], own_half)
+
+        def locations_in_range():
+            for location in all_locations:
+                game_map.get_locations_in_range(location, 3.0)
+
+        def get_attackers():
+            for location in all_locations:
+                game_state.get_attackers(location, 0)
+
+        def get_target():
+            for unit in units:
+                game_state.get_target(unit)
+
+        def navigate():
+            for start in starts:
+                end_points = game_map.get_edge_locations(game_state.get_target_edge(start))
+                path_finder.navigate_multiple_endpoints(start, end_points, game_state)
+
+        suffix = " [{}]".format(board_name)
+        results.time("GameState.__init__" + suffix, lambda: GameState(config, turn_string), 100)
+        results.time("can_spawn" + suffix, can_spawn, 20, len(own_half))
+        results.time("attempt_spawn" + suffix, attempt_spawn, 20, len(own_half))
+        results.time("get_locations_in_range" + suffix, locations_in_range, 10, len(all_locations))
+        results.time("get_attackers" + suffix, get_attackers, 10, len(all_locations))
+        results.time("get_target" + suffix, get_target, 5, max(1, len(units)))
+        if starts:
+            results.time("navigate_multiple_endpoints" + suffix, navigate, 2, len(starts))
+
+def bench_fork(results, runs=2000):
+    """Times GameState.fork against parsing the turn again
+    """
+    turn_string = random_turn_string(150, 150)
+    game_state = GameState(DEFAULT_CONFIG, turn_string)
+
+    def fork_and_spawn():
+        game_state.fork().game_map.add_unit("DF", [13, 13], 0)
+
+    results.time("fork 150 firewalls per player, add one unit", fork_and_spawn, runs)
+
+def bench_simulate(results, runs=50):
+    """Times simulated action phases of a ping rush and an emp push against a 60 firewall defence
+    """
+    simulator = ActionSimulator(GameState(DEFAULT_CONFIG, random_turn_string(3, 60)))
+    for unit_type, num in [("PI", 10), ("EI", 4)]:
+        def simulate():
+            simulator.simulate([(unit_type, [13, 0], num, 0)])
+
+        results.time("simulate {} {} against 60 firewalls".format(num, unit_type), simulate, runs)
+
+def bench_dispatch(results, frames=500):
+    """Feeds max size action frames through AlgoCore.start, with frames unsubscribed, subscribed and subscribed with parsed_state
+    """
+    config_string = json.dumps(DEFAULT_CONFIG)
+    frame_string = max_frame_string(0)
+    end_string = json.dumps({"turnInfo": [2, 40, -1]})
+    stream = "\n".join([config_string] + [frame_string] * frames + [end_string]) + "\n"
+
+    class Unsubscribed(AlgoCore):
+        pass
+
+    class Subscribed(AlgoCore):
+        def on_action_frame(self, turn_string):
+            json.loads(turn_string)
+
+    class SubscribedParsed(AlgoCore):
+        def on_action_frame(self, turn_string, parsed_state):
+            pass
+
+    stdin, stderr = sys.stdin, sys.stderr
+    try:
+        for name, algo_class in [("unsubscribed", Unsubscribed), ("subscribed, parsing the string", Subscribed),
+                                 ("subscribed with parsed_state", SubscribedParsed)]:
+            def dispatch():
+                sys.stdin = io.StringIO(stream)
+                sys.stderr = io.StringIO()
+                algo_class().start()
+
+            results.time("dispatch {} kB frames, {}".format(len(frame_string) // 1000, name), dispatch, 1, frames)
+    finally:
+        sys.stdin, sys.stderr = stdin, stderr
+
+def save_baseline(path, ops_per_sec):
+    """Writes benchmark results to a json file for later runs to compare against
+    """
+    with open(path, "w") as file:
+        json.dump({"python": platform.python_version(), "ops_per_sec": ops_per_sec}, file, indent=1, sort_keys=True)
+
+def compare(ops_per_sec, baseline, tolerance=DEFAULT_TOLERANCE, out=None):
+    """Compares benchmark results against a saved baseline and writes the comparison to out, stdout by default
+
+    Args:
+        * ops_per_sec: The results of this run, as in BenchResults.ops_per_sec
+        * baseline: The results of an earlier run, as saved by save_baseline
+        * tolerance: The fraction of the baseline speed a benchmark may lose before it counts as a regression
+
+    Returns:
+        The names of the benchmarks that regressed
+
+    """
+    out = out or sys.stdout
+    regressions = []
+    out.write("\n{:<56} {:>12} {:>12} {:>8}\n".format("benchmark", "baseline", "now", "ratio"))
+    for name, ops in ops_per_sec.items():
+        if name not in baseline["ops_per_sec"]:
+            out.write("{:<56} {:>12} {:>12.1f}\n".format(name, "-", ops))
+            continue
+        before = baseline["ops_per_sec"][name]
+        ratio = ops / before
+        regressed = ratio < 1 - tolerance
+        if regressed:
+            regressions.append(name)
+        out.write("{:<56} {:>12.1f} {:>12.1f} {:>8.2f}{}\n".format(name, before, ops, ratio, "  REGRESSION" if regressed else ""))
+    out.write("{} of {} benchmarks regressed by more than {:.0%}\n".format(len(regressions), len(ops_per_sec), tolerance))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m gamelib.bench", description="Benchmarks gamelib hot paths")
+    parser.add_argument("--filter", help="only run the benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=3, help="the number of repeats of each benchmark, the fastest is kept")
+    parser.add_argument("--recording", help="a game recorded with GameRecorder to take more boards from")
+    parser.add_argument("--save", metavar="FILE", help="save the results as a baseline json file")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a baseline saved with --save")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="the slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = BenchResults(args.repeat, args.filter)
+    boards = fixture_boards(GameRecording(args.recording) if args.recording else None)
+    bench_parse(results)
+    bench_boards(results, boards)
+    bench_fork(results)
+    bench_simulate(results)
+    bench_dispatch(results)
+    if args.save:
+        save_baseline(args.save, results.ops_per_sec)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if compare(results.ops_per_sec, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .game_map import ARENA_SIZE, ARENA_BOUNDS
+
+EMPTY = -1
+
+class BoardArrays:
+    """A NumPy view of a GameMap for vectorized board-wide queries. Requires numpy.
+
+    Arrays are indexed [x, y] like game_map[x, y]. The per cell layers describe the
+    stationary unit on each location, since at most one firewall can occupy a location.
+    Information units are counted per player instead.
+    The view registers itself as a GameMap listener and stays in sync with
+    add_unit, remove_unit and item assignment. Changes made directly to GameUnit attributes are not seen.
+
+    Attributes:
+        * unit_type (int8 array): The type index of the firewall on each location, EMPTY (-1) if there is none
+        * owner (int8 array): The player index owning the firewall on each location, EMPTY (-1) if there is none
+        * stability (float32 array): The stability of the firewall on each location, 0 if there is none
+        * pending_removal (bool array): True for firewalls that are flagged for removal
+        * information_count (int16 array): Shape (2, 28, 28), the number of information units each player has on each location
+        * in_bounds (bool array): True for locations on the diamond shaped board
+
+    """
+    def __init__(self, game_map, parsed_units=None):
+        """Builds the arrays
+
+        Args:
+            * game_map: The GameMap to mirror
+            * parsed_units: The [p1Units, p2Units] lists from a turn string. If given the arrays are filled from them
+              directly, which must describe exactly the units on game_map.
+
+        """
+        if np is None:
+            raise ImportError("BoardArrays requires numpy, which is not installed")
+        self.game_map = game_map
+        self.type_index = {unit_information["shorthand"]: index for index, unit_information in enumerate(game_map.config["unitInformation"])}
+        self.in_bounds = np.array(ARENA_BOUNDS, dtype=bool)
+        self.unit_type = np.full((ARENA_SIZE, ARENA_SIZE), EMPTY, dtype=np.int8)
+        self.owner = np.full((ARENA_SIZE, ARENA_SIZE), EMPTY, dtype=np.int8)
+        self.stability = np.zeros((ARENA_SIZE, ARENA_SIZE), dtype=np.float32)
+        self.pending_removal = np.zeros((ARENA_SIZE, ARENA_SIZE), dtype=bool)
+        self.information_count = np.zeros((2, ARENA_SIZE, ARENA_SIZE), dtype=np.int16)
+
+        if parsed_units is not None:
+            self.__fill_from_parsed(parsed_units)
+        else:
+            for location in game_map:
+                for unit in game_map[location]:
+                    self.unit_added(unit)
+        game_map.add_listener(self)
+
+    def __fill_from_parsed(self, parsed_units):
+        remove_index = len(self.type_index) - 1
+        for player_index, units in enumerate(parsed_units):
+            for type_index, unit_list in enumerate(units):
+                if not unit_list:
+                    continue
+                rows = np.array([unit[:3] for unit in unit_list], dtype=np.float64)
+                xs = rows[:, 0].astype(np.intp)
+                ys = rows[:, 1].astype(np.intp)
+                if type_index == remove_index:
+                    self.pending_removal[xs, ys] = self.unit_type[xs, ys] != EMPTY
+                elif type_index < 3:
+                    self.unit_type[xs, ys] = type_index
+                    self.owner[xs, ys] = player_index
+                    self.stability[xs, ys] = rows[:, 2]
+                else:
+                    np.add.at(self.information_count[player_index], (xs, ys), 1)
+
+    def detach(self):
+        """Stops tracking changes to the game map
+        """
+        self.game_map.remove_listener(self)
+
+    def unit_added(self, unit):
+        """GameMap listener callback, mirrors a new unit
+        """
+        x, y = unit.x, unit.y
+        if unit.stationary:
+            self.unit_type[x, y] = self.type_index[unit.unit_type]
+            self.owner[x, y] = unit.player_index
+            self.stability[x, y] = unit.stability
+            self.pending_removal[x, y] = unit.pending_removal
+        elif unit.player_index in (0, 1):
+            self.information_count[unit.player_index, x, y] += 1
+
+    def unit_removed(self, unit):
+        """GameMap listener callback, forgets a removed unit
+        """
+        x, y = unit.x, unit.y
+        if unit.stationary:
+            self.unit_type[x, y] = EMPTY
+            self.owner[x, y] = EMPTY
+            self.stability[x, y] = 0
+            self.pending_removal[x, y] = False
+        elif unit.player_index in (0, 1):
+            self.information_count[unit.player_index, x, y] -= 1
+
+    def region(self, valid_x=None, valid_y=None):
+        """Builds a mask of locations whose coordinates are in the given lists
+
+        Args:
+            * valid_x: A list of x coordinates, or None for any
+            * valid_y: A list of y coordinates, or None for any
+
+        Returns:
+            A boolean array that is True on in bounds locations matching both coordinate lists
+
+        """
+        mask = self.in_bounds.copy()
+        if valid_x is not None:
+            columns = np.zeros(ARENA_SIZE, dtype=bool)
+            columns[list(valid_x)] = True
+            mask &= columns[:, None]
+        if valid_y is not None:
+            rows = np.zeros(ARENA_SIZE, dtype=bool)
+            rows[list(valid_y)] = True
+            mask &= rows[None, :]
+        return mask
+
+    def mask(self, unit_type=None, player_index=None, region=None):
+        """Builds a mask of the locations holding matching firewalls
+
+        Args:
+            * unit_type: A firewall type such as FILTER, or None for any firewall
+            * player_index: The index corresponding to the owning player, or None for either
+            * region: A boolean mask such as one returned by region(), or None for the whole board
+
+        Returns:
+            A boolean array that is True on locations holding a matching firewall
+
+        """
+        if unit_type is None:
+            mask = self.unit_type != EMPTY
+        else:
+            mask = self.unit_type == self.type_index[unit_type]
+        if player_index is not None:
+            mask &= self.owner == player_index
+        if region is not None:
+            mask &= region
+        return mask
+
+    def count(self, unit_type=None, player_index=None, region=None):
+        """Counts matching firewalls, see mask() for the arguments
+
+        Returns:
+            The number of matching firewalls
+
+        """
+        return int(np.count_nonzero(self.mask(unit_type, player_index, region)))
+
+    def stability_sum(self, unit_type=None, player_index=None, region=None):
+        """Sums the stability of matching firewalls, see mask() for the arguments
+
+        Returns:
+            The total stability of matching firewalls
+
+        """
+        return float(self.stability[self.mask(unit_type, player_index, region)].sum())
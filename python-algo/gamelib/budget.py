@@ -0,0 +1,177 @@
+import json
+import threading
+import time
+
+from .util import send_command, debug_write
+
+"""
+The budget of the turn being played, if any. GameState.submit_turn and AlgoCore.submit_default_turn
+send the turn through it so a turn is never sent twice.
+"""
+_active = None
+
+def active_budget():
+    """Gets the TurnBudget of the turn being played
+
+    Returns:
+        The TurnBudget AlgoCore made for the current turn, or None outside of on_turn
+
+    """
+    return _active
+
+class TurnBudget:
+    """Tracks the time left to submit a turn and makes sure a turn is submitted before time runs out
+
+    AlgoCore makes one when each turn arrives and makes it available as self.budget during on_turn.
+    A strategy can register an always valid plan with set_best, keep improving it while remaining() allows,
+    and submit as usual with game_state.submit_turn(). If the deadline passes first, a watchdog thread submits
+    the last registered plan and later submissions are dropped with a warning. The watchdog is only armed once a plan
+    is registered, so a strategy that never calls set_best submits its turn itself, however late.
+
+    Attributes:
+        * start (float): The time.perf_counter() value when the turn arrived
+        * deadline (float): The time.perf_counter() value by which the turn is submitted
+        * submitted (bool): True once the turn has been sent
+        * timed_out (bool): True if the watchdog had to send the turn
+
+    """
+    def __init__(self, seconds, start=None):
+        """Starts the budget
+
+        Args:
+            * seconds: The time available to submit the turn, safety margin included
+            * start: The time.perf_counter() value when the turn arrived, defaults to now
+
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.deadline = self.start + seconds
+        self.submitted = False
+        self.timed_out = False
+        self.__best = None
+        self.__lock = threading.Lock()
+        self.__watchdog = None
+        self.__watching = False
+
+    def remaining(self):
+        """The time left before the deadline
+
+        Returns:
+            The number of seconds left, negative once the deadline has passed
+
+        """
+        return self.deadline - time.perf_counter()
+
+    def elapsed(self):
+        """The time since the turn arrived
+
+        Returns:
+            The number of seconds since the turn arrived
+
+        """
+        return time.perf_counter() - self.start
+
+    def expired(self):
+        """Checks if the deadline has passed
+
+        Returns:
+            True if the deadline has passed
+
+        """
+        return time.perf_counter() >= self.deadline
+
+    def set_best(self, game_state):
+        """Registers the plan the watchdog submits if time runs out
+
+        The build and deploy stacks of game_state are copied, so game_state can keep changing afterwards.
+        A fork (see GameState.fork) is a convenient way to refine a plan without touching the registered one.
+
+        Args:
+            * game_state: The GameState holding the best plan found so far
+
+        """
+        with self.__lock:
+            self.__best = (list(game_state._build_stack), list(game_state._deploy_stack))
+            if self.__watching and self.__watchdog is None:
+                self.__arm()
+
+    def submit(self, build_stack, deploy_stack):
+        """Sends a turn, unless one was already sent
+
+        Args:
+            * build_stack: The list of (unit_type, x, y) firewall placements and removals
+            * deploy_stack: The list of (unit_type, x, y) information unit deployments
+
+        Returns:
+            True if this call sent the turn
+
+        """
+        with self.__lock:
+            if self.submitted:
+                if self.timed_out:
+                    debug_write("Turn submitted {:.3f}s after the deadline, the best plan registered in time was sent instead".format(-self.remaining()))
+                return False
+            self.__send(build_stack, deploy_stack)
+        return True
+
+    def submit_best(self):
+        """Sends the registered plan, unless there is none or a turn was already sent
+
+        Returns:
+            True if this call sent the turn
+
+        """
+        with self.__lock:
+            if self.submitted or self.__best is None:
+                return False
+            self.__send(*self.__best)
+        return True
+
+    def __send(self, build_stack, deploy_stack):
+        send_command(json.dumps(build_stack))
+        send_command(json.dumps(deploy_stack))
+        self.submitted = True
+
+    def has_best(self):
+        """Checks if a plan was registered with set_best
+
+        Returns:
+            True if a plan was registered
+
+        """
+        return self.__best is not None
+
+    def start_watchdog(self):
+        """Makes this the active budget, and starts the thread that submits the best plan at the deadline
+        as soon as a plan is registered with set_best
+        """
+        global _active
+        _active = self
+        with self.__lock:
+            self.__watching = True
+            if self.__best is not None:
+                self.__arm()
+
+    def stop_watchdog(self):
+        """Stops the watchdog, and stops this being the active budget
+        """
+        global _active
+        with self.__lock:
+            self.__watching = False
+            if self.__watchdog is not None:
+                self.__watchdog.cancel()
+                self.__watchdog = None
+        if _active is self:
+            _active = None
+
+    def __arm(self):
+        self.__watchdog = threading.Timer(max(0.0, self.remaining()), self.__on_deadline)
+        self.__watchdog.daemon = True
+        self.__watchdog.start()
+
+    def __on_deadline(self):
+        with self.__lock:
+            if self.submitted or self.__best is None:
+                return
+            self.timed_out = True
+            self.__send(*self.__best)
+        debug_write("Turn time ran out after {:.3f}s, submitted the best plan so far".format(self.elapsed()))
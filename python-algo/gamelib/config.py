@@ -0,0 +1,27 @@
+"""
+The default game config, used where no config was received from the game, such as by the local engine, the
+tournament runner and the benchmarks. It matches the config the game sends at the start of a match.
+"""
+
+DEFAULT_CONFIG = {
+    "unitInformation": [
+        {"damage": 0.0, "cost": 1, "getHitRadius": 0.51, "display": "Filter", "range": 3.0, "shorthand": "FF", "stability": 60.0},
+        {"damage": 0.0, "cost": 4, "getHitRadius": 0.51, "shieldAmount": 10.0, "display": "Encryptor", "range": 3.0, "shorthand": "EF", "stability": 30.0},
+        {"damage": 4.0, "cost": 3, "getHitRadius": 0.51, "display": "Destructor", "range": 3.0, "shorthand": "DF", "stability": 75.0},
+        {"damageI": 1.0, "damageToPlayer": 1.0, "cost": 1.0, "getHitRadius": 0.51, "damageF": 1.0, "display": "Ping", "range": 3.0, "shorthand": "PI", "stability": 15.0, "speed": 0.5},
+        {"damageI": 3.0, "damageToPlayer": 1.0, "cost": 3.0, "getHitRadius": 0.51, "damageF": 3.0, "display": "EMP", "range": 5.0, "shorthand": "EI", "stability": 5.0, "speed": 0.25},
+        {"damageI": 10.0, "damageToPlayer": 1.0, "cost": 1.0, "getHitRadius": 0.51, "damageF": 0.0, "display": "Scrambler", "range": 3.0, "shorthand": "SI", "stability": 40.0, "speed": 0.25},
+        {"display": "Remove", "shorthand": "RM"}
+    ],
+    "timingAndReplay": {"waitTimeBotMax": 100000, "waitTimeManual": 1820000, "waitForever": False, "waitTimeBotSoft": 70000, "replaySave": 0, "storeBotTimes": True},
+    "resources": {
+        "turnIntervalForBitCapSchedule": 10, "turnIntervalForBitSchedule": 10, "bitRampBitCapGrowthRate": 5.0, "roundStartBitRamp": 10,
+        "bitGrowthRate": 1.0, "startingHP": 30.0, "maxBits": 999999.0, "bitsPerRound": 5.0, "coresPerRound": 5.0, "coresForPlayerDamage": 1.0,
+        "startingBits": 5.0, "bitDecayPerRound": 0.33333, "startingCores": 25.0
+    },
+    "mechanics": {
+        "basePlayerHealthDamage": 1.0, "damageGrowthBasedOnY": 0.0, "bitsCanStackOnDeployment": True, "destroyOwnUnitRefund": 0.5,
+        "destroyOwnUnitsEnabled": True, "stepsRequiredSelfDestruct": 5, "selfDestructRadius": 1.5, "shieldDecayPerFrame": 0.15,
+        "meleeMultiplier": 0, "destroyOwnUnitDelay": 1, "rerouteMidRound": True, "firewallBuildTime": 0
+    }
+}
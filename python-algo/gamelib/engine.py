@@ -0,0 +1,523 @@
+"""
+A local stand-in for the game engine, to play algos against each other offline. Run from the algo folder with
+
+    python -m gamelib.engine path/to/algo_1 path/to/algo_2 [--games 10] [--config config.json]
+
+Each algo folder holds an algo_strategy.py, which is started as a subprocess and spoken to over its stdin and stdout
+with the same config, turn state, action frame and end of game messages as the hosted engine. Turns are stepped as
+soon as both algos have answered. The action phase is played out with ActionSimulator, so results follow its rules
+rather than matching the hosted engine exactly.
+"""
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+from .config import DEFAULT_CONFIG
+from .game_map import ARENA_SIZE, HALF_ARENA, ARENA_BOUNDS, EDGE_SETS
+from .game_state import GameState
+from .simulator import ActionSimulator, ALIVE, BREACHED, SELF_DESTRUCTED
+
+DEFAULT_MAX_TURNS = 100
+EVENT_TYPES = ["selfDestruct", "breach", "damage", "shield", "move", "spawn", "death", "attack", "melee"]
+# The edges each player deploys information units from, indexed by player index
+DEPLOY_EDGES = (EDGE_SETS[2] | EDGE_SETS[3], EDGE_SETS[0] | EDGE_SETS[1])
+
+# Run in an algo's folder to print whether any AlgoCore subclass visible in its algo_strategy.py overrides on_action_frame
+_FRAME_PROBE = """
+import inspect, sys
+sys.argv = ["algo_strategy.py"]
+import algo_strategy
+from gamelib import AlgoCore
+print(any(inspect.isclass(value) and issubclass(value, AlgoCore) and value.on_action_frame is not AlgoCore.on_action_frame
+          for value in vars(algo_strategy).values()))
+"""
+
+# Maps (algo_dir, modification time of algo_strategy.py) to the answer of subscribes_to_frames
+_subscriptions = {}
+
+def subscribes_to_frames(algo_dir, python=None):
+    """Checks if an algo wants action frames
+
+    An algo can declare it with "actionFrames": true or false in its algo.json. Otherwise algo_strategy.py is imported
+    in a separate python process, and the algo wants frames if any AlgoCore subclass in it overrides on_action_frame,
+    including overrides inherited from a helper module. The starter kit's AlgoStrategy overrides it, so algos built on it
+    are sent frames, and skip the cheaper turn only path, unless their algo.json says otherwise.
+    If the import fails the algo is sent frames.
+
+    Args:
+        * algo_dir: The folder holding algo_strategy.py
+        * python: The python executable to import the algo with, defaults to the current one
+
+    Returns:
+        True if the algo should be sent action frames
+
+    """
+    try:
+        with open(os.path.join(algo_dir, "algo.json")) as file:
+            declared = json.load(file).get("actionFrames")
+        if isinstance(declared, bool):
+            return declared
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        key = (os.path.abspath(algo_dir), os.path.getmtime(os.path.join(algo_dir, "algo_strategy.py")))
+    except OSError:
+        return True
+    if key not in _subscriptions:
+        try:
+            probe = subprocess.run([python or sys.executable, "-c", _FRAME_PROBE], cwd=algo_dir, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, timeout=30)
+            lines = probe.stdout.split()
+            _subscriptions[key] = lines[-1] != "False" if probe.returncode == 0 and lines else True
+        except (OSError, subprocess.SubprocessError):
+            _subscriptions[key] = True
+    return _subscriptions[key]
+
+class AlgoProcess:
+    """An algo running as a subprocess, spoken to over pipes
+
+    A reader thread timestamps every line the algo writes, so the time it took to answer is known even while
+    the engine is busy with the other algo.
+
+    Attributes:
+        * algo_dir (str): The folder holding algo_strategy.py
+        * send_frames (bool): Whether the algo is sent action frames
+        * latencies (list): The seconds the algo took to answer each turn
+        * exited (bool): True once the algo closed its stdout, usually because it crashed
+
+    """
+    def __init__(self, algo_dir, send_frames=None, python=None, stderr=subprocess.DEVNULL):
+        """Starts the algo
+
+        Args:
+            * algo_dir: The folder holding algo_strategy.py
+            * send_frames: Whether to send the algo action frames. None to send them only if it overrides on_action_frame
+            * python: The python executable to run the algo with, defaults to the current one
+            * stderr: Where the algo's debug output goes, discarded by default
+
+        """
+        self.algo_dir = algo_dir
+        self.send_frames = subscribes_to_frames(algo_dir, python) if send_frames is None else send_frames
+        self.latencies = []
+        self.exited = False
+        self.__lines = queue.Queue()
+        self.__process = subprocess.Popen([python or sys.executable, "-u", "algo_strategy.py"], cwd=algo_dir,
+                                          stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+                                          universal_newlines=True, bufsize=1)
+        self.__reader = threading.Thread(target=self.__read, daemon=True)
+        self.__reader.start()
+
+    def __read(self):
+        for line in self.__process.stdout:
+            self.__lines.put((time.perf_counter(), line.strip()))
+        self.__lines.put((time.perf_counter(), None))
+
+    def send(self, message):
+        """Writes a message to the algo's stdin
+
+        Returns:
+            False if the algo has exited
+
+        """
+        try:
+            self.__process.stdin.write(message + "\n")
+            self.__process.stdin.flush()
+            return True
+        except (BrokenPipeError, OSError, ValueError):
+            return False
+
+    def read_turn(self, sent, timeout):
+        """Waits for the build and deploy lines of a turn
+
+        Args:
+            * sent: The time.perf_counter() value when the turn state was sent
+            * timeout: The most seconds to wait
+
+        Returns:
+            The (build, deploy) lists, or None if the algo exited or took longer than timeout
+
+        """
+        deadline = sent + timeout
+        lines = []
+        while len(lines) < 2:
+            try:
+                received, line = self.__lines.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                return None
+            if line is None:
+                self.exited = True
+                return None
+            if not line:
+                continue
+            lines.append(line)
+        self.latencies.append(received - sent)
+        try:
+            return [json.loads(line) for line in lines]
+        except ValueError:
+            return [], []
+
+    def close(self, timeout=5):
+        """Waits for the algo to exit, killing it after timeout seconds
+        """
+        try:
+            self.__process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.__process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.__process.kill()
+            self.__process.wait()
+        self.__reader.join(timeout)
+        self.__process.stdout.close()
+
+class MatchResult:
+    """The outcome of a match. Lists are indexed by player, in the order the algos were given
+
+    Attributes:
+        * winner (int): 0 or 1, or None for a draw
+        * reason (str): "health", "turn limit", "timeout" or "crash"
+        * turns (int): The number of turns played
+        * health (list): Each player's health at the end
+        * latencies (list): For each player, the seconds it took to answer each turn
+
+    """
+    def __init__(self, winner, reason, turns, health, latencies):
+        self.winner = winner
+        self.reason = reason
+        self.turns = turns
+        self.health = health
+        self.latencies = latencies
+
+    def __repr__(self):
+        return "MatchResult(winner={}, reason={}, turns={}, health={})".format(self.winner, self.reason, self.turns, self.health)
+
+class _Firewall:
+    __slots__ = ("type_index", "owner", "stability", "unit_id", "pending_removal")
+
+    def __init__(self, type_index, owner, stability, unit_id):
+        self.type_index = type_index
+        self.owner = owner
+        self.stability = stability
+        self.unit_id = unit_id
+        self.pending_removal = False
+
+class LocalEngine:
+    """Plays one match between two algos
+
+    The board is kept from the first player's point of view, as flat dicts indexed by x * ARENA_SIZE + y.
+    The second player is sent the board rotated so that it too plays from the bottom, as the hosted engine does.
+    Each turn both algos are sent the turn state, their build and deploy lines are applied (firewalls first, invalid
+    or unaffordable placements are skipped), and the action phase is played out with ActionSimulator.
+    Breaches cost the opponent health and earn coresForPlayerDamage cores, firewalls flagged for removal are removed
+    after the action phase with a destroyOwnUnitRefund share of their cost refunded, and resources then grow following
+    config["resources"].
+
+    """
+    def __init__(self, algo_dirs, config=None, max_turns=DEFAULT_MAX_TURNS, send_frames=(None, None), stderr=subprocess.DEVNULL):
+        """Sets up the match, the algos are started by play()
+
+        Args:
+            * algo_dirs: The folders of the two algos
+            * config: The game config, defaults to gamelib.config.DEFAULT_CONFIG
+            * max_turns: The number of turns after which the healthier algo wins
+            * send_frames: For each algo, whether to send it action frames, None to send them only if it overrides on_action_frame
+            * stderr: Where the algos' debug output goes, discarded by default
+
+        """
+        self.algo_dirs = list(algo_dirs)
+        self.config = config or DEFAULT_CONFIG
+        self.max_turns = max_turns
+        self.send_frames = send_frames
+        self.stderr = stderr
+        unit_information = self.config["unitInformation"]
+        self.__shorthands = [info["shorthand"] for info in unit_information]
+        self.__type_index = {shorthand: index for index, shorthand in enumerate(self.__shorthands)}
+        self.__costs = [info.get("cost", 0) for info in unit_information]
+        self.__max_stability = [info.get("stability", 0.0) for info in unit_information]
+        self.__damage_to_player = [info.get("damageToPlayer", 1.0) for info in unit_information]
+        resources = self.config["resources"]
+        self.__resources = resources
+        self.__refund = self.config.get("mechanics", {}).get("destroyOwnUnitRefund", 0.0)
+        self.__time_limit = self.config.get("timingAndReplay", {}).get("waitTimeBotMax", 100000) / 1000
+        self.firewalls = {}
+        self.health = [float(resources["startingHP"])] * 2
+        self.cores = [float(resources["startingCores"])] * 2
+        self.bits = [float(resources["startingBits"])] * 2
+        self.times = [0, 0]
+        self.turn_number = 0
+        self.__next_id = 0
+
+    def __new_id(self):
+        self.__next_id += 1
+        return str(self.__next_id)
+
+    @staticmethod
+    def _view(player_index, x, y):
+        """Converts a location between the board and a player's point of view, the second player's board is rotated"""
+        return (x, y) if player_index == 0 else (ARENA_SIZE - 1 - x, ARENA_SIZE - 1 - y)
+
+    def _units_for(self, viewer, owner, information=()):
+        """Builds the p1Units or p2Units list of a message, for the units of owner as seen by viewer"""
+        units = [[] for _ in self.__shorthands]
+        for index, firewall in self.firewalls.items():
+            if firewall.owner != owner:
+                continue
+            x, y = self._view(viewer, *divmod(index, ARENA_SIZE))
+            units[firewall.type_index].append([x, y, firewall.stability, firewall.unit_id])
+            if firewall.pending_removal:
+                units[-1].append([x, y, 0.0, firewall.unit_id])
+        for type_index, unit_owner, x, y, stability, unit_id in information:
+            if unit_owner == owner:
+                units[type_index].append(list(self._view(viewer, x, y)) + [stability, unit_id])
+        return units
+
+    def _message(self, viewer, turn_info, information=(), events=None):
+        """Builds a turn state, action frame or end of game message as seen by viewer"""
+        stats = [[self.health[player], self.cores[player], self.bits[player], self.times[player]] for player in (viewer, 1 - viewer)]
+        return json.dumps({
+            "p1Units": self._units_for(viewer, viewer, information),
+            "p2Units": self._units_for(viewer, 1 - viewer, information),
+            "turnInfo": turn_info,
+            "p1Stats": stats[0],
+            "p2Stats": stats[1],
+            "events": events or {name: [] for name in EVENT_TYPES}
+        })
+
+    def _apply_builds(self, player_index, builds):
+        """Places the affordable, valid firewalls and removals of a build line
+
+        Returns:
+            The board indices of the firewalls placed
+        """
+        placed = []
+        own_half = range(HALF_ARENA) if player_index == 0 else range(HALF_ARENA, ARENA_SIZE)
+        for entry in builds:
+            try:
+                type_index = self.__type_index[entry[0]]
+                x, y = self._view(player_index, int(entry[1]), int(entry[2]))
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            if not (0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE and ARENA_BOUNDS[x][y]):
+                continue
+            index = x * ARENA_SIZE + y
+            firewall = self.firewalls.get(index)
+            if type_index == len(self.__shorthands) - 1:
+                if firewall is not None and firewall.owner == player_index:
+                    firewall.pending_removal = True
+            elif type_index < 3 and firewall is None and y in own_half and self.__costs[type_index] <= self.cores[player_index]:
+                self.cores[player_index] -= self.__costs[type_index]
+                self.firewalls[index] = _Firewall(type_index, player_index, float(self.__max_stability[type_index]), self.__new_id())
+                placed.append(index)
+        return placed
+
+    def _apply_deploys(self, player_index, deploys):
+        """Pays for the affordable, valid information units of a deploy line
+
+        Returns:
+            A list of (unit_type, [x, y], 1, player_index) spawns on the board, see ActionSimulator.simulate
+        """
+        spawns = []
+        for entry in deploys:
+            try:
+                type_index = self.__type_index[entry[0]]
+                x, y = self._view(player_index, int(entry[1]), int(entry[2]))
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            if not 3 <= type_index < 6 or (x, y) not in DEPLOY_EDGES[player_index] or x * ARENA_SIZE + y in self.firewalls:
+                continue
+            if self.__costs[type_index] <= self.bits[player_index]:
+                self.bits[player_index] -= self.__costs[type_index]
+                spawns.append((entry[0], [x, y], 1, player_index))
+        return spawns
+
+    def _action_phase(self, spawns, placed, algos):
+        """Plays out the action phase, sending frames to the algos that want them, and updates the board"""
+        game_state = GameState(self.config, self._message(0, [0, self.turn_number, -1]))
+        game_state.suppress_warnings(True)
+        simulator = ActionSimulator(game_state, capacity=max(1, len(spawns)))
+        viewers = [player for player, algo in enumerate(algos) if algo.send_frames]
+        unit_ids = [self.__new_id() for _ in spawns]
+        frame_callback = None
+        if viewers:
+            previous = {}
+            spawned = [(self.__type_index[unit_type], player, location[0], location[1], float(self.__max_stability[self.__type_index[unit_type]]), unit_id)
+                       for (unit_type, location, _, player), unit_id in zip(spawns, unit_ids)]
+            events = {name: [] for name in EVENT_TYPES}
+            for index in placed:
+                firewall = self.firewalls[index]
+                events["spawn"].append(([*divmod(index, ARENA_SIZE)], firewall.type_index, firewall.unit_id, firewall.owner))
+            for type_index, player, x, y, stability, unit_id in spawned:
+                events["spawn"].append(([x, y], type_index, unit_id, player))
+                previous[unit_id] = (x, y, stability, ALIVE)
+            previous_firewalls = {index: (firewall.stability, firewall.type_index, firewall.owner, firewall.unit_id) for index, firewall in self.firewalls.items()}
+            self._send_frame(algos, viewers, 0, spawned, events)
+
+            def frame_callback(frame):
+                events = {name: [] for name in EVENT_TYPES}
+                information = []
+                for (type_index, player, x, y, stability, fate), unit_id in zip(simulator.information_units(), unit_ids):
+                    last = previous.get(unit_id)
+                    if last is None or last[3] != ALIVE:
+                        continue
+                    if (x, y) != last[:2]:
+                        events["move"].append(([last[0], last[1]], [x, y], [0, 0], type_index, unit_id, player))
+                    if stability < last[2] and fate != BREACHED:
+                        events["damage"].append(([x, y], last[2] - stability, type_index, unit_id, player))
+                    if fate == BREACHED:
+                        events["breach"].append(([x, y], self.__damage_to_player[type_index], type_index, unit_id, player))
+                    elif fate != ALIVE:
+                        if fate == SELF_DESTRUCTED:
+                            events["selfDestruct"].append(([x, y], [], self.__max_stability[type_index], type_index, unit_id, player))
+                        events["death"].append(([x, y], type_index, unit_id, player, False))
+                    else:
+                        information.append((type_index, player, x, y, stability, unit_id))
+                    previous[unit_id] = (x, y, stability, fate)
+                standing = {x * ARENA_SIZE + y: stability for _, _, x, y, stability in simulator.firewalls()}
+                for index, (stability, type_index, owner, unit_id) in list(previous_firewalls.items()):
+                    location = [*divmod(index, ARENA_SIZE)]
+                    now = standing.get(index, 0.0)
+                    if now < stability:
+                        events["damage"].append((location, stability - now, type_index, unit_id, owner))
+                    if index not in standing:
+                        events["death"].append((location, type_index, unit_id, owner, False))
+                        del previous_firewalls[index]
+                        del self.firewalls[index]
+                    else:
+                        previous_firewalls[index] = (now, type_index, owner, unit_id)
+                        self.firewalls[index].stability = now
+                self._send_frame(algos, viewers, frame, information, events)
+
+        result = simulator.simulate(spawns, frame_callback=frame_callback)
+        standing = {x * ARENA_SIZE + y: stability for _, _, x, y, stability in simulator.firewalls()}
+        for index in list(self.firewalls):
+            if index in standing:
+                self.firewalls[index].stability = standing[index]
+            else:
+                del self.firewalls[index]
+        return result
+
+    def _send_frame(self, algos, viewers, frame, information, events):
+        for viewer in viewers:
+            viewed = {name: [self._view_event(viewer, name, event) for event in entries] for name, entries in events.items()}
+            algos[viewer].send(self._message(viewer, [1, self.turn_number, frame], information, viewed))
+
+    def _view_event(self, viewer, name, event):
+        """Rotates the locations of an event for viewer and numbers its owner 1 for viewer and 2 for the opponent"""
+        event = list(event)
+        # The third location of a move event is unused
+        for position in range(2 if name == "move" else len(event)):
+            value = event[position]
+            if isinstance(value, list) and len(value) == 2:
+                event[position] = list(self._view(viewer, *value))
+        owner_position = 3 if name == "death" else len(event) - 1
+        event[owner_position] = 1 if event[owner_position] == viewer else 2
+        return event
+
+    def _end_of_turn(self, result):
+        """Applies breaches, removals and resource growth after the action phase"""
+        resources = self.__resources
+        for player in range(2):
+            self.health[1 - player] = max(0.0, self.health[1 - player] - result.health_damage[player])
+            self.cores[player] += result.health_damage[player] * resources.get("coresForPlayerDamage", 0.0)
+        for index, firewall in list(self.firewalls.items()):
+            if firewall.pending_removal:
+                self.cores[firewall.owner] += self.__costs[firewall.type_index] * self.__refund
+                del self.firewalls[index]
+        self.turn_number += 1
+        for player in range(2):
+            self.cores[player] += resources["coresPerRound"]
+            bits = self.bits[player] * (1 - resources["bitDecayPerRound"])
+            bits += resources["bitsPerRound"] + self.turn_number // resources["turnIntervalForBitSchedule"]
+            self.bits[player] = min(round(bits, 1), resources.get("maxBits", bits))
+
+    def _winner(self):
+        if self.health[0] == self.health[1]:
+            return None
+        return 0 if self.health[0] > self.health[1] else 1
+
+    def play(self):
+        """Starts both algos and plays the match to the end
+
+        Returns:
+            A MatchResult
+
+        """
+        algos = [AlgoProcess(algo_dir, send_frames, stderr=self.stderr) for algo_dir, send_frames in zip(self.algo_dirs, self.send_frames)]
+        winner, reason = None, "turn limit"
+        try:
+            config_string = json.dumps(self.config)
+            for algo in algos:
+                algo.send(config_string)
+            while self.turn_number < self.max_turns:
+                sent = []
+                for player, algo in enumerate(algos):
+                    algo.send(self._message(player, [0, self.turn_number, -1]))
+                    sent.append(time.perf_counter())
+                answers = [algo.read_turn(start, self.__time_limit) for algo, start in zip(algos, sent)]
+                failed = [answer is None for answer in answers]
+                if any(failed):
+                    winner = None if all(failed) else failed.index(False)
+                    reason = "crash" if any(algo.exited for algo in algos) else "timeout"
+                    break
+                for player, algo in enumerate(algos):
+                    self.times[player] = int(algo.latencies[-1] * 1000)
+                placed = []
+                for player, (builds, _) in enumerate(answers):
+                    placed.extend(self._apply_builds(player, builds))
+                spawns = []
+                for player, (_, deploys) in enumerate(answers):
+                    spawns.extend(self._apply_deploys(player, deploys))
+                result = self._action_phase(spawns, placed, algos)
+                self._end_of_turn(result)
+                if min(self.health) <= 0:
+                    winner, reason = self._winner(), "health"
+                    break
+            else:
+                winner = self._winner()
+            for player, algo in enumerate(algos):
+                algo.send(self._message(player, [2, self.turn_number, -1]))
+        finally:
+            for algo in algos:
+                algo.close()
+        return MatchResult(winner, reason, self.turn_number, list(self.health), [algo.latencies for algo in algos])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m gamelib.engine", description="Plays algos against each other locally")
+    parser.add_argument("algos", nargs=2, help="the folders holding each algo's algo_strategy.py")
+    parser.add_argument("--games", type=int, default=1, help="the number of matches to play, alternating sides")
+    parser.add_argument("--config", help="a game config json file, defaults to gamelib.config.DEFAULT_CONFIG")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="the turn after which the healthier algo wins")
+    parser.add_argument("--frames", choices=["auto", "always", "never"], default="auto",
+                        help="send action frames only to algos overriding on_action_frame, to all, or to none")
+    parser.add_argument("--debug", action="store_true", help="show the algos' debug output")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.config:
+        with open(args.config) as file:
+            config = json.load(file)
+    send_frames = {"auto": None, "always": True, "never": False}[args.frames]
+    wins = [0, 0]
+    for game in range(args.games):
+        # Alternate which algo plays first so neither keeps the same side
+        order = [0, 1] if game % 2 == 0 else [1, 0]
+        engine = LocalEngine([args.algos[index] for index in order], config, args.max_turns, (send_frames, send_frames),
+                             stderr=None if args.debug else subprocess.DEVNULL)
+        start = time.perf_counter()
+        result = engine.play()
+        winner = None if result.winner is None else order[result.winner]
+        if winner is not None:
+            wins[winner] += 1
+        sys.stdout.write("game {}: {} after {} turns ({}), health {}, {:.1f}s\n".format(
+            game + 1, "draw" if winner is None else args.algos[winner], result.turns, result.reason,
+            [result.health[order.index(index)] for index in range(2)], time.perf_counter() - start))
+    sys.stdout.write("{} {} - {} {}\n".format(args.algos[0], wins[0], wins[1], args.algos[1]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+from array import array
+from collections import namedtuple
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from .game_map import ARENA_SIZE
+
+EMPTY = -1
+
+"""
+Records kept by FrameTracker. type_index is the unit's index in the config's unitInformation,
+player_index is 0 for you and 1 for your opponent.
+"""
+Death = namedtuple("Death", ["frame", "x", "y", "type_index", "player_index", "unit_id", "removed_by_owner"])
+Breach = namedtuple("Breach", ["frame", "x", "y", "type_index", "player_index", "unit_id", "damage"])
+
+def _player_index(owner):
+    # Frames number the players 1 for you and 2 for your opponent
+    return 0 if owner == 1 else 1
+
+class FrameTracker:
+    """Follows the board through an action phase by applying the events of each action frame
+
+    Made from the GameState of the turn, it keeps the firewalls in flat arrays indexed by x * ARENA_SIZE + y
+    and the information units in a dict keyed by unit id, and updates both in place with update().
+    Only the events of a frame are read, so a frame costs a fraction of building a GameState from it.
+    Firewalls spawned during the phase, including this turn's builds, are picked up from the spawn events.
+
+    Attributes:
+        * game_state (:obj: GameState): The GameState of the tracked turn
+        * frame (int): The number of the last frame applied, -1 before the first
+        * unit_type (array): The type index of the firewall on each location, EMPTY (-1) if there is none
+        * owner (array): The player index owning the firewall on each location, EMPTY (-1) if there is none
+        * stability (array): The stability of the firewall on each location, 0 if there is none
+        * pending_removal (bytearray): 1 for firewalls that are flagged for removal
+        * information_units (dict): Maps the id of each information unit on the board to a [type_index, player_index, x, y, stability] list
+        * deaths (list): A Death record for every unit that died, in order
+        * breaches (list): A Breach record for every information unit that scored, in order
+
+    """
+    def __init__(self, game_state):
+        """Fills the arrays from the firewalls on the board
+
+        Args:
+            * game_state: The GameState of the turn whose action phase will be tracked
+
+        """
+        self.game_state = game_state
+        unit_information = game_state.config["unitInformation"]
+        self.__max_stability = [info.get("stability", 0.0) for info in unit_information]
+        self.__type_index = {info["shorthand"]: index for index, info in enumerate(unit_information)}
+        self.__remove_index = len(unit_information) - 1
+        self.frame = -1
+        self.unit_type = array('b', [EMPTY]) * (ARENA_SIZE * ARENA_SIZE)
+        self.owner = array('b', [EMPTY]) * (ARENA_SIZE * ARENA_SIZE)
+        self.stability = array('f', [0.0]) * (ARENA_SIZE * ARENA_SIZE)
+        self.pending_removal = bytearray(ARENA_SIZE * ARENA_SIZE)
+        self.information_units = {}
+        self.deaths = []
+        self.breaches = []
+
+        game_map = game_state.game_map
+        for index, stationary in enumerate(game_map.get_stationary_mask()):
+            if not stationary:
+                continue
+            for unit in game_map[divmod(index, ARENA_SIZE)]:
+                if unit.stationary:
+                    self.unit_type[index] = self.__type_index[unit.unit_type]
+                    self.owner[index] = unit.player_index
+                    self.stability[index] = unit.stability
+                    self.pending_removal[index] = unit.pending_removal
+
+    def update(self, frame):
+        """Applies the spawn, death, damage, shield, move and breach events of an action frame
+
+        Args:
+            * frame: The action frame string, or the frame already parsed as json such as the parsed_state
+              passed to AlgoCore.on_action_frame
+
+        """
+        state = loads(frame) if isinstance(frame, (str, bytes)) else frame
+        frame_number = int(state["turnInfo"][2])
+        events = state["events"]
+        units = self.information_units
+        unit_type = self.unit_type
+        stability = self.stability
+
+        for location, type_index, unit_id, owner in (event[:4] for event in events.get("spawn", ())):
+            if type_index == self.__remove_index:
+                self.pending_removal[location[0] * ARENA_SIZE + location[1]] = 1
+            elif type_index < 3:
+                index = location[0] * ARENA_SIZE + location[1]
+                unit_type[index] = type_index
+                self.owner[index] = _player_index(owner)
+                stability[index] = self.__max_stability[type_index]
+                self.pending_removal[index] = 0
+            else:
+                units[unit_id] = [type_index, _player_index(owner), location[0], location[1], self.__max_stability[type_index]]
+
+        for _, target, _, _, unit_id, _ in (event[:6] for event in events.get("move", ())):
+            unit = units.get(unit_id)
+            if unit is not None:
+                unit[2], unit[3] = target[0], target[1]
+
+        for _, _, amount, _, _, target_id in (event[:6] for event in events.get("shield", ())):
+            unit = units.get(target_id)
+            if unit is not None:
+                unit[4] += amount
+
+        for location, damage, type_index, unit_id in (event[:4] for event in events.get("damage", ())):
+            if type_index < 3:
+                stability[location[0] * ARENA_SIZE + location[1]] -= damage
+            else:
+                unit = units.get(unit_id)
+                if unit is not None:
+                    unit[4] -= damage
+
+        for location, damage, type_index, unit_id, owner in (event[:5] for event in events.get("breach", ())):
+            self.breaches.append(Breach(frame_number, location[0], location[1], type_index, _player_index(owner), unit_id, damage))
+
+        for event in events.get("death", ()):
+            location, type_index, unit_id, owner = event[:4]
+            removed_by_owner = bool(event[4]) if len(event) > 4 else False
+            if type_index < 3:
+                index = location[0] * ARENA_SIZE + location[1]
+                unit_type[index] = EMPTY
+                self.owner[index] = EMPTY
+                stability[index] = 0.0
+                self.pending_removal[index] = 0
+            else:
+                units.pop(unit_id, None)
+            self.deaths.append(Death(frame_number, location[0], location[1], type_index, _player_index(owner), unit_id, removed_by_owner))
+
+        self.frame = frame_number
+
+    def death_locations(self, unit_type=None, player_index=None, include_removed=False):
+        """Finds where units died during the frames applied so far, such as where your pings died
+
+        Args:
+            * unit_type: The type of unit, such as PING, or None for any
+            * player_index: The index corresponding to the player owning the units, or None for either
+            * include_removed: Whether to include firewalls removed by their owner
+
+        Returns:
+            A list of [x, y] locations, one per death, in the order the units died
+
+        """
+        type_index = None if unit_type is None else self.__type_index[unit_type]
+        return [[death.x, death.y] for death in self.deaths
+                if (type_index is None or death.type_index == type_index)
+                and (player_index is None or death.player_index == player_index)
+                and (include_removed or not death.removed_by_owner)]
+
+    def destroyed_firewalls(self, player_index=None):
+        """Finds the firewalls destroyed during the frames applied so far, leaving out those removed by their owner
+
+        Args:
+            * player_index: The index corresponding to the player owning the firewalls, or None for either
+
+        Returns:
+            A list of Death records
+
+        """
+        return [death for death in self.deaths
+                if death.type_index < 3 and not death.removed_by_owner
+                and (player_index is None or death.player_index == player_index)]
+
+    def predict_game_state(self):
+        """Predicts the board at the start of the next turn from the frames applied so far
+
+        The firewalls are those standing after the last applied frame, with their current stability, less the ones flagged
+        for removal. Information units are left out since none survive the action phase. Resources, health and
+        the turn number are those of the tracked turn.
+
+        Returns:
+            A fork of the tracked GameState holding the predicted board, see GameState.fork
+
+        """
+        prediction = self.game_state.fork()
+        game_map = prediction.game_map
+        stationary = game_map.get_stationary_mask()
+        shorthands = [info["shorthand"] for info in self.game_state.config["unitInformation"]]
+        for index in range(ARENA_SIZE * ARENA_SIZE):
+            type_index = self.unit_type[index]
+            standing = type_index != EMPTY and not self.pending_removal[index]
+            if not standing and not stationary[index]:
+                continue
+            location = list(divmod(index, ARENA_SIZE))
+            if stationary[index]:
+                game_map.remove_unit(location)
+            if standing:
+                game_map.add_unit(shorthands[type_index], location, self.owner[index], self.stability[index])
+        return prediction
@@ -1,7 +1,127 @@
 import math
+from array import array
 from .unit import GameUnit
 from .util import debug_write
 
+ARENA_SIZE = 28
+HALF_ARENA = ARENA_SIZE // 2
+
+"""
+Static geometry of the arena. These tables never change so they are built once
+and shared by every GameMap instead of being recomputed on each query.
+"""
+
+def _diamond_contains(x, y):
+    if y < HALF_ARENA:
+        return HALF_ARENA - 1 - y <= x <= HALF_ARENA + y
+    return y - HALF_ARENA <= x <= ARENA_SIZE + HALF_ARENA - 1 - y
+
+def _build_edges():
+    top_right = tuple((HALF_ARENA + num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA))
+    top_left = tuple((HALF_ARENA - 1 - num, ARENA_SIZE - 1 - num) for num in range(HALF_ARENA))
+    bottom_left = tuple((HALF_ARENA - 1 - num, num) for num in range(HALF_ARENA))
+    bottom_right = tuple((HALF_ARENA + num, num) for num in range(HALF_ARENA))
+    return (top_right, top_left, bottom_left, bottom_right)
+
+# ARENA_BOUNDS[x][y] is True if [x, y] is on the diamond shaped board
+ARENA_BOUNDS = tuple(tuple(_diamond_contains(x, y) for y in range(ARENA_SIZE)) for x in range(ARENA_SIZE))
+# Edge locations as (x, y) tuples, indexed by the GameMap edge constants
+EDGE_LOCATIONS = _build_edges()
+EDGE_SETS = tuple(frozenset(edge) for edge in EDGE_LOCATIONS)
+FRIENDLY_EDGE_SET = EDGE_SETS[2] | EDGE_SETS[3]
+
+_RANGE_OFFSETS = {}
+
+def range_offsets(radius):
+    """Gets the (dx, dy) offsets of the locations in range of a location, computing them once per radius
+
+    Args:
+        * radius: The radius of the search area
+
+    Returns:
+        A tuple of offsets in the same order get_locations_in_range visits them
+
+    """
+    offsets = _RANGE_OFFSETS.get(radius)
+    if offsets is None:
+        # The search square spans x - ceil(radius) to x + floor(radius), matching the original int() truncation for locations on the board
+        low = -math.ceil(radius)
+        high = math.floor(radius)
+        offsets = tuple((dx, dy) for dx in range(low, high + 1) for dy in range(low, high + 1)
+                        if math.sqrt(dx ** 2 + dy ** 2) < radius + 0.51)
+        _RANGE_OFFSETS[radius] = offsets
+    return offsets
+
+_THREATENED_INDICES = {}
+
+def threatened_indices(radius):
+    """Gets, for each location, the locations a unit there with the given range can reach, computing them once per radius
+
+    Args:
+        * radius: The range of the unit
+
+    Returns:
+        A tuple indexed by x * ARENA_SIZE + y of tuples of flat location indices. Empty for locations off the board.
+
+    """
+    table = _THREATENED_INDICES.get(radius)
+    if table is None:
+        offsets = range_offsets(radius)
+        table = []
+        for index in range(ARENA_SIZE * ARENA_SIZE):
+            unit_x, unit_y = divmod(index, ARENA_SIZE)
+            if not ARENA_BOUNDS[unit_x][unit_y]:
+                table.append(())
+                continue
+            # A unit threatens every location whose range disk contains it
+            table.append(tuple((unit_x - dx) * ARENA_SIZE + unit_y - dy for dx, dy in offsets
+                               if 0 <= unit_x - dx < ARENA_SIZE and 0 <= unit_y - dy < ARENA_SIZE and ARENA_BOUNDS[unit_x - dx][unit_y - dy]))
+        table = tuple(table)
+        _THREATENED_INDICES[radius] = table
+    return table
+
+# The states of a location's unit list, see GameMap.__cell
+_SHARED = 0
+_OWNED = 1
+_OWNED_UNLOADED = 2
+
+# The kinds of GameMap journal entries, see GameMap.checkpoint
+_CELL = 0
+_ADDED = 1
+_REMOVED = 2
+
+class TurnChanges:
+    """The units that changed between two turns, as found by GameMap.update_parsed_units and GameState.apply
+
+    Each attribute holds one list per player, indexed 0 for you and 1 for your opponent.
+
+    Attributes:
+        * added (list): The GameUnits that are new this turn
+        * removed (list): The GameUnits that are gone this turn, as they were last turn
+        * damaged (list): A (GameUnit, stability lost) tuple for each unit that lost stability
+        * pending_removal (list): The GameUnits newly flagged for removal
+
+    """
+    def __init__(self):
+        self.added = [[], []]
+        self.removed = [[], []]
+        self.damaged = [[], []]
+        self.pending_removal = [[], []]
+
+    def __bool__(self):
+        return any(self.added + self.removed + self.damaged + self.pending_removal)
+
+    def locations(self):
+        """Gets every location where a unit changed, such as to invalidate what was worked out from them
+
+        Returns:
+            A sorted list of [x, y] locations
+
+        """
+        units = [unit for players in (self.added, self.removed, self.pending_removal) for player_units in players for unit in player_units]
+        units += [unit for player_units in self.damaged for unit, _ in player_units]
+        return [list(location) for location in sorted({(unit.x, unit.y) for unit in units})]
+
 class GameMap:
     """Holds data about the current game map and provides functions
     useful for getting information related to the map.
@@ -17,6 +137,18 @@ class GameMap:
         * TOP_LEFT (int): A constant that represents the top left edge
         * BOTTOM_LEFT (int): Hidden challenge! Can you guess what this constant represents???
         * BOTTOM_RIGHT (int): A constant that represents the bottom right edge
+        * stationary_version (int): Incremented whenever add_unit, remove_unit or item assignment changes a stationary unit
+        * unit_version (int): Incremented whenever add_unit, remove_unit or item assignment adds or removes any unit
+
+    The unit lists returned by game_map[x, y] must not be changed directly. Pathfinding, the threat grids and checkpoints
+    only see changes made through add_unit, add_units, remove_unit and item assignment, and
+    GameState.contains_stationary_unit warns when it finds a location changed any other way.
+
+    Changes made through add_unit, add_units, remove_unit and item assignment can be undone with checkpoint and rollback.
+
+    The map also keeps a threat grid for each player, holding how many enemy destructors
+    can attack each location, from which the damage they deal follows. The grids are updated whenever
+    units are added or removed through add_unit, remove_unit or item assignment.
 
     """
     def __init__(self, config):
@@ -28,27 +160,315 @@ class GameMap:
         """
         self.config = config
         self.enable_warnings = True
-        self.ARENA_SIZE = 28
-        self.HALF_ARENA = int(self.ARENA_SIZE / 2)
+        self.ARENA_SIZE = ARENA_SIZE
+        self.HALF_ARENA = HALF_ARENA
         self.TOP_RIGHT = 0
         self.TOP_LEFT = 1
         self.BOTTOM_LEFT = 2
         self.BOTTOM_RIGHT = 3
+        self.stationary_version = 0
+        self.unit_version = 0
+        self.__listeners = []
+        # The undo log of the changes since the oldest open checkpoint, None when there is none
+        self.__journal = None
+        # The journal length at each open checkpoint
+        self.__marks = []
         self.__map = self.__empty_grid()
         self.__start = [13,0]
-    
+        for unit_information in config["unitInformation"]:
+            if "range" in unit_information:
+                range_offsets(unit_information["range"])
+        unit_information = config["unitInformation"]
+        self.__destructor = unit_information[2]["shorthand"]
+        self.__destructor_damage = unit_information[2]["damage"]
+        self.__destructor_range = unit_information[2]["range"]
+        self.__type_shorthands = [info["shorthand"] for info in unit_information]
+        # 1 for each location holding a stationary unit, indexed by x * ARENA_SIZE + y
+        self.__stationary = bytearray(ARENA_SIZE * ARENA_SIZE)
+        # Parsed units that have not been turned into GameUnits yet, see load_parsed_units
+        self.__unloaded = {}
+        # _OWNED for locations with their own unit list, _SHARED for those whose list is shared with a snapshot or
+        # has parsed units, _OWNED_UNLOADED for those with their own list that have stacked units, see __cell
+        self.__owned = bytearray([_OWNED]) * (ARENA_SIZE * ARENA_SIZE)
+        # The locations whose unit list may hold GameUnits this map created, which a snapshot has to copy
+        self.__holding = set()
+        # The locations changed through add_unit, add_units, remove_unit or item assignment, see restore_parsed_units
+        self.__touched = set()
+        # Indexed by the defending player, then by x * ARENA_SIZE + y
+        self.__threat_count = [array('i', bytes(4 * ARENA_SIZE * ARENA_SIZE)) for _ in range(2)]
+        # Parsed destructors whose threat has not been added yet, as (index, player_index)
+        self.__unloaded_threat = []
+
     def __getitem__(self, location):
         if len(location) == 2 and self.in_arena_bounds(location):
             x,y = location
-            return self.__map[x][y]
+            return self.__cell(x, y)
         self._invalid_coordinates(location)
 
     def __setitem__(self, location, val):
         if type(location) == tuple and len(location) == 2 and self.in_arena_bounds(location):
+            cell = self.__cell(location[0], location[1])
+            if self.__journal is not None:
+                self.__journal_cell(location[0], location[1])
+            for unit in cell:
+                self.__unit_removed(unit)
             self.__map[location[0]][location[1]] = val
+            self.__holding.add(location[0] * ARENA_SIZE + location[1])
+            self.__touched.add(location[0] * ARENA_SIZE + location[1])
+            for unit in val:
+                self.__unit_added(unit)
+            self.stationary_version += 1
             return
         self._invalid_coordinates(location)
 
+    def __cell(self, x, y):
+        """Gets the unit list of a location, making it safe to modify first
+        """
+        index = x * ARENA_SIZE + y
+        if self.__owned[index] != _OWNED:
+            self.__own(x, y, index)
+        return self.__map[x][y]
+
+    def __own(self, x, y, index):
+        """Gives a location its own unit list, copying any units shared with a snapshot
+        and creating the GameUnits of any parsed or stacked units there
+        """
+        cell = self.__map[x][y] if self.__owned[index] == _OWNED_UNLOADED else [unit.copy() for unit in self.__map[x][y]]
+        pending = self.__unloaded.pop(index, None)
+        if pending is not None:
+            for unit_type, player_index, stability, pending_removal in pending:
+                unit = GameUnit(unit_type, self.config, player_index, stability, x, y)
+                unit.pending_removal = pending_removal
+                cell.append(unit)
+        self.__map[x][y] = cell
+        self.__owned[index] = _OWNED
+        self.__holding.add(index)
+
+    def snapshot(self):
+        """Makes an independent copy of the map, sharing unchanged data with this one
+
+        This map is left as it was, and GameUnits read from it before the snapshot stay its own.
+        The snapshot copies the GameUnits this map has already created, and shares the parsed units
+        of locations no one has read yet, creating its own GameUnits for them the first time it reads them.
+        The config and the per type unit stats are shared. Listeners are not copied.
+
+        Returns:
+            A new GameMap with the same units
+
+        """
+        clone = GameMap.__new__(GameMap)
+        clone.__dict__.update(self.__dict__)
+        clone.__listeners = []
+        clone.__journal = None
+        clone.__marks = []
+        clone.__map = [column[:] for column in self.__map]
+        # Every list is now shared, other than those holding this map's GameUnits, which stay this map's and are
+        # copied for the snapshot, so neither map changes a list or unit the other can see
+        owned = self.__owned
+        clone_owned = bytearray([_SHARED]) * (ARENA_SIZE * ARENA_SIZE)
+        holding = set()
+        for index in self.__holding:
+            state = owned[index]
+            if state != _SHARED:
+                x, y = divmod(index, ARENA_SIZE)
+                cell = self.__map[x][y]
+                if cell:
+                    clone.__map[x][y] = [unit.copy() for unit in cell]
+                    clone_owned[index] = state
+                    holding.add(index)
+        self.__owned = bytearray(clone_owned)
+        self.__holding = holding
+        clone.__owned = clone_owned
+        clone.__holding = set(holding)
+        clone.__touched = set(self.__touched)
+        clone.__stationary = bytearray(self.__stationary)
+        clone.__unloaded = dict(self.__unloaded)
+        clone.__threat_count = [array('i', counts) for counts in self.__threat_count]
+        clone.__unloaded_threat = list(self.__unloaded_threat)
+        return clone
+
+    def load_parsed_units(self, units, player_index):
+        """Adds the units of one player from a parsed turn string, such as the "p1Units" list.
+
+        Only the stationary mask and a compact record of each unit are filled in here.
+        The GameUnit objects of a location are created the first time that location is accessed
+        with game_map[x, y], so locations a strategy never looks at cost almost nothing.
+        Likewise the destructors' threat is added to the threat grids on the first threat query.
+        Listeners are not notified of loaded units.
+
+        Args:
+            * units: A list with one list of [x, y, stability, ...] entries per unit type, in config order
+            * player_index: The index corresponding to the player controlling the units, 0 for you 1 for the enemy
+
+        """
+        shorthands = self.__type_shorthands
+        remove_index = len(shorthands) - 1
+        unloaded = self.__unloaded
+        stationary = self.__stationary
+        owned = self.__owned
+        destructor = self.__destructor
+        unloaded_threat = self.__unloaded_threat
+        for type_index, unit_list in enumerate(units):
+            if not unit_list:
+                continue
+            unit_type = shorthands[type_index]
+            for unit_info in unit_list:
+                x = int(unit_info[0])
+                y = int(unit_info[1])
+                index = x * ARENA_SIZE + y
+                # This depends on RM always being the last type to be processed
+                if type_index == remove_index:
+                    if stationary[index]:
+                        pending = unloaded.get(index)
+                        if pending is not None:
+                            unloaded[index] = (pending[0][:3] + (True,),) + pending[1:]
+                        else:
+                            self.__cell(x, y)[0].pending_removal = True
+                    continue
+                # Entries are tuples since snapshots share them
+                unloaded[index] = unloaded.get(index, ()) + ((unit_type, player_index, float(unit_info[2]), False),)
+                owned[index] = _SHARED
+                if type_index < 3:
+                    stationary[index] = 1
+                    if unit_type == destructor:
+                        unloaded_threat.append((index, player_index))
+        self.stationary_version += 1
+        self.unit_version += 1
+
+    def update_parsed_units(self, old_units, new_units):
+        """Brings the map from the units of one parsed turn to those of the next, changing only the locations that differ
+
+        GameUnits whose type, owner and location are unchanged are kept, with their stability and pending removal updated.
+        The map must hold exactly old_units, as it does after load_parsed_units. Listeners and the threat grids are told
+        about every unit that is added, removed or updated.
+
+        Args:
+            * old_units: The [p1Units, p2Units] lists of the turn the map holds
+            * new_units: The [p1Units, p2Units] lists of the next turn
+
+        Returns:
+            A TurnChanges
+
+        """
+        changes = TurnChanges()
+        # Most unit lists are equal from one turn to the next, and of the others only a few entries differ
+        changed = set()
+        for old_lists, new_lists in zip(old_units, new_units):
+            for old_list, new_list in zip(old_lists, new_lists):
+                if old_list != new_list:
+                    for unit_info in set(map(tuple, old_list)).symmetric_difference(map(tuple, new_list)):
+                        changed.add(int(unit_info[0]) * ARENA_SIZE + int(unit_info[1]))
+        if not changed:
+            return changes
+        old_records = self.__parsed_records(old_units, changed)
+        new_records = self.__parsed_records(new_units, changed)
+        for index in changed:
+            remaining = new_records.get(index, [])
+            if old_records.get(index, []) == remaining:
+                continue
+            x, y = divmod(index, ARENA_SIZE)
+            cell = []
+            for unit in self.__cell(x, y):
+                record = next((record for record in remaining if record[0] == unit.unit_type and record[1] == unit.player_index), None)
+                if record is None:
+                    self.__unit_removed(unit)
+                    changes.removed[unit.player_index].append(unit)
+                    continue
+                remaining.remove(record)
+                cell.append(unit)
+                _, player_index, stability, pending_removal = record
+                if unit.stability == stability and unit.pending_removal == pending_removal:
+                    continue
+                self.__unit_removed(unit)
+                if stability < unit.stability:
+                    changes.damaged[player_index].append((unit, unit.stability - stability))
+                if pending_removal and not unit.pending_removal:
+                    changes.pending_removal[player_index].append(unit)
+                unit.stability = stability
+                unit.pending_removal = pending_removal
+                self.__unit_added(unit)
+            for unit_type, player_index, stability, pending_removal in remaining:
+                unit = GameUnit(unit_type, self.config, player_index, stability, x, y)
+                unit.pending_removal = pending_removal
+                cell.append(unit)
+                self.__unit_added(unit)
+                changes.added[player_index].append(unit)
+            self.__map[x][y] = cell
+            self.__holding.add(index)
+            self.stationary_version += 1
+        return changes
+
+    def restore_parsed_units(self, parsed_units):
+        """Undoes every change made through add_unit, add_units, remove_unit and item assignment since the map held the given parsed units
+
+        Only the changed locations are restored, so this costs about as much as the changes did and needs no checkpoint.
+        GameUnits matching a parsed unit are kept, and listeners and the threat grids are told about every other unit
+        that is added or removed. Any open checkpoints are closed. The map must have held exactly parsed_units, as it does
+        after load_parsed_units or update_parsed_units.
+
+        Args:
+            * parsed_units: The [p1Units, p2Units] lists the map was loaded or updated with
+
+        """
+        self.__marks = []
+        self.__journal = None
+        touched = self.__touched
+        if not touched:
+            return
+        self.__touched = set()
+        # Removing a parsed destructor takes away threat that must have been added first
+        self.__get_threat_counts(0)
+        records = self.__parsed_records(parsed_units, touched)
+        for index in touched:
+            x, y = divmod(index, ARENA_SIZE)
+            remaining = records.get(index, [])
+            cell = []
+            for unit in self.__cell(x, y):
+                record = [unit.unit_type, unit.player_index, unit.stability, unit.pending_removal]
+                if record in remaining:
+                    remaining.remove(record)
+                    cell.append(unit)
+                else:
+                    self.__unit_removed(unit)
+            for unit_type, player_index, stability, pending_removal in remaining:
+                unit = GameUnit(unit_type, self.config, player_index, stability, x, y)
+                unit.pending_removal = pending_removal
+                cell.append(unit)
+                self.__unit_added(unit)
+            self.__map[x][y] = cell
+        self.stationary_version += 1
+        self.unit_version += 1
+
+    def __parsed_records(self, parsed_units, indices):
+        """Maps each of the given locations holding parsed units to a [unit type, player index, stability, pending removal] list per unit
+        """
+        shorthands = self.__type_shorthands
+        remove_index = len(shorthands) - 1
+        records = {}
+        for player_index, units in enumerate(parsed_units):
+            for type_index, unit_list in enumerate(units):
+                for unit_info in unit_list:
+                    index = int(unit_info[0]) * ARENA_SIZE + int(unit_info[1])
+                    if index not in indices:
+                        continue
+                    if type_index == remove_index:
+                        for record in records.get(index, ()):
+                            if shorthands.index(record[0]) < 3:
+                                record[3] = True
+                    else:
+                        records.setdefault(index, []).append([shorthands[type_index], player_index, float(unit_info[2]), False])
+        return records
+
+    def get_stationary_mask(self):
+        """Gets which locations hold a stationary unit, without creating any GameUnits
+
+        Returns:
+            A bytearray indexed by x * ARENA_SIZE + y holding 1 for each location containing a firewall.
+            It is maintained by the map and must not be modified.
+
+        """
+        return self.__stationary
+
     def __iter__(self):
         self.__start = [13,0]
         return self
@@ -88,19 +508,13 @@ class GameMap:
         
         """
         x, y = location
-        half_board = self.HALF_ARENA
-
-        row_size = y + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        top_half_check = (y < self.HALF_ARENA and x >= startx and x <= endx)
-
-        row_size = (self.ARENA_SIZE - 1 - y) + 1
-        startx = half_board - row_size
-        endx = startx + (2 * row_size) - 1
-        bottom_half_check = (y >= self.HALF_ARENA and x >= startx and x <= endx)
-
-        return bottom_half_check or top_half_check
+        if not (0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE):
+            return False
+        try:
+            return ARENA_BOUNDS[x][y]
+        except TypeError:
+            # Non integer coordinates
+            return _diamond_contains(x, y)
 
     def get_edge_locations(self, quadrant_description):
         """Takes in an edge description and returns a list of locations.
@@ -120,8 +534,7 @@ class GameMap:
             self.warn("Passed invalid quadrant_description '{}'. See the documentation for valid inputs for get_edge_locations.".format(quadrant_description))
             return
 
-        edges = self.get_edges()
-        return edges[quadrant_description]
+        return [list(location) for location in EDGE_LOCATIONS[quadrant_description]]
 
     def get_edges(self):
         """Gets all of the edges and their edge locations
@@ -130,35 +543,32 @@ class GameMap:
             A list with four lists inside of it of locations corresponding to the four edges.
             [0] = top_right, [1] = top_left, [2] = bottom_left, [3] = bottom_right.
         """
-        top_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = self.ARENA_SIZE - 1 - num
-            top_right.append([int(x), int(y)])
-        top_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = self.ARENA_SIZE - 1 - num
-            top_left.append([int(x), int(y)])
-        bottom_left = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA - 1 - num
-            y = num
-            bottom_left.append([int(x), int(y)])
-        bottom_right = []
-        for num in range(0, self.HALF_ARENA):
-            x = self.HALF_ARENA + num
-            y = num
-            bottom_right.append([int(x), int(y)])
-        return [top_right, top_left, bottom_left, bottom_right]
+        return [[list(location) for location in edge] for edge in EDGE_LOCATIONS]
+
+    def is_on_edge(self, location, quadrant_description=None):
+        """Checks if a location is on an edge of the map
+
+        Args:
+            * location: A map location
+            * quadrant_description: A constant corresponding to an edge, or None to check all four edges
+
+        Returns:
+            True if the location is on the given edge
+
+        """
+        location = (location[0], location[1])
+        if quadrant_description is None:
+            return any(location in edge for edge in EDGE_SETS)
+        return location in EDGE_SETS[quadrant_description]
     
-    def add_unit(self, unit_type, location, player_index=0):
+    def add_unit(self, unit_type, location, player_index=0, stability=None):
         """Add a single GameUnit to the map at the given location.
 
         Args:
             * unit_type: The type of the new unit
             * location: The location of the new unit
             * player_index: The index corresponding to the player controlling the new unit, 0 for you 1 for the enemy
+            * stability: The stability of the new unit. Defaults to the unit's max stability.
 
         This function does not affect your turn and only changes the data stored in GameMap. The intended use of this function
         is to allow you to create arbitrary gamestates. Using this function on the GameMap inside game_state can cause your algo to crash.
@@ -169,11 +579,57 @@ class GameMap:
             self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
 
         x, y = location
-        new_unit = GameUnit(unit_type, self.config, player_index, None, location[0], location[1])
+        new_unit = GameUnit(unit_type, self.config, player_index, stability, location[0], location[1])
+        cell = self.__cell(x, y)
+        if self.__journal is not None:
+            self.__journal_cell(x, y)
+        self.__holding.add(x * ARENA_SIZE + y)
+        self.__touched.add(x * ARENA_SIZE + y)
         if not new_unit.stationary:
-            self.__map[x][y].append(new_unit)
+            cell.append(new_unit)
         else:
+            for unit in cell:
+                self.__unit_removed(unit)
             self.__map[x][y] = [new_unit]
+            self.stationary_version += 1
+        self.__unit_added(new_unit)
+
+    def add_units(self, unit_type, location, count, player_index=0):
+        """Add a stack of information units of one type to the map at the given location.
+
+        The stack is kept as one compact entry and its GameUnits are created the first time the location is accessed,
+        like parsed units, so stacking hundreds of units costs about as much as adding one. Firewalls, which cannot stack,
+        and units added while listeners are registered go through add_unit one at a time.
+
+        Args:
+            * unit_type: The type of the new units
+            * location: The location of the new units
+            * count: The number of units to add
+            * player_index: The index corresponding to the player controlling the new units, 0 for you 1 for the enemy
+
+        This function does not affect your turn and only changes the data stored in GameMap, see add_unit.
+        """
+        if count < 1:
+            return
+        if self.__listeners or unit_type in self.__type_shorthands[:3]:
+            for _ in range(count):
+                self.add_unit(unit_type, location, player_index)
+            return
+        if not self.in_arena_bounds(location):
+            self._invalid_coordinates(location)
+        if player_index < 0 or player_index > 1:
+            self.warn("Player index {} is invalid. Player index should be 0 or 1.".format(player_index))
+
+        x, y = location
+        index = x * ARENA_SIZE + y
+        if self.__journal is not None:
+            self.__journal_cell(x, y)
+        # Entries are tuples since snapshots share them, a stability of None is the unit's max stability
+        self.__unloaded[index] = self.__unloaded.get(index, ()) + ((unit_type, player_index, None, False),) * count
+        self.__touched.add(index)
+        if self.__owned[index] == _OWNED:
+            self.__owned[index] = _OWNED_UNLOADED
+        self.unit_version += 1
 
     def remove_unit(self, location):
         """Remove all units on the map in the given location.
@@ -188,8 +644,194 @@ class GameMap:
             self._invalid_coordinates(location)
         
         x, y = location
+        cell = self.__cell(x, y)
+        if self.__journal is not None:
+            self.__journal_cell(x, y)
+        self.__touched.add(x * ARENA_SIZE + y)
+        if any(unit.stationary for unit in cell):
+            self.stationary_version += 1
+        for unit in self.__map[x][y]:
+            self.__unit_removed(unit)
         self.__map[x][y] = []
 
+    def add_listener(self, listener):
+        """Registers an object to be told about every unit added to or removed from the map
+
+        Args:
+            * listener: An object with unit_added(unit) and unit_removed(unit) methods
+
+        Listeners see changes made through add_unit, remove_unit and item assignment.
+        """
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stops notifying a listener registered with add_listener
+        """
+        self.__listeners.remove(listener)
+
+    def checkpoint(self):
+        """Starts recording the changes made to the map so they can be undone with rollback
+
+        Checkpoints nest: rolling back to one undoes every change made after it, including those of
+        checkpoints opened later, and closes them all. Changes are recorded while any checkpoint is open.
+        Snapshots taken meanwhile do not inherit the record.
+
+        Returns:
+            A token to pass to rollback or commit
+
+        """
+        if self.__journal is None:
+            self.__journal = []
+        self.__marks.append(len(self.__journal))
+        return len(self.__marks) - 1
+
+    def rollback(self, token):
+        """Undoes the changes made since a checkpoint, in reverse order, and closes it and any opened after it
+
+        Listeners and the threat grids are told about every undone change. The units restored
+        are the GameUnit objects the map held before the changes.
+
+        Args:
+            * token: The token returned by checkpoint
+
+        """
+        if not 0 <= token < len(self.__marks):
+            self.warn("Rolled back to checkpoint {} which is not open".format(token))
+            return
+        journal = self.__journal
+        mark = self.__marks[token]
+        del self.__marks[token:]
+        # Undoing a change must not record it again
+        self.__journal = None
+        while len(journal) > mark:
+            entry = journal.pop()
+            if entry[0] == _ADDED:
+                self.__unit_removed(entry[1])
+            elif entry[0] == _REMOVED:
+                self.__unit_added(entry[1])
+            else:
+                _, x, y, cell, owned, unloaded = entry
+                index = x * ARENA_SIZE + y
+                self.__map[x][y] = cell
+                self.__owned[index] = owned
+                self.__holding.add(index)
+                if unloaded is None:
+                    self.__unloaded.pop(index, None)
+                else:
+                    self.__unloaded[index] = unloaded
+        self.stationary_version += 1
+        self.unit_version += 1
+        if self.__marks:
+            self.__journal = journal
+
+    def commit(self, token):
+        """Keeps the changes made since a checkpoint and closes it and any opened after it
+
+        The changes stay recorded for the checkpoints opened before it.
+
+        Args:
+            * token: The token returned by checkpoint
+
+        """
+        if not 0 <= token < len(self.__marks):
+            self.warn("Committed checkpoint {} which is not open".format(token))
+            return
+        del self.__marks[token:]
+        if not self.__marks:
+            self.__journal = None
+
+    def __journal_cell(self, x, y):
+        """Records the units of a location before they are changed
+        """
+        index = x * ARENA_SIZE + y
+        self.__journal.append((_CELL, x, y, list(self.__map[x][y]), self.__owned[index], self.__unloaded.get(index)))
+
+    def __unit_added(self, unit):
+        if self.__journal is not None:
+            self.__journal.append((_ADDED, unit))
+        self.unit_version += 1
+        if unit.stationary:
+            self.__stationary[unit.x * ARENA_SIZE + unit.y] = 1
+        self.__track_threat(unit, 1)
+        for listener in self.__listeners:
+            listener.unit_added(unit)
+
+    def __unit_removed(self, unit):
+        if self.__journal is not None:
+            self.__journal.append((_REMOVED, unit))
+        self.unit_version += 1
+        if unit.stationary:
+            self.__stationary[unit.x * ARENA_SIZE + unit.y] = 0
+        self.__track_threat(unit, -1)
+        for listener in self.__listeners:
+            listener.unit_removed(unit)
+
+    def __track_threat(self, unit, sign):
+        """Adds (sign=1) or removes (sign=-1) a unit's contribution to the threat grids
+        """
+        if unit.unit_type != self.__destructor or unit.player_index not in (0, 1):
+            return
+        self.__add_threat(unit.x, unit.y, unit.player_index, unit.range, sign)
+
+    def __add_threat(self, unit_x, unit_y, player_index, radius, sign):
+        if not (0 <= unit_x < ARENA_SIZE and 0 <= unit_y < ARENA_SIZE):
+            return
+        counts = self.__threat_count[1 - player_index]
+        for index in threatened_indices(radius)[unit_x * ARENA_SIZE + unit_y]:
+            counts[index] += sign
+
+    def __get_threat_counts(self, player_index):
+        """Gets the threat counts of the given defending player, first adding the threat of any parsed destructors
+        """
+        if self.__unloaded_threat:
+            table = threatened_indices(self.__destructor_range)
+            for unit_index, owner in self.__unloaded_threat:
+                counts = self.__threat_count[1 - owner]
+                for index in table[unit_index]:
+                    counts[index] += 1
+            self.__unloaded_threat = []
+        return self.__threat_count[player_index]
+
+    def attacker_count_at(self, location, player_index):
+        """Gets the number of destructors threatening a location, read from the threat grid
+
+        Args:
+            * location: The location of a hypothetical defender
+            * player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
+
+        Returns:
+            The number of enemy destructors that can attack a unit of the given player at the given location
+
+        """
+        return self.__get_threat_counts(player_index)[location[0] * ARENA_SIZE + location[1]]
+
+    def damage_at(self, location, player_index):
+        """Gets the damage per attack frame a unit would take at a location, read from the threat grid
+
+        Args:
+            * location: The location of a hypothetical defender
+            * player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
+
+        Returns:
+            The total damage of the enemy destructors that can attack a unit of the given player at the given location
+
+        """
+        return self.__get_threat_counts(player_index)[location[0] * ARENA_SIZE + location[1]] * self.__destructor_damage
+
+    def path_damage(self, path, player_index):
+        """Sums the threat along a path
+
+        Args:
+            * path: A list of locations, such as one returned by GameState.find_path_to_edge
+            * player_index: The index corresponding to the player whose unit walks the path
+
+        Returns:
+            The sum of damage_at over every location on the path
+
+        """
+        counts = self.__get_threat_counts(player_index)
+        return sum(counts[location[0] * ARENA_SIZE + location[1]] for location in path) * self.__destructor_damage
+
     def get_locations_in_range(self, location, radius):
         """Gets locations in a circular area around a location
 
@@ -206,12 +848,24 @@ class GameMap:
         if not self.in_arena_bounds(location):
             self._invalid_coordinates(location)
 
+        x, y = location
+        if not (type(x) == int and type(y) == int):
+            return self.__locations_in_range_slow(location, radius)
+        locations = []
+        # A unit with a given range affects all locations who's centers are within that range + 0.51, see range_offsets
+        for dx, dy in range_offsets(radius):
+            i = x + dx
+            j = y + dy
+            if 0 <= i < ARENA_SIZE and 0 <= j < ARENA_SIZE and ARENA_BOUNDS[i][j]:
+                locations.append([i, j])
+        return locations
+
+    def __locations_in_range_slow(self, location, radius):
         x, y = location
         locations = []
         for i in range(int(x - radius), int(x + radius + 1)):
             for j in range(int(y - radius), int(y + radius + 1)):
                 new_location = [i, j]
-                # A unit with a given range affects all locations who's centers are within that range + 0.51 so we add 0.51 here
                 if self.in_arena_bounds(new_location) and self.distance_between_locations(location, new_location) < radius + 0.51:
                     locations.append(new_location)
         return locations
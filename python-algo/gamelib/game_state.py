@@ -1,14 +1,42 @@
 import math
+import sys
 import json
 
-from .navigation import ShortestPathFinder
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from .navigation import ShortestPathFinder, PathingContext
 from .util import send_command, debug_write
 from .unit import GameUnit
-from .game_map import GameMap
+from .game_map import GameMap, FRIENDLY_EDGE_SET
+from .board_arrays import BoardArrays
+from .budget import active_budget
+from .projection import ResourceProjection, DEFAULT_HORIZON
 
 def is_stationary(unit_type):
     return unit_type in FIREWALL_TYPES
 
+# The shorthands the unit type globals were last set up from
+_unit_types = None
+
+def _set_unit_types(config):
+    """Sets up the unit type globals, such as FILTER and UNIT_TYPE_TO_INDEX, from a config
+
+    They are only rebound when the shorthands change, and each is rebound to a complete object, so a GameState
+    made on another thread, such as by gamelib.speculation, never leaves them half filled for the main thread.
+    """
+    global _unit_types, FILTER, ENCRYPTOR, DESTRUCTOR, PING, EMP, SCRAMBLER, REMOVE, FIREWALL_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
+    shorthands = tuple(unit_information["shorthand"] for unit_information in config["unitInformation"][:7])
+    if shorthands == _unit_types:
+        return
+    FILTER, ENCRYPTOR, DESTRUCTOR, PING, EMP, SCRAMBLER, REMOVE = shorthands
+    UNIT_TYPE_TO_INDEX = {unit_type: index for index, unit_type in enumerate(shorthands)}
+    ALL_UNITS = [PING, EMP, SCRAMBLER, FILTER, ENCRYPTOR, DESTRUCTOR]
+    FIREWALL_TYPES = [FILTER, ENCRYPTOR, DESTRUCTOR]
+    _unit_types = shorthands
+
 class GameState:
     """Represents the entire gamestate for a given turn
     Provides methods related to resources and unit deployment
@@ -34,40 +62,25 @@ class GameState:
         * my_time (int): The time you took to submit your previous turn
         * enemy_health (int): Your opponents current remaining health
         * enemy_time (int): Your opponents current remaining time
+        * board_arrays (:obj: BoardArrays): An optional NumPy view of game_map for vectorized queries, requires numpy
+        * resource_projection (:obj: ResourceProjection): The resource projection of the game, shared by its game states
 
     """
 
-    def __init__(self, config, serialized_string):
+    def __init__(self, config, serialized_string, parsed_state=None):
         """ Setup a turns variables using arguments passed
 
         Args:
             * config (JSON): A json object containing information about the game
             * serialized_string (string): A string containing information about the game state at the start of this turn
+            * parsed_state (JSON): serialized_string already parsed as json, such as the parsed_state passed to AlgoCore.on_turn. Saves parsing it again
 
         """
         self.serialized_string = serialized_string
         self.config = config
         self.enable_warnings = True
 
-        global FILTER, ENCRYPTOR, DESTRUCTOR, PING, EMP, SCRAMBLER, REMOVE, FIREWALL_TYPES, ALL_UNITS, UNIT_TYPE_TO_INDEX
-        UNIT_TYPE_TO_INDEX = {}
-        FILTER = config["unitInformation"][0]["shorthand"]
-        UNIT_TYPE_TO_INDEX[FILTER] = 0
-        ENCRYPTOR = config["unitInformation"][1]["shorthand"]
-        UNIT_TYPE_TO_INDEX[ENCRYPTOR] = 1
-        DESTRUCTOR = config["unitInformation"][2]["shorthand"]
-        UNIT_TYPE_TO_INDEX[DESTRUCTOR] = 2
-        PING = config["unitInformation"][3]["shorthand"]
-        UNIT_TYPE_TO_INDEX[PING] = 3
-        EMP = config["unitInformation"][4]["shorthand"]
-        UNIT_TYPE_TO_INDEX[EMP] = 4
-        SCRAMBLER = config["unitInformation"][5]["shorthand"]
-        UNIT_TYPE_TO_INDEX[SCRAMBLER] = 5
-        REMOVE = config["unitInformation"][6]["shorthand"]
-        UNIT_TYPE_TO_INDEX[REMOVE] = 6
-
-        ALL_UNITS = [PING, EMP, SCRAMBLER, FILTER, ENCRYPTOR, DESTRUCTOR]
-        FIREWALL_TYPES = [FILTER, ENCRYPTOR, DESTRUCTOR]
+        _set_unit_types(config)
 
         self.ARENA_SIZE = 28
         self.HALF_ARENA = int(self.ARENA_SIZE / 2)
@@ -75,21 +88,40 @@ class GameState:
         self.CORES = 1
 
         self.game_map = GameMap(self.config)
+        self.resource_projection = ResourceProjection.for_config(config)
         self._shortest_path_finder = ShortestPathFinder()
+        self._pathing_context = PathingContext(self.game_map)
+        self._board_arrays = None
         self._build_stack = []
         self._deploy_stack = []
+        self._checkpoints = []
         self._player_resources = [
                 {'cores': 0, 'bits': 0},  # player 0, which is you
                 {'cores': 0, 'bits': 0}]  # player 1, which is the opponent
-        self.__parse_state(serialized_string)
+        self.__parse_state(serialized_string if parsed_state is None else parsed_state)
 
     def __parse_state(self, state_line):
         """
         Fills in map based on the serialized game state so that self.game_map[x,y] is a list of GameUnits at that location.
-        state_line is the game state as a json string.
+        state_line is the game state as a json string, or as an already parsed json object.
         """
-        state = json.loads(state_line)
+        state = state_line if isinstance(state_line, dict) else loads(state_line)
+        self.__parse_stats(state)
 
+        p1units = state["p1Units"]
+        p2units = state["p2Units"]
+
+        self.__create_parsed_units(p1units, 0)
+        self.__create_parsed_units(p2units, 1)
+        self._parsed_units = [p1units, p2units]
+        self._parsed_unit_version = self.game_map.unit_version
+        # The map _parsed_units were loaded into, which apply can restore them in
+        self._parsed_map = self.game_map
+
+    def __parse_stats(self, state):
+        """
+        Reads the turn number, health, time and resources of both players from the parsed game state.
+        """
         turn_info = state["turnInfo"]
         self.turn_number = int(turn_info[1])
 
@@ -105,31 +137,149 @@ class GameState:
             {'cores': p1_cores, 'bits': p1_bits},
             {'cores': p2_cores, 'bits': p2_bits}]
 
-        p1units = state["p1Units"]
-        p2units = state["p2Units"]
-
-        self.__create_parsed_units(p1units, 0)
-        self.__create_parsed_units(p2units, 1)
-
     def __create_parsed_units(self, units, player_number):
         """
         Helper function for __parse_state to add units to the map.
+        GameUnits are only created when their location is first accessed, see GameMap.load_parsed_units.
         """
-        typedef = self.config.get("unitInformation")
-        for i, unit_types in enumerate(units):
-            for uinfo in unit_types:
-                unit_type = typedef[i].get("shorthand")
-                sx, sy, shp = uinfo[:3]
-                x, y = map(int, [sx, sy])
-                hp = float(shp)
-                # This depends on RM always being the last type to be processed
-                if unit_type == REMOVE:
-                    # Quick fix will deploy engine fix soon
-                    if self.contains_stationary_unit([x,y]):
-                        self.game_map[x,y][0].pending_removal = True
-                else:
-                    unit = GameUnit(unit_type, self.config, player_number, hp, x, y)
-                    self.game_map[x,y].append(unit)
+        self.game_map.load_parsed_units(units, player_number)
+
+    @property
+    def board_arrays(self):
+        """A BoardArrays NumPy view of game_map, built on first use and kept in sync with it afterwards.
+        Requires numpy.
+
+        """
+        if self._board_arrays is None:
+            if self.game_map.unit_version == self._parsed_unit_version:
+                self._board_arrays = BoardArrays(self.game_map, self._parsed_units)
+            else:
+                self._board_arrays = BoardArrays(self.game_map)
+        return self._board_arrays
+
+    def fork(self):
+        """Makes an independent copy of this game state to try out moves on, without parsing the turn again
+
+        The copy has its own map, see GameMap.snapshot, and its own resources and build and deploy stacks.
+        The config and the per type unit stats are shared. GameUnits read from this game state stay its own,
+        the copy gets copies of them.
+
+        Returns:
+            A new GameState
+
+        """
+        clone = GameState.__new__(GameState)
+        clone.__dict__.update(self.__dict__)
+        clone.game_map = self.game_map.snapshot()
+        clone._shortest_path_finder = ShortestPathFinder()
+        clone._pathing_context = PathingContext(clone.game_map)
+        clone._board_arrays = None
+        clone._build_stack = list(self._build_stack)
+        clone._deploy_stack = list(self._deploy_stack)
+        clone._checkpoints = []
+        clone._parsed_map = clone.game_map
+        clone._player_resources = [dict(resources) for resources in self._player_resources]
+        return clone
+
+    def apply(self, serialized_string, parsed_state=None):
+        """Moves this game state on to a new turn in place, rather than making a new GameState for it
+
+        Only the locations whose units changed since the last turn are touched. GameUnits whose type, owner and location
+        are unchanged are kept, with their stability and pending removal updated, and the path finder, the pathing cache
+        and the BoardArrays view carry over. The plan of the last turn is dropped first, see GameMap.restore_parsed_units,
+        along with any checkpoints still open. If game_map was replaced with another map, the map is built again from
+        the turn instead. The changes reported are the same either way.
+
+            if self.game_state is None:
+                self.game_state = gamelib.GameState(self.config, turn_string)
+            else:
+                changes = self.game_state.apply(turn_string)
+
+        Args:
+            * serialized_string (string): The game state of the new turn
+            * parsed_state (JSON): serialized_string already parsed as json. Saves parsing it again
+
+        Returns:
+            A TurnChanges holding the units added, removed, damaged and flagged for removal since the last turn
+
+        """
+        state = parsed_state if parsed_state is not None else loads(serialized_string)
+        self._checkpoints = []
+        if self.game_map is self._parsed_map:
+            self.game_map.restore_parsed_units(self._parsed_units)
+        else:
+            self.game_map = GameMap(self.config)
+            self.game_map.enable_warnings = self.enable_warnings
+            self.game_map.load_parsed_units(self._parsed_units[0], 0)
+            self.game_map.load_parsed_units(self._parsed_units[1], 1)
+            self._pathing_context = PathingContext(self.game_map)
+            self._board_arrays = None
+            self._parsed_map = self.game_map
+        new_units = [state["p1Units"], state["p2Units"]]
+        changes = self.game_map.update_parsed_units(self._parsed_units, new_units)
+
+        self.serialized_string = serialized_string
+        self.__parse_stats(state)
+        self._build_stack = []
+        self._deploy_stack = []
+        self._parsed_units = new_units
+        self._parsed_unit_version = self.game_map.unit_version
+        return changes
+
+    def checkpoint(self):
+        """Marks the current plan so the spawns and removals made after it can be undone with rollback
+
+        Trying a placement costs only the changes it makes: the map records what each change replaces, see
+        GameMap.checkpoint, and the build and deploy stacks and resources are restored from the mark.
+        Checkpoints nest, so a search can try a placement, try more on top of it and back out of each in turn.
+
+            token = game_state.checkpoint()
+            game_state.attempt_spawn(DESTRUCTOR, location)
+            score = evaluate(game_state)
+            game_state.rollback(token)
+
+        Returns:
+            A token to pass to rollback or commit
+
+        """
+        self._checkpoints.append((self.game_map.checkpoint(), len(self._build_stack), len(self._deploy_stack),
+                                  [dict(resources) for resources in self._player_resources]))
+        return len(self._checkpoints) - 1
+
+    def rollback(self, token):
+        """Undoes every change to the map, the build and deploy stacks and the resources made since a checkpoint,
+        and closes it and any checkpoint opened after it
+
+        Args:
+            * token: The token returned by checkpoint
+
+        """
+        if not 0 <= token < len(self._checkpoints):
+            self.warn("Rolled back to checkpoint {} which is not open".format(token))
+            return
+        map_token, build_length, deploy_length, resources = self._checkpoints[token]
+        del self._checkpoints[token:]
+        self.game_map.rollback(map_token)
+        del self._build_stack[build_length:]
+        del self._deploy_stack[deploy_length:]
+        self._player_resources = resources
+
+    def commit(self, token=None):
+        """Keeps the changes made since a checkpoint and closes it and any checkpoint opened after it
+
+        Once no checkpoint is open, changes are no longer recorded.
+
+        Args:
+            * token: The token returned by checkpoint, the last checkpoint opened if None
+
+        """
+        if token is None:
+            token = len(self._checkpoints) - 1
+        if not 0 <= token < len(self._checkpoints):
+            self.warn("Committed checkpoint {} which is not open".format(token))
+            return
+        self.game_map.commit(self._checkpoints[token][0])
+        del self._checkpoints[token:]
 
     def __resource_required(self, unit_type):
         return self.CORES if is_stationary(unit_type) else self.BITS
@@ -155,8 +305,13 @@ class GameState:
     def submit_turn(self):
         """Submit and end your turn.
         Must be called at the end of your turn or the algo will hang.
+        Nothing is sent if the turn budget's watchdog already submitted a plan for this turn, see TurnBudget.
         
         """
+        budget = active_budget()
+        if budget is not None:
+            budget.submit(self._build_stack, self._deploy_stack)
+            return
         build_string = json.dumps(self._build_stack)
         deploy_string = json.dumps(self._deploy_stack)
         send_command(build_string)
@@ -227,13 +382,56 @@ class GameState:
             self.warn("Invalid current bits ({}). Current bits cannot be negative.".format(current_bits))
 
         bits = self.get_resource(self.BITS, player_index) if not current_bits else current_bits
-        for increment in range(1, turns_in_future + 1):
-            current_turn = self.turn_number + increment
-            bits *= (1 - self.config["resources"]["bitDecayPerRound"])
-            bits_gained = self.config["resources"]["bitsPerRound"] + (current_turn // self.config["resources"]["turnIntervalForBitSchedule"])
-            bits += bits_gained
-            bits = round(bits, 1)
-        return bits
+        return self.resource_projection.bits_at(self.turn_number + turns_in_future, bits, self.turn_number)
+
+    def bits_at(self, turn_number, player_index=0):
+        """Predicts the bits a player will hold at the start of a future turn if they spend none, see ResourceProjection
+
+        Args:
+            * turn_number: The turn, this turn or later
+            * player_index: The index corresponding to the player, 0 for you 1 for the enemy
+
+        Returns:
+            The bits the player will hold, the same as project_future_bits gives
+
+        """
+        return self.resource_projection.bits_at(turn_number, self.get_resource(self.BITS, player_index), self.turn_number)
+
+    def cores_at(self, turn_number, player_index=0):
+        """Predicts the cores a player will hold at the start of a future turn if they spend none,
+        not counting cores earned by damaging the enemy
+
+        Args:
+            * turn_number: The turn, this turn or later
+            * player_index: The index corresponding to the player, 0 for you 1 for the enemy
+
+        Returns:
+            The cores the player will hold
+
+        """
+        return self.resource_projection.cores_at(turn_number, self.get_resource(self.CORES, player_index), self.turn_number)
+
+    def turn_when_affordable(self, unit_type, num=1, player_index=0, max_turns_ahead=DEFAULT_HORIZON):
+        """Predicts the first turn a player can afford a number of units if they spend nothing until then,
+        such as when you can send a wave of pings or when the enemy can next afford an EMP push
+
+        Args:
+            * unit_type: The type of the units
+            * num: The number of units
+            * player_index: The index corresponding to the player, 0 for you 1 for the enemy
+            * max_turns_ahead: How far ahead to look
+
+        Returns:
+            The turn number, this turn if the units are affordable now, or None if they will not be within max_turns_ahead turns
+
+        """
+        if unit_type not in ALL_UNITS:
+            self._invalid_unit(unit_type)
+            return
+        amount = self.type_cost(unit_type) * num
+        if is_stationary(unit_type):
+            return self.resource_projection.first_turn_with_cores(amount, self.get_resource(self.CORES, player_index), self.turn_number, max_turns_ahead)
+        return self.resource_projection.first_turn_with_bits(amount, self.get_resource(self.BITS, player_index), self.turn_number, max_turns_ahead)
 
     def type_cost(self, unit_type):
         """Gets the cost of a unit based on its type
@@ -281,7 +479,7 @@ class GameState:
         stationary = is_stationary(unit_type)
         blocked = self.contains_stationary_unit(location) or (stationary and len(self.game_map[location[0],location[1]]) > 0)
         correct_territory = location[1] < self.HALF_ARENA
-        on_edge = location in (self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT))
+        on_edge = (location[0], location[1]) in FRIENDLY_EDGE_SET
 
         if self.enable_warnings:
             fail_reason = ""
@@ -302,6 +500,8 @@ class GameState:
 
     def attempt_spawn(self, unit_type, locations, num=1):
         """Attempts to spawn new units with the type given in the given locations.
+        Each location is checked once and gets as many of the num units as can be afforded, so a large num such as
+        attempt_spawn(PING, location, 1000) to spend every bit costs about as much as spawning one unit.
 
         Args:
             * unit_type: The type of unit we want to spawn
@@ -321,20 +521,27 @@ class GameState:
       
         if type(locations[0]) == int:
             locations = [locations]
+        stationary = is_stationary(unit_type)
+        cost = self.type_cost(unit_type)
+        resource_type = self.__resource_required(unit_type)
+        stack = self._build_stack if stationary else self._deploy_stack
         spawned_units = 0
         for location in locations:
-            for i in range(num):
-                if self.can_spawn(unit_type, location, 1):
-                    x, y = map(int, location)
-                    cost = self.type_cost(unit_type)
-                    resource_type = self.__resource_required(unit_type)
-                    self.__set_resource(resource_type, 0 - cost)
-                    self.game_map.add_unit(unit_type, location, 0)
-                    if is_stationary(unit_type):
-                        self._build_stack.append((unit_type, x, y))
-                    else:
-                        self._deploy_stack.append((unit_type, x, y))
-                    spawned_units += 1
+            if not self.can_spawn(unit_type, location, 1):
+                continue
+            # A firewall blocks its location and information units stack, so one check tells how many units fit here
+            count = 1 if stationary else min(num, self.number_affordable(unit_type))
+            if count < num:
+                self.warn("Could not spawn {} more {} at location {}.{}".format(
+                    num - count, unit_type, location, " Location is blocked." if stationary else " Not enough resources."))
+            x, y = map(int, location)
+            self.__set_resource(resource_type, 0 - cost * count)
+            if stationary:
+                self.game_map.add_unit(unit_type, location, 0)
+            else:
+                self.game_map.add_units(unit_type, location, count, 0)
+            stack.extend([(unit_type, x, y)] * count)
+            spawned_units += count
         return spawned_units
 
     def attempt_remove(self, locations):
@@ -393,7 +600,37 @@ class GameState:
             target_edge = self.get_target_edge(start_location)
 
         end_points = self.game_map.get_edge_locations(target_edge)
-        return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self)
+        return self._shortest_path_finder.navigate_multiple_endpoints(start_location, end_points, self, self._pathing_context)
+
+    def find_paths_from_all_edges(self, target_edge=None, start_locations=None):
+        """Gets the paths units at many locations would take, sharing one search per target edge
+
+        Scoring every spawn location this way costs about as much as a single find_path_to_edge call.
+
+        Args:
+            * target_edge: The edge the units want to reach. game_map.TOP_LEFT, game_map.BOTTOM_RIGHT, etc. Will auto calculate for each location if None.
+            * start_locations: The locations of hypothetical units. Defaults to every location on our two bottom edges.
+
+        Returns:
+            A list holding the path for each start location, in the same order as start_locations.
+            The path is None for locations that contain a stationary unit.
+
+        """
+        if start_locations is None:
+            start_locations = self.game_map.get_edge_locations(self.game_map.BOTTOM_LEFT) + self.game_map.get_edge_locations(self.game_map.BOTTOM_RIGHT)
+
+        groups = {}
+        for i, location in enumerate(start_locations):
+            edge = self.get_target_edge(location) if target_edge is None else target_edge
+            groups.setdefault(edge, []).append(i)
+
+        paths = [None] * len(start_locations)
+        for edge, indices in groups.items():
+            end_points = self.game_map.get_edge_locations(edge)
+            group_paths = self._shortest_path_finder.navigate_from_many_starts([start_locations[i] for i in indices], end_points, self, self._pathing_context)
+            for i, path in zip(indices, group_paths):
+                paths[i] = path
+        return paths
 
     def contains_stationary_unit(self, location):
         """Check if a location is blocked
@@ -409,10 +646,14 @@ class GameState:
             self.warn('Checked for stationary unit outside of arena bounds')
             return False
         x, y = map(int, location)
+        found = False
         for unit in self.game_map[x,y]:
             if unit.stationary:
-                return unit
-        return False
+                found = unit
+                break
+        if bool(found) != bool(self.game_map.get_stationary_mask()[x * self.ARENA_SIZE + y]):
+            self.warn("The units at {} were changed without GameMap.add_unit or GameMap.remove_unit, pathfinding will not see the change".format([x, y]))
+        return found
 
     def warn(self, message):
         if(self.enable_warnings):
@@ -516,6 +757,10 @@ class GameState:
     def get_attackers(self, location, player_index):
         """Gets the destructors threatening a given location
 
+        Locations no destructor can reach are answered from the map's threat grid without scanning, so destructors
+        must be placed with GameMap.add_unit or item assignment rather than appended to a game_map[x, y] list,
+        see GameMap. A scan that finds a different number of destructors than the grid is warned about.
+
         Args:
             * location: The location of a hypothetical defender
             * player_index: The index corresponding to the defending player, 0 for you 1 for the enemy
@@ -533,12 +778,19 @@ class GameState:
             self.warn("Location {} is not in the arena bounds.".format(location))
 
         attackers = []
+        tracked = player_index in (0, 1) and self.game_map.in_arena_bounds(location)
+        expected = self.game_map.attacker_count_at(location, player_index) if tracked else None
+        if expected == 0:
+            return attackers
         """
         Get locations in the range of DESTRUCTOR units
         """
         possible_locations= self.game_map.get_locations_in_range(location, self.config["unitInformation"][UNIT_TYPE_TO_INDEX[DESTRUCTOR]]["range"])
-        for location in possible_locations:
-            for unit in self.game_map[location]:
+        for possible_location in possible_locations:
+            for unit in self.game_map[possible_location]:
                 if unit.unit_type == DESTRUCTOR and unit.player_index != player_index:
                     attackers.append(unit)
+        if tracked and len(attackers) != expected:
+            self.warn("The destructors near {} were changed without GameMap.add_unit or GameMap.remove_unit, the threat grid counts {} but there are {}".format(
+                location, expected, len(attackers)))
         return attackers
@@ -0,0 +1,224 @@
+import functools
+import sys
+import threading
+from importlib import import_module
+from time import perf_counter
+
+"""
+Counts and times calls to the gamelib entry points a strategy spends its turns in, and any span of strategy code.
+
+Instrumentation is off unless AlgoCore.get_instrumentation_output returns somewhere to write to, or enable() is called.
+While it is off the entry points are the plain methods and span() returns a shared context manager that does nothing,
+so nothing is measured and nothing is written. enable() wraps the methods listed in ENTRY_POINTS in place and
+disable() puts the originals back.
+
+AlgoCore writes one line per turn when on_turn returns, of the form
+
+    turn=12 ms=85.31 other=40.12 find_path_to_edge=34/12.104/1.310 navigate_multiple_endpoints=34/10.794/10.794 ...
+
+ms is the time since the turn arrived and other the part of it spent outside of every entry point and span.
+Each name=calls/total/self entry gives the number of calls, the milliseconds spent in them, and the milliseconds
+left after taking out the entry points and spans they called. Entries are sorted by self time, slowest first.
+Only calls on the thread that enabled instrumentation are counted, so speculation and worker threads are left out.
+"""
+
+"""
+The entry points wrapped while instrumentation is enabled, as (module, class, method, name in the summary)
+"""
+ENTRY_POINTS = [
+    ("game_state", "GameState", "__init__", "parse"),
+    ("game_state", "GameState", "apply", "apply"),
+    ("game_state", "GameState", "fork", "fork"),
+    ("game_state", "GameState", "can_spawn", "can_spawn"),
+    ("game_state", "GameState", "attempt_spawn", "attempt_spawn"),
+    ("game_state", "GameState", "attempt_remove", "attempt_remove"),
+    ("game_state", "GameState", "find_path_to_edge", "find_path_to_edge"),
+    ("game_state", "GameState", "find_paths_from_all_edges", "find_paths_from_all_edges"),
+    ("game_state", "GameState", "get_target", "get_target"),
+    ("game_state", "GameState", "get_attackers", "get_attackers"),
+    ("navigation", "ShortestPathFinder", "navigate_multiple_endpoints", "navigate_multiple_endpoints"),
+    ("navigation", "ShortestPathFinder", "navigate_from_many_starts", "navigate_from_many_starts"),
+    ("simulator", "ActionSimulator", "simulate", "simulate"),
+]
+
+"""
+The enabled Instrumentation, if any
+"""
+_active = None
+_originals = []
+_opened_file = None
+
+def active_instrumentation():
+    """Gets the enabled Instrumentation
+
+    Returns:
+        The Instrumentation enabled with enable(), or None while instrumentation is off
+
+    """
+    return _active
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.counted = threading.get_ident() == self.instrumentation.thread_id
+        if self.counted:
+            self.instrumentation._enter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.counted:
+            self.instrumentation._exit(self.name)
+        return False
+
+def span(name):
+    """Times a block of strategy code as its own entry in the turn summary
+
+        with gamelib.instrument.span("defence"):
+            self.build_defences(game_state)
+
+    Args:
+        * name: The name of the entry, without spaces
+
+    Returns:
+        A context manager, which does nothing while instrumentation is off
+
+    """
+    return _NULL_SPAN if _active is None else _Span(_active, name)
+
+def count(name, amount=1):
+    """Adds to a counter in the turn summary, does nothing while instrumentation is off
+
+    Args:
+        * name: The name of the entry, without spaces
+        * amount: The amount to add
+
+    """
+    if _active is not None and threading.get_ident() == _active.thread_id:
+        _active.count(name, amount)
+
+class Instrumentation:
+    """The counters and timings of the turn being played, see gamelib.instrument
+
+    Attributes:
+        * out (file): Where turn summaries are written
+        * thread_id (int): The thread whose calls are counted
+        * entries (dict): Maps each name to a [calls, total seconds, self seconds] list for the current turn
+
+    """
+    def __init__(self, out):
+        self.out = out
+        self.thread_id = threading.get_ident()
+        self.entries = {}
+        self.__stack = []
+
+    def reset(self):
+        """Clears the counters, AlgoCore calls it when a turn arrives
+        """
+        self.entries = {}
+        self.__stack = []
+
+    def count(self, name, amount=1):
+        """Adds to the calls of an entry without timing anything
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = [0, 0.0, 0.0]
+        entry[0] += amount
+
+    def wrap(self, function, name):
+        """Wraps a function so its calls are counted and timed as the named entry
+        """
+        @functools.wraps(function)
+        def instrumented(*args, **kwargs):
+            if threading.get_ident() != self.thread_id:
+                return function(*args, **kwargs)
+            self._enter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._exit(name)
+        return instrumented
+
+    def _enter(self):
+        self.__stack.append([perf_counter(), 0.0])
+
+    def _exit(self, name):
+        start, children = self.__stack.pop()
+        elapsed = perf_counter() - start
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += elapsed - children
+        if self.__stack:
+            self.__stack[-1][1] += elapsed
+
+    def summary(self, turn_number, seconds):
+        """Formats the counters as one line
+
+        Args:
+            * turn_number: The turn number to report
+            * seconds: The length of the turn
+
+        Returns:
+            The line, without a trailing newline, see gamelib.instrument for its format
+
+        """
+        measured = sum(entry[2] for entry in self.entries.values())
+        parts = ["turn={}".format(turn_number), "ms={:.2f}".format(seconds * 1000), "other={:.2f}".format((seconds - measured) * 1000)]
+        for name, (calls, total, own) in sorted(self.entries.items(), key=lambda item: item[1][2], reverse=True):
+            parts.append("{}={}/{:.3f}/{:.3f}".format(name, calls, total * 1000, own * 1000))
+        return " ".join(parts)
+
+    def write_turn(self, turn_number, seconds):
+        """Writes the summary of a turn to out
+        """
+        self.out.write(self.summary(turn_number, seconds) + "\n")
+        self.out.flush()
+
+def enable(out=None):
+    """Turns instrumentation on for the calling thread, wrapping every entry point in ENTRY_POINTS
+
+    Args:
+        * out: A file object or a file path to append turn summaries to, stderr by default
+
+    Returns:
+        The new Instrumentation
+
+    """
+    global _active, _opened_file
+    disable()
+    if isinstance(out, str):
+        out = _opened_file = open(out, "a")
+    _active = Instrumentation(out or sys.stderr)
+    for module_name, class_name, method_name, name in ENTRY_POINTS:
+        owner = getattr(import_module("." + module_name, __package__), class_name)
+        original = owner.__dict__[method_name]
+        _originals.append((owner, method_name, original))
+        setattr(owner, method_name, _active.wrap(original, name))
+    return _active
+
+def disable():
+    """Turns instrumentation off, putting back the original entry points and closing a file opened by enable
+    """
+    global _active, _opened_file
+    while _originals:
+        owner, method_name, original = _originals.pop()
+        setattr(owner, method_name, original)
+    if _opened_file is not None:
+        _opened_file.close()
+        _opened_file = None
+    _active = None
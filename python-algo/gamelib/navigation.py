@@ -1,24 +1,110 @@
-import heapq
-import math
 import sys
-import queue
+from array import array
+from collections import deque
 from .util import debug_write
+from .game_map import ARENA_SIZE, HALF_ARENA, ARENA_BOUNDS
 
-class Node:
-    """A pathfinding node
+GRID_CELLS = ARENA_SIZE * ARENA_SIZE
+
+"""
+Grid cells are addressed by a flat index, index = x * ARENA_SIZE + y.
+All of the tables below are computed once at import time and shared by every pathfinder.
+"""
+
+def _build_tables():
+    in_bounds = bytearray(GRID_CELLS)
+    for x in range(ARENA_SIZE):
+        for y in range(ARENA_SIZE):
+            if ARENA_BOUNDS[x][y]:
+                in_bounds[x * ARENA_SIZE + y] = 1
+
+    # Neighbors are stored in the same order the engine considers them: up, down, right, left
+    neighbors = []
+    for index in range(GRID_CELLS):
+        x, y = divmod(index, ARENA_SIZE)
+        if not in_bounds[index]:
+            neighbors.append(())
+            continue
+        adjacent = []
+        for nx, ny in ((x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)):
+            if 0 <= nx < ARENA_SIZE and 0 <= ny < ARENA_SIZE and in_bounds[nx * ARENA_SIZE + ny]:
+                adjacent.append(nx * ARENA_SIZE + ny)
+        neighbors.append(tuple(adjacent))
+
+    # Idealness of every cell for each of the four target directions
+    idealness = {}
+    for direction_x in (1, -1):
+        for direction_y in (1, -1):
+            table = array('i', bytes(4 * GRID_CELLS))
+            for index in range(GRID_CELLS):
+                x, y = divmod(index, ARENA_SIZE)
+                table[index] = (28 * y if direction_y == 1 else 28 * (27 - y)) + (x if direction_x == 1 else 27 - x)
+            idealness[(direction_x, direction_y)] = table
+
+    cells = tuple(index for index in range(GRID_CELLS) if in_bounds[index])
+    return bytes(in_bounds), tuple(neighbors), idealness, cells
+
+IN_BOUNDS, NEIGHBORS, IDEALNESS, ARENA_CELLS = _build_tables()
+CELL_X = tuple(index // ARENA_SIZE for index in range(GRID_CELLS))
+CELL_Y = tuple(index % ARENA_SIZE for index in range(GRID_CELLS))
+
+_EMPTY_MASK = bytes(GRID_CELLS)
+_UNREACHED = array('i', [-1]) * GRID_CELLS
+
+class PathingContext:
+    """Caches the blocked cells of a GameMap so many path queries can share one wall scan
+
+    The cache is refreshed from the map's stationary mask the first time it is needed after the map's
+    stationary_version changes, which happens when GameMap.add_unit or GameMap.remove_unit
+    (and therefore GameState.attempt_spawn) changes a stationary unit.
+    Changing game_map[x, y] lists directly is not supported and such units are not tracked,
+    GameState.contains_stationary_unit warns when it sees one. Code that does so anyway must call invalidate()
+    afterwards, which makes the next query scan every location's units.
 
     Attributes:
-        * visited_idealness (bool): Have we visited this node during the idealness search step?
-        * visited_validate (bool): Have we visited this node during the validation step?
-        * blocked (bool): Is there a firewall at this node's location
-        * pathlength: The distance between this node and the target location
+        * game_map (:obj: GameMap): The map the walls are read from
+        * scans (int): The number of wall scans performed, useful for profiling
 
     """
-    def __init__(self):
-        self.visited_idealness = False
-        self.visited_validate = False
-        self.blocked = False
-        self.pathlength = -1
+    def __init__(self, game_map):
+        self.game_map = game_map
+        self.scans = 0
+        self._blocked = bytearray(GRID_CELLS)
+        self._version = None
+        self._full_scan = False
+
+    def invalidate(self):
+        """Forces the next query to rescan every location of the map for walls
+        """
+        self._version = None
+        self._full_scan = True
+
+    def get_blocked(self):
+        """Gets the blocked cells of the map, scanning it only if a stationary unit changed since the last scan
+
+        Returns:
+            A bytearray indexed by x * ARENA_SIZE + y holding 1 for each cell containing a firewall
+
+        """
+        if self._version != self.game_map.stationary_version:
+            self._scan()
+        return self._blocked
+
+    def _scan(self):
+        blocked = self._blocked
+        game_map = self.game_map
+        if self._full_scan:
+            blocked[:] = _EMPTY_MASK
+            for index in ARENA_CELLS:
+                for unit in game_map[CELL_X[index], CELL_Y[index]]:
+                    if unit.stationary:
+                        blocked[index] = 1
+                        break
+            self._full_scan = False
+        else:
+            blocked[:] = game_map.get_stationary_mask()
+        self._version = game_map.stationary_version
+        self.scans += 1
 
 """
 This class helps with pathfinding. We guarantee the results will
@@ -28,37 +114,47 @@ code to maximise time efficiency
 class ShortestPathFinder:
     """Handles pathfinding
 
+    The search state lives in flat preallocated arrays indexed by x * ARENA_SIZE + y,
+    which are reset rather than reallocated between searches.
+
     Attributes:
         * HORIZONTAL (int): A constant representing a horizontal movement
         * VERTICAL (int): A constant representing a vertical movement
 
         * game_state (:obj: GameState): The current gamestate
-        * game_map (:obj: GameMap): The current gamemap
+        * blocked (bytearray): 1 for each cell containing a firewall
+        * pathlength (array): The distance between each cell and the target location, -1 if unreached
 
     """
     def __init__(self):
         self.HORIZONTAL = 1
         self.VERTICAL = 2
         self.initialized = False
+        self.blocked = bytearray(GRID_CELLS)
+        self.pathlength = array('i', _UNREACHED)
+        self._visited = bytearray(GRID_CELLS)
+        self._end_mask = bytearray(GRID_CELLS)
 
     def initialize_map(self, game_state):
         """Initializes the map
 
         Args:
-            * game_state: A GameState object representing the gamestate we want to 
+            * game_state: A GameState object representing the gamestate we want to
         """
-        #Initialize map 
+        #Initialize map
         self.initialized = True
         self.game_state = game_state
-        self.game_map = [[Node() for x in range(self.game_state.ARENA_SIZE)] for y in range(self.game_state.ARENA_SIZE)]
+        self.blocked[:] = _EMPTY_MASK
+        self.pathlength[:] = _UNREACHED
 
-    def navigate_multiple_endpoints(self, start_point, end_points, game_state):
+    def navigate_multiple_endpoints(self, start_point, end_points, game_state, pathing_context=None):
         """Finds the path a unit would take to reach a set of endpoints
 
         Args:
             * start_point: The starting location of the unit
             * end_points: The end points of the unit, should be a list of edge locations
             * game_state: The current game state
+            * pathing_context: A PathingContext for game_state's map. If given its cached walls are used instead of scanning the map.
 
         Returns:
             The path a unit at start_point would take when trying to reach end_points given the current game state.
@@ -68,225 +164,229 @@ class ShortestPathFinder:
         if game_state.contains_stationary_unit(start_point):
             return
 
-        #Initialize map 
+        #Initialize map
         self.initialize_map(game_state)
         #Fill in walls
-        for location in self.game_state.game_map:
-            if self.game_state.contains_stationary_unit(location):
-                self.game_map[location[0]][location[1]].blocked = True
+        if pathing_context is None:
+            pathing_context = PathingContext(game_state.game_map)
+        self.blocked[:] = pathing_context.get_blocked()
         #Do pathfinding
-        ideal_endpoints = self._idealness_search(start_point, end_points)
-        self._validate(ideal_endpoints, end_points)
-        return self._get_path(start_point, end_points)
+        end_indices = self._set_end_points(end_points)
+        direction = self._get_direction_from_endpoints(end_points)
+        start = int(start_point[0]) * ARENA_SIZE + int(start_point[1])
+        ideal_tile = self._idealness_search(start, direction)
+        self._validate(ideal_tile, end_indices)
+        return self._get_path(start_point, start, direction)
+
+    def navigate_from_many_starts(self, start_points, end_points, game_state, pathing_context=None):
+        """Finds the paths units at each of several starting locations would take to reach the same set of endpoints
+
+        A single search outward from the endpoints serves every start that can reach them.
+        Starts walled off from the endpoints share one search per enclosed pocket.
+        The results are identical to calling navigate_multiple_endpoints for each start.
+
+        Args:
+            * start_points: The starting locations of the units
+            * end_points: The end points of the units, should be a list of edge locations
+            * game_state: The current game state
+            * pathing_context: A PathingContext for game_state's map. If given its cached walls are used instead of scanning the map.
+
+        Returns:
+            A list holding the path for each start point, in the same order. The path is None for blocked or invalid start points.
+
+        """
+        self.initialize_map(game_state)
+        if pathing_context is None:
+            pathing_context = PathingContext(game_state.game_map)
+        blocked = self.blocked
+        blocked[:] = pathing_context.get_blocked()
+        pathlength = self.pathlength
+
+        end_indices = self._set_end_points(end_points)
+        direction = self._get_direction_from_endpoints(end_points)
+        paths = [None] * len(start_points)
+        starts = []
+        for i, start_point in enumerate(start_points):
+            x, y = map(int, start_point)
+            if 0 <= x < ARENA_SIZE and 0 <= y < ARENA_SIZE and IN_BOUNDS[x * ARENA_SIZE + y] and not blocked[x * ARENA_SIZE + y]:
+                starts.append((i, x * ARENA_SIZE + y))
+
+        #Every start that can reach an endpoint paths along the distance field of the endpoints
+        self._validate(end_indices[0], end_indices)
+        pending = []
+        for i, start in starts:
+            if pathlength[start] == -1:
+                pending.append((i, start))
+            else:
+                paths[i] = self._get_path(start_points[i], start, direction)
+
+        #The rest path to the most ideal tile of their own pocket, which all starts in the pocket share
+        while pending:
+            ideal_tile = self._idealness_search(pending[0][1], direction)
+            self._validate(ideal_tile, end_indices)
+            remaining = []
+            for i, start in pending:
+                if pathlength[start] == -1:
+                    remaining.append((i, start))
+                else:
+                    paths[i] = self._get_path(start_points[i], start, direction)
+            pending = remaining
+
+        return paths
+
+    def _set_end_points(self, end_points):
+        """Marks the endpoints in the endpoint mask
+
+        Returns:
+            The indices of the endpoints, in order
 
-    def _idealness_search(self, start, end_points):
         """
-        Finds the most ideal tile in our 'pocket' of pathable space. 
+        end_mask = self._end_mask
+        end_mask[:] = _EMPTY_MASK
+        end_indices = []
+        for location in end_points:
+            index = location[0] * ARENA_SIZE + location[1]
+            end_mask[index] = 1
+            end_indices.append(index)
+        return end_indices
+
+    def _idealness_search(self, start, direction):
+        """
+        Finds the most ideal tile in our 'pocket' of pathable space.
         The edge if it is available, or the best self destruct location otherwise
         """
-        current = queue.Queue()
-        current.put(start)
-        best_idealness = self._get_idealness(start, end_points)
-        self.game_map[start[0]][start[1]].visited_idealness = True
+        blocked = self.blocked
+        end_mask = self._end_mask
+        idealness = IDEALNESS[direction]
+        visited = self._visited
+        visited[:] = _EMPTY_MASK
+
+        best_idealness = sys.maxsize if end_mask[start] else idealness[start]
         most_ideal = start
+        visited[start] = 1
+        current = deque((start,))
 
-        while not current.empty():
-            search_location = current.get()
-            for neighbor in self._get_neighbors(search_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        while current and best_idealness != sys.maxsize:
+            for neighbor in NEIGHBORS[current.popleft()]:
+                if blocked[neighbor]:
                     continue
 
-                x, y = neighbor
-                current_idealness = self._get_idealness(neighbor, end_points)
-
+                current_idealness = sys.maxsize if end_mask[neighbor] else idealness[neighbor]
                 if current_idealness > best_idealness:
                     best_idealness = current_idealness
                     most_ideal = neighbor
 
-                if not self.game_map[x][y].visited_idealness and not self.game_map[x][y].blocked:
-                    self.game_map[x][y].visited_idealness = True
-                    current.put(neighbor)
+                if not visited[neighbor]:
+                    visited[neighbor] = 1
+                    current.append(neighbor)
 
         return most_ideal
 
-    def _get_neighbors(self, location):
-        """Get the locations adjacent to a location
-        """
-        x, y = location
-        return [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]]
-
     def _get_direction_from_endpoints(self, end_points):
-        """Prints a message to the games debug output
+        """Gets the direction of a set of endpoints
 
         Args:
-            * end_points: A set of endpoints, should be an edge 
+            * end_points: A set of endpoints, should be an edge
 
         Returns:
-            A direction [x,y] representing the edge. For example, [1,1] for the top right and [-1, 1] for the top left
+            A direction (x, y) representing the edge. For example, (1, 1) for the top right and (-1, 1) for the top left
 
         """
-        point = end_points[0]
-        x, y = point
-        direction = [1, 1]
-        if x < self.game_state.HALF_ARENA:
-           direction[0] = -1
-        if y < self.game_state.HALF_ARENA:
-            direction[1] = -1
-        return direction
-
-    def _get_idealness(self, location, end_points):
-        """Get the idealness of a tile, the reachable tile the unit most wants to path to.
-        Better self destruct locations are more ideal. The endpoints are perfectly ideal. 
-
-        Returns:
-            A location the unit will attempt to reach
-        """
-        if location in end_points:
-            return sys.maxsize
-
-        direction = self._get_direction_from_endpoints(end_points)
+        x, y = end_points[0]
+        return (-1 if x < HALF_ARENA else 1, -1 if y < HALF_ARENA else 1)
 
-        idealness = 0
-        if direction[1] == 1:
-            idealness += 28 * location[1]
-        else: 
-            idealness += 28 * (27 - location[1])
-        if direction[0] == 1:
-            idealness += location[0]
-        else: 
-            idealness += (27 - location[0])
-
-        return idealness
-
-    def _validate(self, ideal_tile, end_points):
-        """Breadth first search of the grid, setting the pathlengths of each node
+    def _validate(self, ideal_tile, end_indices):
+        """Breadth first search of the grid, setting the pathlengths of each cell
 
         """
-        #VALDIATION
+        blocked = self.blocked
+        pathlength = self.pathlength
+        pathlength[:] = _UNREACHED
+
         #Add our most ideal tiles to current
-        current = queue.Queue()
-        if ideal_tile in end_points:
-            for location in end_points:
-               current.put(location)
-               #Set current pathlength to 0
-               self.game_map[location[0]][location[1]].pathlength = 0
-               self.game_map[location[0]][location[1]].visited_validate = True
-        else:
-            current.put(ideal_tile)
-            self.game_map[ideal_tile[0]][ideal_tile[1]].pathlength = 0
-            self.game_map[ideal_tile[0]][ideal_tile[1]].visited_validate = True
-
-        #While current is not empty
-        while not current.empty():
-            current_location = current.get()
-            current_node = self.game_map[current_location[0]][current_location[1]]
-            for neighbor in self._get_neighbors(current_location):
-                if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        seeds = end_indices if self._end_mask[ideal_tile] else (ideal_tile,)
+        for index in seeds:
+            pathlength[index] = 0
+        current = deque(seeds)
+
+        while current:
+            index = current.popleft()
+            if blocked[index]:
+                continue
+            next_pathlength = pathlength[index] + 1
+            for neighbor in NEIGHBORS[index]:
+                if blocked[neighbor] or pathlength[neighbor] != -1:
                     continue
+                pathlength[neighbor] = next_pathlength
+                current.append(neighbor)
 
-                neighbor_node = self.game_map[neighbor[0]][neighbor[1]]
-                if not neighbor_node.visited_validate and not current_node.blocked:
-                    neighbor_node.pathlength = current_node.pathlength + 1
-                    neighbor_node.visited_validate = True
-                    current.put(neighbor)
-
-        #debug_write("Print after validate")
-        #self.print_map()
-        return
-
-    def _get_path(self, start_point, end_points):
-        """Once all nodes are validated, and a target is found, the unit can path to its target
+    def _get_path(self, start_point, start, direction):
+        """Once all cells are validated, and a target is found, the unit can path to its target
 
         """
-        #GET THE PATH
+        pathlength = self.pathlength
         path = [start_point]
-        current = start_point
+        current = start
         move_direction = 0
 
-        while not self.game_map[current[0]][current[1]].pathlength == 0:
-            #debug_write("current tile {} has cost {}".format(current, self.game_map[current[0]][current[1]].pathlength))
-            next_move = self._choose_next_move(current, move_direction, end_points)
-            #debug_write(next_move)
-
-            if current[0] == next_move[0]:
+        while not pathlength[current] == 0:
+            next_move = self._choose_next_move(current, move_direction, direction)
+            if CELL_X[current] == CELL_X[next_move]:
                 move_direction = self.VERTICAL
             else:
                 move_direction = self.HORIZONTAL
-            path.append(next_move)
+            path.append([CELL_X[next_move], CELL_Y[next_move]])
             current = next_move
-        
-        #debug_write(path)
+
         return path
-  
-    def _choose_next_move(self, current_point, previous_move_direction, end_points):
-        """Given the current location and adjacent locations, return the best 'next step' for a given unit to take
-        """
-        neighbors = self._get_neighbors(current_point)
-        #debug_write("Unit at {} previously moved {} and has these neighbors {}".format(current_point, previous_move_direction, neighbors))
 
+    def _choose_next_move(self, current_point, previous_move_direction, direction):
+        """Given the current cell and adjacent cells, return the best 'next step' for a given unit to take
+        """
+        blocked = self.blocked
+        pathlength = self.pathlength
         ideal_neighbor = current_point
-        best_pathlength = self.game_map[current_point[0]][current_point[1]].pathlength
-        for neighbor in neighbors:
-            #debug_write("Comparing champ {} and contender {}".format(ideal_neighbor, neighbor))
-            if not self.game_state.game_map.in_arena_bounds(neighbor) or self.game_map[neighbor[0]][neighbor[1]].blocked:
+        best_pathlength = pathlength[current_point]
+        for neighbor in NEIGHBORS[current_point]:
+            if blocked[neighbor]:
                 continue
 
-            new_best = False
-            x, y = neighbor
-            current_pathlength = self.game_map[x][y].pathlength
-
+            current_pathlength = pathlength[neighbor]
             #Filter by pathlength
             if current_pathlength > best_pathlength:
                 continue
-            elif current_pathlength < best_pathlength:
-                #debug_write("Contender has better pathlength at {} vs champs {}".format(current_pathlength, best_pathlength))
-                new_best = True
-
             #Filter by direction based on prev move
-            if not new_best and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, end_points):
+            if current_pathlength == best_pathlength and not self._better_direction(current_point, neighbor, ideal_neighbor, previous_move_direction, direction):
                 continue
 
             ideal_neighbor = neighbor
             best_pathlength = current_pathlength
 
-        #debug_write("Gave unit at {} new tile {}".format(current_point, ideal_neighbor))
         return ideal_neighbor
 
-    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, end_points):
-        """Compare two tiles and return True if the unit would rather move to the new one
+    def _better_direction(self, prev_tile, new_tile, prev_best, previous_move_direction, direction):
+        """Compare two cells and return True if the unit would rather move to the new one
 
         """
         #True if we are moving in a different direction than prev move and prev is not
         #If we previously moved horizontal, and now one of our options has a different x position then the other (the two options are not up/down)
-        if previous_move_direction == self.HORIZONTAL and not new_tile[0] == prev_best[0]:
+        if previous_move_direction == self.HORIZONTAL and not CELL_X[new_tile] == CELL_X[prev_best]:
             #We want to go up now. If we have not changed our y, we are not going up
-            if prev_tile[1] == new_tile[1]:
-                return False 
-            return True
-        if previous_move_direction == self.VERTICAL and not new_tile[1] == prev_best[1]:
-            if prev_tile[0] == new_tile[0]:
-                #debug_write("contender {} has the same x coord as prev tile {} so we will keep best move {}".format(new_tile, prev_tile, prev_best))
-                return False
-            return True
-        if previous_move_direction == 0: 
-            if prev_tile[1] == new_tile[1]: 
-                return False
-            return True
-        
-        #To make it here, both moves are on the same axis 
-        direction = self._get_direction_from_endpoints(end_points)
-        if new_tile[1] == prev_best[1]: #If they both moved horizontal...
-            if direction[0] == 1 and new_tile[0] > prev_best[0]: #If we moved right and right is our direction, we moved towards our direction
-                return True 
-            if direction[0] == -1 and new_tile[0] < prev_best[0]: #If we moved left and left is our direction, we moved towards our direction
-                return True 
-            return False 
-        if new_tile[0] == prev_best[0]: #If they both moved vertical...
-            if direction[1] == 1 and new_tile[1] > prev_best[1]: #If we moved up and up is our direction, we moved towards our direction
-                return True
-            if direction[1] == -1 and new_tile[1] < prev_best[1]: #If we moved down and down is our direction, we moved towards our direction
-                return True
-            return False
+            return not CELL_Y[prev_tile] == CELL_Y[new_tile]
+        if previous_move_direction == self.VERTICAL and not CELL_Y[new_tile] == CELL_Y[prev_best]:
+            return not CELL_X[prev_tile] == CELL_X[new_tile]
+        if previous_move_direction == 0:
+            return not CELL_Y[prev_tile] == CELL_Y[new_tile]
+
+        #To make it here, both moves are on the same axis
+        if CELL_Y[new_tile] == CELL_Y[prev_best]: #If they both moved horizontal...
+            if direction[0] == 1: #If right is our direction, moving right moves towards our direction
+                return CELL_X[new_tile] > CELL_X[prev_best]
+            return CELL_X[new_tile] < CELL_X[prev_best]
+        if CELL_X[new_tile] == CELL_X[prev_best]: #If they both moved vertical...
+            if direction[1] == 1: #If up is our direction, moving up moves towards our direction
+                return CELL_Y[new_tile] > CELL_Y[prev_best]
+            return CELL_Y[new_tile] < CELL_Y[prev_best]
         return True
 
     def print_map(self):
@@ -299,9 +399,9 @@ class ShortestPathFinder:
 
         for y in range(28):
             for x in range(28):
-                node = self.game_map[x][28 - y - 1]
-                if not node.blocked and not node.pathlength == -1:
-                    self._print_justified(node.pathlength)
+                index = x * ARENA_SIZE + 28 - y - 1
+                if not self.blocked[index] and not self.pathlength[index] == -1:
+                    self._print_justified(self.pathlength[index])
                 else:
                     sys.stderr.write("   ")
             debug_write("")
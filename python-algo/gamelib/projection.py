@@ -0,0 +1,159 @@
+import math
+from bisect import bisect_left
+
+"""
+The number of turns a row of bits looks ahead when it is first made, rows are extended when a query looks further
+"""
+DEFAULT_HORIZON = 100
+
+# Rows kept per projection before the oldest are dropped, a game needs a few per turn
+_MAX_ROWS = 4096
+
+class ResourceProjection:
+    """Projects the bits and cores a player will hold on later turns if they spend nothing meanwhile
+
+    One is made per game, see for_config, and shared by every GameState of the game. Bits follow the rules of
+    GameState.project_future_bits exactly: each turn they are multiplied by 1 - bitDecayPerRound, gain bitsPerRound plus
+    one for every turnIntervalForBitSchedule turns played, and are rounded to one decimal. The per turn gains are
+    tabled when the projection is made. Since the rounding makes every turn depend on the one before, bits are kept
+    in rows, one per starting turn and amount of bits, filled in one pass the first time a start is queried.
+    Every later query from the same start, such as asking about many horizons or units for this turn's bits,
+    is a lookup. Cores grow by coresPerRound each turn, which has a closed form.
+
+    Attributes:
+        * bits_per_round (float): bitsPerRound from the config
+        * bit_decay_per_round (float): bitDecayPerRound from the config
+        * turn_interval (int): turnIntervalForBitSchedule from the config
+        * cores_per_round (float): coresPerRound from the config
+
+    """
+    __by_resources = {}
+
+    @classmethod
+    def for_config(cls, config):
+        """Gets the projection of a game, made the first time a config with these resource rules is seen
+
+        Args:
+            * config: The game config
+
+        Returns:
+            A ResourceProjection shared by every config with the same resource rules
+
+        """
+        resources = config["resources"]
+        key = (resources["bitsPerRound"], resources["bitDecayPerRound"], resources["turnIntervalForBitSchedule"], resources.get("coresPerRound", 0.0))
+        projection = cls.__by_resources.get(key)
+        if projection is None:
+            projection = cls.__by_resources[key] = cls(*key)
+        return projection
+
+    def __init__(self, bits_per_round, bit_decay_per_round, turn_interval, cores_per_round=0.0):
+        self.bits_per_round = bits_per_round
+        self.bit_decay_per_round = bit_decay_per_round
+        self.turn_interval = turn_interval
+        self.cores_per_round = cores_per_round
+        self.__kept = 1 - bit_decay_per_round
+        # The bits gained when each turn starts, extended as rows reach later turns
+        self.__gains = []
+        # Maps (start turn, start bits) to the bits held on each following turn and their running maximum
+        self.__rows = {}
+
+    def __gain(self, turn_number):
+        gains = self.__gains
+        while len(gains) <= turn_number:
+            gains.append(self.bits_per_round + (len(gains) // self.turn_interval))
+        return gains[turn_number]
+
+    def __row(self, start_turn, start_bits, turns_ahead):
+        row = self.__rows.get((start_turn, start_bits))
+        if row is None:
+            if len(self.__rows) >= _MAX_ROWS:
+                self.__rows.clear()
+            row = self.__rows[(start_turn, start_bits)] = ([start_bits], [start_bits])
+        bits, best = row
+        if len(bits) <= turns_ahead:
+            self.__gain(start_turn + max(turns_ahead, DEFAULT_HORIZON))
+            gains = self.__gains
+            kept = self.__kept
+            current = bits[-1]
+            most = best[-1]
+            for turn_number in range(start_turn + len(bits), start_turn + max(turns_ahead, DEFAULT_HORIZON) + 1):
+                # The same operations in the same order as project_future_bits, so the floats match exactly
+                current *= kept
+                current += gains[turn_number]
+                current = round(current, 1)
+                bits.append(current)
+                most = max(most, current)
+                best.append(most)
+        return row
+
+    def bits_at(self, turn_number, start_bits, start_turn):
+        """Gets the bits a player will hold at the start of a turn
+
+        Args:
+            * turn_number: The turn to project to, not before start_turn
+            * start_bits: The bits the player holds on start_turn
+            * start_turn: The turn start_bits are held on
+
+        Returns:
+            The bits held on turn_number, as GameState.project_future_bits would give them
+
+        """
+        turns_ahead = max(0, turn_number - start_turn)
+        return self.__row(start_turn, start_bits, turns_ahead)[0][turns_ahead]
+
+    def cores_at(self, turn_number, start_cores, start_turn):
+        """Gets the cores a player will hold at the start of a turn, not counting cores earned by damaging the enemy
+
+        Args:
+            * turn_number: The turn to project to, not before start_turn
+            * start_cores: The cores the player holds on start_turn
+            * start_turn: The turn start_cores are held on
+
+        Returns:
+            The cores held on turn_number
+
+        """
+        return start_cores + self.cores_per_round * max(0, turn_number - start_turn)
+
+    def first_turn_with_bits(self, amount, start_bits, start_turn, max_turns_ahead=DEFAULT_HORIZON):
+        """Finds the first turn on which a player will hold at least some bits
+
+        Args:
+            * amount: The bits needed
+            * start_bits: The bits the player holds on start_turn
+            * start_turn: The turn start_bits are held on
+            * max_turns_ahead: How far ahead to look
+
+        Returns:
+            The turn number, or None if the player will not hold amount bits within max_turns_ahead turns
+
+        """
+        best = self.__row(start_turn, start_bits, max_turns_ahead)[1]
+        turns_ahead = bisect_left(best, amount, 0, max_turns_ahead + 1)
+        return start_turn + turns_ahead if turns_ahead <= max_turns_ahead else None
+
+    def first_turn_with_cores(self, amount, start_cores, start_turn, max_turns_ahead=DEFAULT_HORIZON):
+        """Finds the first turn on which a player will hold at least some cores
+
+        Args:
+            * amount: The cores needed
+            * start_cores: The cores the player holds on start_turn
+            * start_turn: The turn start_cores are held on
+            * max_turns_ahead: How far ahead to look
+
+        Returns:
+            The turn number, or None if the player will not hold amount cores within max_turns_ahead turns
+
+        """
+        if start_cores >= amount:
+            return start_turn
+        if self.cores_per_round <= 0:
+            return None
+        turns_ahead = math.ceil((amount - start_cores) / self.cores_per_round)
+        # Guards against the division rounding across a whole turn
+        if self.cores_at(start_turn + turns_ahead, start_cores, start_turn) < amount:
+            turns_ahead += 1
+        elif turns_ahead > 1 and self.cores_at(start_turn + turns_ahead - 1, start_cores, start_turn) >= amount:
+            turns_ahead -= 1
+        return start_turn + turns_ahead if turns_ahead <= max_turns_ahead else None
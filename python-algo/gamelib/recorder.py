@@ -0,0 +1,235 @@
+import lzma
+import os
+import queue
+import struct
+import threading
+import zlib
+
+from .util import read_turn_info, debug_write, TURN_MESSAGE
+
+"""
+A recording is laid out as
+
+    header      MAGIC followed by one codec byte, b"z" for zlib or b"x" for lzma
+    blocks      one per turn, each a BLOCK_HEADER (turn number, payload length) followed by a payload
+                compressed on its own so any block can be read without the ones before it
+    index       written when the recorder is closed, one BLOCK_HEADER (turn number, block offset) per block,
+                then an INDEX_FOOTER (block count, INDEX_MAGIC)
+
+The config is in block CONFIG_BLOCK. Every other block starts with a turn state and holds the action frames that
+follow it. A payload is a list of lines, each starting with RECEIVED or SENT. Recordings whose recorder did not close,
+for example because the algo crashed, have no index and may have a last block of length 0, which runs to the end of
+the file. GameRecording reads both.
+"""
+MAGIC = b"ALGOREC1"
+INDEX_MAGIC = b"ALGOIDX1"
+BLOCK_HEADER = struct.Struct("<iQ")
+INDEX_FOOTER = struct.Struct("<Q8s")
+CONFIG_BLOCK = -1
+RECEIVED = ">"
+SENT = "<"
+
+_CODECS = {
+    "zlib": (b"z", lambda: zlib.compressobj(6), zlib.decompressobj),
+    "lzma": (b"x", lzma.LZMACompressor, lzma.LZMADecompressor),
+}
+_CODEC_NAMES = {codec[0]: name for name, codec in _CODECS.items()}
+
+class GameRecorder:
+    """Records every line received from the game and every command sent to it to a compressed file
+
+    The algo only hands lines to a queue, a background thread compresses and writes them, so recording does not
+    slow down the turn loop. AlgoCore makes one when get_recording_path returns a path, see AlgoCore.get_recording_path.
+    Read recordings back with GameRecording.
+
+    """
+    def __init__(self, path, codec="zlib"):
+        """Creates the file and starts the writer thread
+
+        Args:
+            * path: The file to record to, replaced if it exists
+            * codec: "zlib", or "lzma" for smaller but slower to write recordings
+
+        """
+        self.path = path
+        self.__codec = _CODECS[codec]
+        self.__queue = queue.SimpleQueue()
+        self.__file = open(path, "wb")
+        self.__file.write(MAGIC + self.__codec[0])
+        self.__index = []
+        self.__compressor = None
+        self.__header_offset = None
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def record_received(self, line):
+        """Records a line received from the game
+
+        Args:
+            * line: The line as returned by get_command
+
+        """
+        self.__queue.put((RECEIVED, line))
+
+    def record_sent(self, command):
+        """Records a command sent to the game
+
+        Args:
+            * command: The command as written to stdout
+
+        """
+        self.__queue.put((SENT, command))
+
+    def close(self):
+        """Writes the lines still queued and the index, then closes the file
+        """
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        try:
+            while True:
+                record = self.__queue.get()
+                if record is None:
+                    break
+                self.__write(*record)
+            self.__end_block()
+            self.__write_index()
+        except Exception as e:
+            debug_write("Recording to {} failed: {}".format(self.path, e))
+        finally:
+            self.__file.close()
+
+    def __write(self, direction, line):
+        if direction == RECEIVED:
+            turn_info = read_turn_info(line)
+            if turn_info is None and self.__compressor is None:
+                self.__start_block(CONFIG_BLOCK)
+            elif turn_info is not None and (turn_info[0] == TURN_MESSAGE or self.__compressor is None):
+                self.__start_block(turn_info[1])
+        elif self.__compressor is None:
+            self.__start_block(CONFIG_BLOCK)
+        self.__file.write(self.__compressor.compress((direction + line.rstrip("\n") + "\n").encode("utf-8")))
+
+    def __start_block(self, turn_number):
+        self.__end_block()
+        self.__header_offset = self.__file.tell()
+        self.__index.append((turn_number, self.__header_offset))
+        self.__file.write(BLOCK_HEADER.pack(turn_number, 0))
+        self.__compressor = self.__codec[1]()
+
+    def __end_block(self):
+        if self.__compressor is None:
+            return
+        self.__file.write(self.__compressor.flush())
+        end = self.__file.tell()
+        self.__file.seek(self.__header_offset)
+        self.__file.write(BLOCK_HEADER.pack(self.__index[-1][0], end - self.__header_offset - BLOCK_HEADER.size))
+        self.__file.seek(end)
+        self.__file.flush()
+        self.__compressor = None
+
+    def __write_index(self):
+        for turn_number, offset in self.__index:
+            self.__file.write(BLOCK_HEADER.pack(turn_number, offset))
+        self.__file.write(INDEX_FOOTER.pack(len(self.__index), INDEX_MAGIC))
+
+class GameRecording:
+    """Reads a recording made by GameRecorder
+
+    Attributes:
+        * path (str): The recording file
+        * codec (str): "zlib" or "lzma"
+        * index (dict): Maps the turn number of each block, CONFIG_BLOCK for the config, to its offset in the file
+
+    """
+    def __init__(self, path):
+        """Reads the index of the recording, or rebuilds it from the block headers if the recorder did not close
+
+        Args:
+            * path: The recording file
+
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            header = file.read(len(MAGIC) + 1)
+            if header[:len(MAGIC)] != MAGIC or header[len(MAGIC):] not in _CODEC_NAMES:
+                raise ValueError("{} is not a game recording".format(path))
+            self.codec = _CODEC_NAMES[header[len(MAGIC):]]
+            self.__size = file.seek(0, os.SEEK_END)
+            self.index = self.__read_index(file)
+            if self.index is None:
+                self.index = self.__scan_blocks(file)
+
+    def __read_index(self, file):
+        if self.__size < len(MAGIC) + 1 + INDEX_FOOTER.size:
+            return None
+        file.seek(self.__size - INDEX_FOOTER.size)
+        count, magic = INDEX_FOOTER.unpack(file.read(INDEX_FOOTER.size))
+        if magic != INDEX_MAGIC:
+            return None
+        file.seek(self.__size - INDEX_FOOTER.size - count * BLOCK_HEADER.size)
+        entries = file.read(count * BLOCK_HEADER.size)
+        return dict(BLOCK_HEADER.unpack_from(entries, position * BLOCK_HEADER.size) for position in range(count))
+
+    def __scan_blocks(self, file):
+        index = {}
+        offset = len(MAGIC) + 1
+        while offset + BLOCK_HEADER.size <= self.__size:
+            file.seek(offset)
+            turn_number, length = BLOCK_HEADER.unpack(file.read(BLOCK_HEADER.size))
+            index[turn_number] = offset
+            if length == 0:
+                break
+            offset += BLOCK_HEADER.size + length
+        return index
+
+    def turns(self):
+        """Gets the turn numbers of the recorded turns
+
+        Returns:
+            A sorted list of turn numbers, not including CONFIG_BLOCK
+
+        """
+        return sorted(turn_number for turn_number in self.index if turn_number != CONFIG_BLOCK)
+
+    def read_block(self, turn_number):
+        """Reads the lines recorded for one turn, seeking straight to its block
+
+        Args:
+            * turn_number: The turn number, or CONFIG_BLOCK for the config
+
+        Returns:
+            A list of (direction, line) tuples in the order they were recorded, where direction is RECEIVED or SENT
+            and line has no trailing newline
+
+        """
+        with open(self.path, "rb") as file:
+            file.seek(self.index[turn_number])
+            _, length = BLOCK_HEADER.unpack(file.read(BLOCK_HEADER.size))
+            payload = file.read(length) if length else file.read()
+        decompressor = _CODECS[self.codec][2]()
+        try:
+            text = decompressor.decompress(payload).decode("utf-8", "ignore")
+        except (zlib.error, lzma.LZMAError, EOFError):
+            # A block cut short by a crash ends with a partly written line
+            text = ""
+        lines = text.split("\n")
+        if not text.endswith("\n"):
+            lines = lines[:-1]
+        return [(line[0], line[1:]) for line in lines if line]
+
+    def __iter__(self):
+        """Iterates over every recorded (direction, line) tuple in order
+        """
+        for turn_number in sorted(self.index, key=self.index.get):
+            yield from self.read_block(turn_number)
+
+    def received(self):
+        """Gets every line received from the game, in order
+
+        Returns:
+            A list of lines without trailing newlines
+
+        """
+        return [line for direction, line in self if direction == RECEIVED]
@@ -0,0 +1,180 @@
+"""
+Replays a game recorded with GameRecorder through a strategy, outside of a live match. Run from the algo folder with
+
+    python -m gamelib.replay game.rec [--algo algo_strategy.AlgoStrategy] [--profile 3]
+
+Every recorded line is fed to the strategy's start() in process. The commands it sends each turn are checked against
+the recorded ones and the wall time of each on_turn is reported, followed by a cProfile of the slowest turns.
+Random is seeded the same way on every run, so a replay of a strategy is repeatable.
+"""
+import argparse
+import cProfile
+import functools
+import importlib
+import io
+import os
+import pstats
+import random
+import sys
+import time
+from contextlib import redirect_stdout
+
+from . import util
+from .recorder import GameRecording, CONFIG_BLOCK, SENT
+
+# Long enough that the TurnBudget watchdog never fires during a replay
+REPLAY_TURN_TIME_LIMIT = 24 * 60 * 60.0
+
+class TurnResult:
+    """The outcome of one replayed turn
+
+    Attributes:
+        * turn_number (int): The turn number
+        * seconds (float): The wall time on_turn took
+        * commands (list): The commands the strategy sent this turn
+        * expected (list): The commands recorded for this turn
+        * profile (:obj: cProfile.Profile): The profile of on_turn, if the turn was profiled
+
+    """
+    def __init__(self, turn_number, expected):
+        self.turn_number = turn_number
+        self.seconds = 0.0
+        self.commands = []
+        self.expected = expected
+        self.profile = None
+
+    @property
+    def matches(self):
+        """True if the strategy sent the recorded commands"""
+        return self.commands == self.expected
+
+class _Replay:
+    """Wraps a strategy's on_turn to time it, and collects the commands sent during each turn"""
+    def __init__(self, recording, profile_turns):
+        self.profile_turns = set(profile_turns)
+        self.turns = {}
+        self.current = None
+        self.expected = {turn_number: [line for direction, line in recording.read_block(turn_number) if direction == SENT]
+                         for turn_number in recording.turns()}
+
+    def wrap(self, on_turn):
+        @functools.wraps(on_turn)
+        def timed_on_turn(turn_string, **kwargs):
+            turn_number = util.read_turn_info(turn_string)[1]
+            self.current = TurnResult(turn_number, self.expected.get(turn_number, []))
+            self.turns[turn_number] = self.current
+            profiler = cProfile.Profile() if turn_number in self.profile_turns else None
+            start = time.perf_counter()
+            if profiler is not None:
+                profiler.enable()
+            try:
+                return on_turn(turn_string, **kwargs)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                self.current.seconds = time.perf_counter() - start
+                self.current.profile = profiler
+        return timed_on_turn
+
+    def record_sent(self, command):
+        if self.current is not None:
+            self.current.commands.append(command)
+
+def replay(recording, algo_factory, profile_turns=(), seed=0):
+    """Feeds a recorded game to a new strategy
+
+    The strategy runs with REPLAY_TURN_TIME_LIMIT, so the watchdog never replaces a slow turn, and without recording.
+
+    Args:
+        * recording: A GameRecording
+        * algo_factory: A function returning a new AlgoCore, such as an AlgoCore subclass
+        * profile_turns: The turn numbers to run under cProfile
+        * seed: The seed given to random before the strategy is made
+
+    Returns:
+        A list of TurnResults, in turn order
+
+    """
+    state = _Replay(recording, profile_turns)
+    stream = io.StringIO("".join(line + "\n" for line in recording.received()))
+    random.seed(seed)
+    algo = algo_factory()
+    algo.on_turn = state.wrap(algo.on_turn)
+    algo.get_turn_time_limit = lambda: REPLAY_TURN_TIME_LIMIT
+    algo.get_recording_path = lambda: None
+    stdin = sys.stdin
+    sys.stdin = stream
+    util.set_command_recorder(state)
+    try:
+        with redirect_stdout(io.StringIO()):
+            algo.start()
+    except SystemExit:
+        # The recording ended without an end of game message
+        pass
+    finally:
+        util.set_command_recorder(None)
+        sys.stdin = stdin
+    return [state.turns[turn_number] for turn_number in sorted(state.turns)]
+
+def slowest(results, count):
+    """Gets the slowest replayed turns
+
+    Args:
+        * results: The TurnResults returned by replay
+        * count: The number of turns to return
+
+    Returns:
+        The count TurnResults with the longest wall time, slowest first
+
+    """
+    return sorted(results, key=lambda result: result.seconds, reverse=True)[:count]
+
+def load_algo(name):
+    """Imports a strategy class given as module.Class, looking in the current folder first
+    """
+    module_name, _, class_name = name.rpartition(".")
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    return getattr(importlib.import_module(module_name), class_name)
+
+def report(results, slow_count, out=None):
+    """Writes the per turn times, the slowest turns and the turns whose commands differ from the recording to out, stdout by default
+    """
+    out = out or sys.stdout
+    out.write("{:>6} {:>12}  {}\n".format("turn", "ms", "commands"))
+    for result in results:
+        out.write("{:>6} {:>12.2f}  {}\n".format(result.turn_number, result.seconds * 1000, "match" if result.matches else "DIFFER"))
+    total = sum(result.seconds for result in results)
+    out.write("\n{} turns, {:.1f} ms total, {:.2f} ms mean\n".format(len(results), total * 1000, total * 1000 / max(1, len(results))))
+    out.write("slowest: {}\n".format(", ".join("turn {} {:.2f} ms".format(result.turn_number, result.seconds * 1000) for result in slowest(results, slow_count))))
+    differing = [result for result in results if not result.matches]
+    for result in differing:
+        out.write("\nturn {} sent\n    {}\nrecorded\n    {}\n".format(result.turn_number, "\n    ".join(result.commands), "\n    ".join(result.expected)))
+    out.write("{} of {} turns differ from the recording\n".format(len(differing), len(results)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m gamelib.replay", description="Replays a recorded game through a strategy")
+    parser.add_argument("recording", help="a file recorded with GameRecorder")
+    parser.add_argument("--algo", default="algo_strategy.AlgoStrategy", help="the strategy class as module.Class")
+    parser.add_argument("--profile", type=int, default=3, metavar="N", help="profile the N slowest turns, 0 for none")
+    parser.add_argument("--slowest", type=int, default=5, metavar="N", help="list the N slowest turns")
+    parser.add_argument("--lines", type=int, default=25, help="the number of functions listed per profile")
+    parser.add_argument("--seed", type=int, default=0, help="the seed given to random before the strategy is made")
+    args = parser.parse_args(argv)
+
+    recording = GameRecording(args.recording)
+    if CONFIG_BLOCK not in recording.index:
+        parser.error("{} has no config".format(args.recording))
+    algo_class = load_algo(args.algo)
+    results = replay(recording, algo_class, seed=args.seed)
+    report(results, args.slowest)
+    if args.profile > 0:
+        # Profiling slows every call down, so the slowest turns are profiled on a second run rather than timed with it
+        profile_turns = [result.turn_number for result in slowest(results, args.profile)]
+        for result in replay(recording, algo_class, profile_turns, args.seed):
+            if result.profile is not None:
+                sys.stdout.write("\n---- profile of turn {} ----\n".format(result.turn_number))
+                pstats.Stats(result.profile, stream=sys.stdout).sort_stats("cumulative").print_stats(args.lines)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,502 @@
+from array import array
+
+from .game_map import ARENA_SIZE, HALF_ARENA, EDGE_LOCATIONS, EDGE_SETS, threatened_indices
+from .navigation import ShortestPathFinder, GRID_CELLS, CELL_X, CELL_Y
+from .unit import get_unit_stats
+
+"""
+A frame stepping model of the action phase. The board is copied into flat arrays indexed by
+x * ARENA_SIZE + y when the simulator is created, and every simulate() call replays the action phase
+on a fresh copy of those arrays, so many candidate attacks can be compared within one turn.
+"""
+
+_NO_UNIT = 0
+
+"""
+What happened to an information unit, see ActionSimulator.information_units
+"""
+ALIVE = 0
+BREACHED = 1
+SELF_DESTRUCTED = 2
+DESTROYED = 3
+
+class SimulationResult:
+    """The outcome of a simulated action phase. Each list is indexed by player index, 0 for you 1 for the enemy.
+
+    Attributes:
+        * breaches (list): The number of the player's information units that reached their target edge
+        * health_damage (list): The damage the player's breaches dealt to the opponent's health
+        * structure_damage (list): The damage the player's units dealt to enemy firewalls, including self destructs
+        * structures_destroyed (list): For each player, the [x, y] locations of the enemy firewalls its units destroyed
+        * units_lost (list): The number of the player's information units destroyed before reaching an edge
+        * frames (int): The number of frames simulated
+
+    """
+    def __init__(self):
+        self.breaches = [0, 0]
+        self.health_damage = [0.0, 0.0]
+        self.structure_damage = [0.0, 0.0]
+        self.structures_destroyed = [[], []]
+        self.units_lost = [0, 0]
+        self.frames = 0
+
+    def __repr__(self):
+        return "SimulationResult(breaches={}, health_damage={}, structure_damage={}, structures_destroyed={}, units_lost={}, frames={})".format(
+            self.breaches, self.health_damage, self.structure_damage, self.structures_destroyed, self.units_lost, self.frames)
+
+class ActionSimulator:
+    """Predicts the result of an action phase from a GameState
+
+    Each frame encryptors shield friendly information units that come into range (once per encryptor),
+    information units step towards their target edge every 1/speed frames, units on their target edge breach,
+    units that cannot go further self destruct, then every unit attacks the target GameState.get_target would pick,
+    and destroyed units are removed. Destroyed firewalls are cleared from the board and units re-path around the change.
+    Attacks are resolved one unit at a time with damage applied at once, so close fights can differ slightly from the engine.
+
+    The board is read once, from the stationary units of game_state.game_map. The information units
+    deployed this turn with game_state.attempt_spawn are always part of the simulation.
+
+    Attributes:
+        * game_state (:obj: GameState): The game state the board was read from
+
+    """
+    def __init__(self, game_state, capacity=64):
+        """Copies the board into compact arrays
+
+        Args:
+            * game_state: The GameState to simulate
+            * capacity: The number of information units to preallocate space for, grown as needed
+
+        """
+        self.game_state = game_state
+        config = game_state.config
+        self.__stats = get_unit_stats(config)
+        mechanics = config.get("mechanics", {})
+        self.__shield_decay = mechanics.get("shieldDecayPerFrame", 0.0)
+        self.__self_destruct_steps = mechanics.get("stepsRequiredSelfDestruct", 5)
+        self.__self_destruct_range = mechanics.get("selfDestructRadius", 1.5)
+        self.__types = [stats for stats in sorted(self.__stats.values(), key=lambda stats: stats.type_index)]
+        unit_information = config["unitInformation"]
+        self.__damage_to_player = [unit_information[stats.type_index].get("damageToPlayer", 1.0) for stats in self.__types]
+        self.__encryptor = unit_information[1]["shorthand"]
+        self.__destructor = unit_information[2]["shorthand"]
+        self.__scrambler = unit_information[5]["shorthand"]
+
+        # The board as read from the game state. Type codes are type_index + 1, 0 for an empty location.
+        self.__base_type = bytearray(GRID_CELLS)
+        self.__base_owner = bytearray(GRID_CELLS)
+        self.__base_stability = array('d', bytes(8 * GRID_CELLS))
+        self.__encryptors = []
+        self.__destructors = []
+        game_map = game_state.game_map
+        mask = game_map.get_stationary_mask()
+        for index in range(GRID_CELLS):
+            if not mask[index]:
+                continue
+            for unit in game_map[CELL_X[index], CELL_Y[index]]:
+                if unit.stationary:
+                    self.__base_type[index] = unit.stats.type_index + 1
+                    self.__base_owner[index] = unit.player_index
+                    self.__base_stability[index] = unit.stability
+                    if unit.unit_type == self.__encryptor:
+                        self.__encryptors.append(index)
+                    elif unit.unit_type == self.__destructor:
+                        self.__destructors.append(index)
+                    break
+
+        self.__base_blocked = bytes(1 if unit_type else 0 for unit_type in self.__base_type)
+
+        # For each location, the encryptors (as positions in the encryptor list) and destructors that reach it
+        self.__shielding = [()] * GRID_CELLS
+        for position, index in enumerate(self.__encryptors):
+            for covered in threatened_indices(self.__stats[self.__encryptor].range)[index]:
+                self.__shielding[covered] += (position,)
+        self.__guarding = [()] * GRID_CELLS
+        for index in self.__destructors:
+            for covered in threatened_indices(self.__stats[self.__destructor].range)[index]:
+                self.__guarding[covered] += (index,)
+        self.__active = bytearray(GRID_CELLS)
+        self.__alive_count = [0, 0]
+
+        # The board during a simulation
+        self.__type = bytearray(self.__base_type)
+        self.__owner = bytearray(self.__base_owner)
+        self.__stability = array('d', self.__base_stability)
+        self.__blocked = bytearray(GRID_CELLS)
+
+        # One path finder per target edge, holding the distance field for the current walls
+        self.__finders = [ShortestPathFinder() for _ in range(4)]
+        self.__pocket_finder = ShortestPathFinder()
+        self.__end_indices = [[x * ARENA_SIZE + y for x, y in edge] for edge in EDGE_LOCATIONS]
+        self.__directions = [(-1 if edge[0][0] < HALF_ARENA else 1, -1 if edge[0][1] < HALF_ARENA else 1) for edge in EDGE_LOCATIONS]
+        self.__edge_masks = []
+        for edge in EDGE_SETS:
+            edge_mask = bytearray(GRID_CELLS)
+            for x, y in edge:
+                edge_mask[x * ARENA_SIZE + y] = 1
+            self.__edge_masks.append(bytes(edge_mask))
+        # Version 0 is the board as read, so its distance fields are reused between simulations
+        self.__field_version = [-1] * 4
+        self.__wall_version = 0
+        self.__last_version = 0
+
+        self.__allocate(capacity)
+
+    def __allocate(self, capacity):
+        """Preallocates the per unit arrays for the given number of information units
+        """
+        self.__capacity = capacity
+        self.__unit_type = bytearray(capacity)
+        self.__unit_owner = bytearray(capacity)
+        self.__unit_cell = array('i', bytes(4 * capacity))
+        self.__unit_stability = array('d', bytes(8 * capacity))
+        self.__unit_shield = array('d', bytes(8 * capacity))
+        self.__unit_edge = bytearray(capacity)
+        self.__unit_period = array('i', bytes(4 * capacity))
+        self.__unit_wait = array('i', bytes(4 * capacity))
+        self.__unit_steps = array('i', bytes(4 * capacity))
+        self.__unit_direction = bytearray(capacity)
+        self.__unit_alive = bytearray(capacity)
+        self.__unit_fate = bytearray(capacity)
+        self.__count = 0
+        self.__shielded = bytearray(capacity * max(1, len(self.__encryptors)))
+        self.__no_shields = bytes(len(self.__shielded))
+
+    def firewall_stability(self, location):
+        """Gets the stability of the firewall at a location at the end of the last simulation
+
+        Args:
+            * location: The location to check
+
+        Returns:
+            The stability of the firewall there, or 0 if there is none
+
+        """
+        index = location[0] * ARENA_SIZE + location[1]
+        return self.__stability[index] if self.__type[index] != _NO_UNIT else 0
+
+    def information_units(self):
+        """Gets every information unit of the current or last simulation, including the ones no longer on the board
+
+        Returns:
+            A list of (type_index, player_index, x, y, stability, fate) tuples, one per unit in the order they were deployed,
+            where fate is ALIVE, BREACHED, SELF_DESTRUCTED or DESTROYED. x and y are where the unit was last.
+
+        """
+        return [(self.__unit_type[slot], self.__unit_owner[slot], CELL_X[self.__unit_cell[slot]], CELL_Y[self.__unit_cell[slot]],
+                 self.__unit_stability[slot], self.__unit_fate[slot]) for slot in range(self.__count)]
+
+    def firewalls(self):
+        """Gets the firewalls standing in the current or last simulation
+
+        Returns:
+            A list of (type_index, player_index, x, y, stability) tuples
+
+        """
+        return [(self.__type[index] - 1, self.__owner[index], CELL_X[index], CELL_Y[index], self.__stability[index])
+                for index in range(GRID_CELLS) if self.__type[index] != _NO_UNIT]
+
+    def simulate(self, spawns=(), max_frames=1000, frame_callback=None):
+        """Simulates the action phase
+
+        Args:
+            * spawns: Information units to add to the ones deployed with attempt_spawn, as a list of
+              (unit_type, location, num, player_index) tuples. Enemy units should spawn on the enemy's edges.
+            * max_frames: The number of frames after which the simulation stops even if units are still moving
+            * frame_callback: A function called with the frame number after each frame, which can read the board
+              with information_units and firewalls
+
+        Returns:
+            A SimulationResult
+
+        """
+        deploys = [(unit_type, [x, y], 1, 0) for unit_type, x, y in self.game_state._deploy_stack]
+        deploys.extend(spawns)
+        count = sum(num for _, _, num, _ in deploys)
+        if count > self.__capacity:
+            self.__allocate(count)
+
+        self.__type[:] = self.__base_type
+        self.__owner[:] = self.__base_owner
+        self.__stability[:] = self.__base_stability
+        self.__blocked[:] = self.__base_blocked
+        self.__wall_version = 0
+        self.__shielded[:] = self.__no_shields
+
+        count = 0
+        for unit_type, location, num, player_index in deploys:
+            stats = self.__stats[unit_type]
+            index = location[0] * ARENA_SIZE + location[1]
+            edge = self.game_state.get_target_edge(location)
+            for _ in range(num):
+                self.__unit_type[count] = stats.type_index
+                self.__unit_owner[count] = player_index
+                self.__unit_cell[count] = index
+                self.__unit_stability[count] = stats.max_stability
+                self.__unit_shield[count] = 0.0
+                self.__unit_edge[count] = edge
+                self.__unit_period[count] = max(1, int(round(1 / stats.speed)))
+                self.__unit_wait[count] = 0
+                self.__unit_steps[count] = 0
+                self.__unit_direction[count] = 0
+                self.__unit_alive[count] = 1
+                self.__unit_fate[count] = ALIVE
+                count += 1
+        self.__count = count
+        self.__alive_count[0] = 0
+        self.__alive_count[1] = 0
+        for slot in range(count):
+            self.__alive_count[self.__unit_owner[slot]] += 1
+
+        result = SimulationResult()
+        alive = count
+        frame = 0
+        while alive and frame < max_frames:
+            frame += 1
+            self.__shield(count)
+            self.__move(count, result)
+            self.__attack(count, result)
+            alive = self.__remove_destroyed(count, result)
+            if frame_callback is not None:
+                frame_callback(frame)
+        result.frames = frame
+        return result
+
+    def __shield(self, count):
+        encryptors = self.__encryptors
+        encryptor_count = len(encryptors)
+        shield_amount = self.__stats[self.__encryptor].damage
+        shielded = self.__shielded
+        shielding = self.__shielding
+        owner = self.__owner
+        unit_owner = self.__unit_owner
+        unit_cell = self.__unit_cell
+        unit_alive = self.__unit_alive
+        unit_shield = self.__unit_shield
+        unit_stability = self.__unit_stability
+        decay = self.__shield_decay
+        for slot in range(count):
+            if not unit_alive[slot]:
+                continue
+            shield = unit_shield[slot]
+            if shield > 0 and decay:
+                lost = decay if decay < shield else shield
+                unit_shield[slot] = shield - lost
+                unit_stability[slot] -= lost
+            for position in shielding[unit_cell[slot]]:
+                encryptor = encryptors[position]
+                flag = slot * encryptor_count + position
+                if shielded[flag] or self.__type[encryptor] == _NO_UNIT or owner[encryptor] != unit_owner[slot]:
+                    continue
+                shielded[flag] = 1
+                unit_shield[slot] += shield_amount
+                unit_stability[slot] += shield_amount
+
+    def __distance_field(self, edge):
+        """Gets the path finder holding the distance field to an edge for the current walls
+        """
+        finder = self.__finders[edge]
+        if self.__field_version[edge] != self.__wall_version:
+            finder.blocked[:] = self.__blocked
+            end_indices = self.__end_indices[edge]
+            finder._end_mask[:] = self.__edge_masks[edge]
+            finder._validate(end_indices[0], end_indices)
+            self.__field_version[edge] = self.__wall_version
+        return finder
+
+    def __move(self, count, result):
+        unit_alive = self.__unit_alive
+        unit_cell = self.__unit_cell
+        unit_wait = self.__unit_wait
+        for slot in range(count):
+            if not unit_alive[slot]:
+                continue
+            unit_wait[slot] += 1
+            if unit_wait[slot] < self.__unit_period[slot]:
+                continue
+            unit_wait[slot] = 0
+
+            edge = self.__unit_edge[slot]
+            direction = self.__directions[edge]
+            cell = unit_cell[slot]
+            finder = self.__distance_field(edge)
+            if finder.pathlength[cell] == -1:
+                # Walled off from the edge, head for the most ideal location of the pocket instead
+                finder = self.__pocket_finder
+                end_indices = self.__end_indices[edge]
+                finder.blocked[:] = self.__blocked
+                finder._end_mask[:] = self.__edge_masks[edge]
+                finder._validate(finder._idealness_search(cell, direction), end_indices)
+
+            if finder.pathlength[cell] == 0:
+                self.__self_destruct(slot, result)
+                continue
+            next_cell = finder._choose_next_move(cell, self.__unit_direction[slot], direction)
+            self.__unit_direction[slot] = finder.VERTICAL if CELL_X[cell] == CELL_X[next_cell] else finder.HORIZONTAL
+            unit_cell[slot] = next_cell
+            self.__unit_steps[slot] += 1
+            if self.__edge_masks[edge][next_cell]:
+                player_index = self.__unit_owner[slot]
+                result.breaches[player_index] += 1
+                result.health_damage[player_index] += self.__damage_to_player[self.__unit_type[slot]]
+                unit_alive[slot] = 0
+                self.__unit_fate[slot] = BREACHED
+                self.__alive_count[player_index] -= 1
+
+    def __self_destruct(self, slot, result):
+        """Removes a unit that cannot move further, damaging nearby enemy firewalls if it walked far enough
+        """
+        self.__unit_alive[slot] = 0
+        self.__unit_fate[slot] = SELF_DESTRUCTED
+        player_index = self.__unit_owner[slot]
+        self.__alive_count[player_index] -= 1
+        if self.__unit_steps[slot] < self.__self_destruct_steps:
+            result.units_lost[player_index] += 1
+            return
+        damage = self.__types[self.__unit_type[slot]].max_stability
+        cell = self.__unit_cell[slot]
+        for target in threatened_indices(self.__self_destruct_range)[cell]:
+            if self.__type[target] != _NO_UNIT and self.__owner[target] != player_index:
+                self.__damage_firewall(target, damage, player_index, result)
+        result.units_lost[player_index] += 1
+
+    def __damage_firewall(self, cell, damage, player_index, result):
+        stability = self.__stability[cell]
+        result.structure_damage[player_index] += damage if damage < stability else stability
+        self.__stability[cell] = stability - damage
+        if stability - damage <= 0:
+            result.structures_destroyed[player_index].append([CELL_X[cell], CELL_Y[cell]])
+            self.__type[cell] = _NO_UNIT
+            self.__blocked[cell] = 0
+            self.__last_version += 1
+            self.__wall_version = self.__last_version
+
+    def __damage_unit(self, slot, damage):
+        self.__unit_stability[slot] -= damage
+        shield = self.__unit_shield[slot]
+        if shield > 0:
+            self.__unit_shield[slot] = shield - damage if damage < shield else 0.0
+
+    def __attack(self, count, result):
+        unit_alive = self.__unit_alive
+        alive_count = self.__alive_count
+        active = self.__active
+        owner = self.__owner
+        types = self.__types
+        for slot in range(count):
+            if not unit_alive[slot]:
+                continue
+            stats = types[self.__unit_type[slot]]
+            cell = self.__unit_cell[slot]
+            player_index = self.__unit_owner[slot]
+            # Mark the enemy destructors that have this unit in range
+            for destructor in self.__guarding[cell]:
+                if owner[destructor] != player_index:
+                    active[destructor] = 1
+            target = self.__find_unit_target(cell, player_index, stats.range, count) if alive_count[1 - player_index] else -1
+            if target != -1:
+                self.__damage_unit(target, stats.damage_i)
+            elif stats.unit_type != self.__scrambler and stats.damage_f:
+                target = self.__find_firewall_target(cell, player_index, stats.range)
+                if target != -1:
+                    self.__damage_firewall(target, stats.damage_f, player_index, result)
+
+        for cell in self.__destructors:
+            if not active[cell]:
+                continue
+            active[cell] = 0
+            if self.__type[cell] == _NO_UNIT:
+                continue
+            stats = types[self.__type[cell] - 1]
+            target = self.__find_unit_target(cell, owner[cell], stats.range, count)
+            if target != -1:
+                self.__damage_unit(target, stats.damage)
+
+    def __find_unit_target(self, cell, player_index, radius, count):
+        """Picks an enemy information unit in range with the priorities of GameState.get_target
+
+        Returns:
+            The slot of the target, -1 if there is none
+
+        """
+        x = CELL_X[cell]
+        y = CELL_Y[cell]
+        reach = radius + 0.51
+        reach *= reach
+        unit_cell = self.__unit_cell
+        unit_stability = self.__unit_stability
+        best = -1
+        best_distance = best_stability = best_y = best_x_distance = 0
+        for slot in range(count):
+            if not self.__unit_alive[slot] or self.__unit_owner[slot] == player_index or unit_stability[slot] <= 0:
+                continue
+            target_cell = unit_cell[slot]
+            target_x = CELL_X[target_cell]
+            target_y = CELL_Y[target_cell]
+            distance = (target_x - x) * (target_x - x) + (target_y - y) * (target_y - y)
+            if distance >= reach:
+                continue
+            stability = unit_stability[slot]
+            height = target_y if player_index == 0 else -target_y
+            x_distance = abs(HALF_ARENA - 0.5 - target_x)
+            if best == -1 or self.__better_target(distance, stability, height, x_distance, best_distance, best_stability, best_y, best_x_distance):
+                best = slot
+                best_distance, best_stability, best_y, best_x_distance = distance, stability, height, x_distance
+        return best
+
+    def __find_firewall_target(self, cell, player_index, radius):
+        """Picks an enemy firewall in range with the priorities of GameState.get_target
+
+        Returns:
+            The location index of the target, -1 if there is none
+
+        """
+        x = CELL_X[cell]
+        y = CELL_Y[cell]
+        best = -1
+        best_distance = best_stability = best_y = best_x_distance = 0
+        for target in threatened_indices(radius)[cell]:
+            if self.__type[target] == _NO_UNIT or self.__owner[target] == player_index:
+                continue
+            target_x = CELL_X[target]
+            target_y = CELL_Y[target]
+            distance = (target_x - x) * (target_x - x) + (target_y - y) * (target_y - y)
+            stability = self.__stability[target]
+            height = target_y if player_index == 0 else -target_y
+            x_distance = abs(HALF_ARENA - 0.5 - target_x)
+            if best == -1 or self.__better_target(distance, stability, height, x_distance, best_distance, best_stability, best_y, best_x_distance):
+                best = target
+                best_distance, best_stability, best_y, best_x_distance = distance, stability, height, x_distance
+        return best
+
+    @staticmethod
+    def __better_target(distance, stability, height, x_distance, best_distance, best_stability, best_y, best_x_distance):
+        """Nearest, then lowest stability, then lowest y for you or highest y for the enemy, then furthest from the center
+        """
+        if distance != best_distance:
+            return distance < best_distance
+        if stability != best_stability:
+            return stability < best_stability
+        if height != best_y:
+            return height < best_y
+        return x_distance > best_x_distance
+
+    def __remove_destroyed(self, count, result):
+        """Removes information units with no stability left
+
+        Returns:
+            The number of information units still on the board
+
+        """
+        alive = 0
+        for slot in range(count):
+            if not self.__unit_alive[slot]:
+                continue
+            if self.__unit_stability[slot] <= 0:
+                self.__unit_alive[slot] = 0
+                self.__unit_fate[slot] = DESTROYED
+                self.__alive_count[self.__unit_owner[slot]] -= 1
+                result.units_lost[self.__unit_owner[slot]] += 1
+            else:
+                alive += 1
+        return alive
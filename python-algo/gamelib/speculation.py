@@ -0,0 +1,178 @@
+import threading
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from .game_state import GameState
+from .util import debug_write
+
+FIREWALL_INDEXES = (0, 1, 2)
+REMOVE_INDEX = 6
+
+# Holds the cancel flag of the Speculator whose planner thread it is
+_local = threading.local()
+
+def cancelled():
+    """Checks whether the plan being made on this thread is no longer wanted
+
+    A planner run by a Speculator, such as AlgoCore.speculate, should check it between steps and return early once
+    it is True, so it stops competing with on_turn for the interpreter. It is set when the turn the plan was for arrives,
+    by Speculator.collect, and when the speculator is closed.
+
+    Returns:
+        True if this is a planner thread whose plan will be discarded, False otherwise
+
+    """
+    cancel = getattr(_local, "cancel", None)
+    return cancel is not None and cancel.is_set()
+
+def board_signature(state):
+    """Gets the firewall layout of a parsed turn or action frame, the part of the board a speculative plan depends on
+
+    Firewalls flagged for removal are left out since they are gone by the time the next turn starts.
+    Stability, resources and information units are not part of the signature.
+
+    Args:
+        * state: A turn or action frame string parsed as json
+
+    Returns:
+        A frozenset of (player_index, unit_type_index, x, y) tuples
+
+    """
+    signature = set()
+    for player_index, units in enumerate([state["p1Units"], state["p2Units"]]):
+        removed = {(unit[0], unit[1]) for unit in units[REMOVE_INDEX]}
+        for type_index in FIREWALL_INDEXES:
+            for unit in units[type_index]:
+                if (unit[0], unit[1]) not in removed:
+                    signature.add((player_index, type_index, unit[0], unit[1]))
+    return frozenset(signature)
+
+class Speculation:
+    """The result of planning against the board of an action frame
+
+    Attributes:
+        * game_state (:obj: GameState): The board of the action frame the plan was made against. Resources and the
+          turn number are those of the frame, not of the next turn
+        * result: What the planner returned
+        * frame (int): The action frame number the plan was made against
+        * signature (frozenset): The board_signature of that frame
+
+    """
+    def __init__(self, game_state, result, frame, signature):
+        self.game_state = game_state
+        self.result = result
+        self.frame = frame
+        self.signature = signature
+
+class Speculator:
+    """Runs a planner in a background thread against the latest action frame while the action phase plays out
+
+    Frames are handed over with offer(). Whenever the planner is idle it picks up the newest frame, so frames that arrive
+    while it is busy are skipped rather than queued. When the next turn arrives, collect() hands back the newest
+    plan if the board it was made against still matches the turn.
+    AlgoCore makes one when its speculate function is overridden, see AlgoCore.speculate.
+
+    Attributes:
+        * plans (int): The number of plans completed since the speculator was made
+
+    """
+    def __init__(self, config, planner, signature=board_signature):
+        """Starts the planner thread
+
+        Args:
+            * config: A json object containing information about the game
+            * planner: A function taking a GameState and returning a plan, run in the background thread
+            * signature: A function taking a parsed turn or frame and returning what must match for a plan to be valid
+
+        """
+        self.config = config
+        self.plans = 0
+        self.__planner = planner
+        self.__signature = signature
+        self.__condition = threading.Condition()
+        self.__pending = None
+        self.__running = False
+        self.__latest = None
+        self.__generation = 0
+        self.__closed = False
+        self.__cancel = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def offer(self, frame_string, parsed_state=None):
+        """Hands over the newest action frame, replacing any frame the planner has not picked up yet
+
+        Args:
+            * frame_string: The action frame string
+            * parsed_state: frame_string already parsed as json, if it was, so it is not parsed again
+
+        """
+        with self.__condition:
+            self.__pending = (frame_string, parsed_state, self.__generation)
+            self.__condition.notify()
+
+    def collect(self, parsed_turn, timeout=0.0):
+        """Gets the newest plan of this action phase if it is still valid for the turn that arrived
+
+        A plan still being made, or about to be made for a frame the planner has not picked up yet, is waited for up to
+        timeout seconds, then cancelled, see cancelled(), and its result discarded.
+        Frames offered after this call belong to the next action phase.
+
+        Args:
+            * parsed_turn: The turn string parsed as json
+            * timeout: The longest time to wait for a plan still being made, in seconds
+
+        Returns:
+            The Speculation, or None if there is no plan or the board changed since the frame it was made against
+
+        """
+        with self.__condition:
+            self.__condition.wait_for(lambda: not self.__running and self.__pending is None, max(0.0, timeout))
+            self.__pending = None
+            if self.__running:
+                self.__cancel.set()
+            latest, self.__latest = self.__latest, None
+            self.__generation += 1
+        if latest is None or latest.signature != self.__signature(parsed_turn):
+            return None
+        return latest
+
+    def close(self):
+        """Stops the planner thread once the plan it is making, if any, is done
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__pending = None
+            self.__cancel.set()
+            self.__condition.notify()
+
+    def __run(self):
+        _local.cancel = self.__cancel
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__closed or self.__pending is not None)
+                if self.__closed:
+                    return
+                (frame_string, parsed_state, generation), self.__pending = self.__pending, None
+                self.__running = True
+                self.__cancel.clear()
+            speculation = None
+            try:
+                if parsed_state is None:
+                    parsed_state = loads(frame_string)
+                game_state = GameState(self.config, frame_string, parsed_state)
+                game_state.suppress_warnings(True)
+                if not self.__cancel.is_set():
+                    result = self.__planner(game_state.fork())
+                    speculation = Speculation(game_state, result, int(parsed_state["turnInfo"][2]), self.__signature(parsed_state))
+            except Exception as e:
+                debug_write("Speculative planning failed: {}".format(e))
+            with self.__condition:
+                self.__running = False
+                if speculation is not None and generation == self.__generation:
+                    self.__latest = speculation
+                    self.plans += 1
+                self.__condition.notify_all()
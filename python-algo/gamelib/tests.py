@@ -1,12 +1,35 @@
 import unittest
 import json
+import random
+import sys
+import io
+import time
+import os
+import tempfile
+import zipfile
+import threading
+from contextlib import redirect_stdout, redirect_stderr
 from .game_state import GameState
+from . import game_state as game_state_module
 from .unit import GameUnit
-from .advanced_game_state import AdvancedGameState
+from .board_arrays import BoardArrays, np
+from .bench import random_turn_string, fixture_boards, bench_boards, compare, BenchResults, FIXTURES
+from .simulator import ActionSimulator
+from .worker_pool import WorkerPool
+from .budget import TurnBudget, active_budget
+from .algocore import AlgoCore
+from .speculation import Speculator, cancelled as speculation_cancelled
+from .frame_tracker import FrameTracker
+from .recorder import GameRecorder, GameRecording, CONFIG_BLOCK, RECEIVED, SENT
+from .replay import replay, slowest
+from .engine import LocalEngine, subscribes_to_frames
+from . import tournament
+from . import instrument
+from .util import classify_message, CONFIG_MESSAGE, TURN_MESSAGE, ACTION_FRAME_MESSAGE, END_MESSAGE, UNKNOWN_MESSAGE
 
 class BasicTests(unittest.TestCase):
 
-    def make_turn_0_map(self, adv=False):
+    def make_turn_0_map(self):
         config = """
         {
             "debug":{
@@ -130,24 +153,14 @@ class BasicTests(unittest.TestCase):
         turn_0 = """{"p2Units":[[],[],[],[],[],[],[]],"turnInfo":[0,0,-1],"p1Stats":[30.0,25.0,5.0,0],"p1Units":[[],[],[],[],[],[],[]],"p2Stats":[30.0,25.0,5.0,0],"events":{"selfDestruct":[],"breach":[],"damage":[],"shield":[],"move":[],"spawn":[],"death":[],"attack":[],"melee":[]}}"""
         
         state = GameState(json.loads(config), turn_0)
-        if adv:
-            state = AdvancedGameState(json.loads(config), turn_0)
         state.suppress_warnings(True)
         return state
 
-    def test_basic(self, adv=False):
+    def test_basic(self):
         self.assertEqual(True, True, "It's the end of the world as we know it, and I feel fine")
 
-    def test_advanced_game_state(self, adv=False):
-        advanced = self.make_turn_0_map(True)
-        self.assertTrue(isinstance(advanced, GameState))
-        self.assertTrue(isinstance(advanced, AdvancedGameState))
-        for name in sorted(dir(self)):
-            if name.startswith("test") and "advanced" not in name:
-                getattr(self, name)(True)
-
-    def test_simple_fields(self, adv=False):
-        game = self.make_turn_0_map(adv)
+    def test_simple_fields(self):
+        game = self.make_turn_0_map()
         self.assertEqual(5, game.get_resource(game.BITS), "I should have 5 bits")
         self.assertEqual(25, game.get_resource(game.CORES), "I should have 25 cores")
         self.assertEqual(5, game.get_resource(game.BITS, 1), "My opponent should have 5 bits")
@@ -156,8 +169,8 @@ class BasicTests(unittest.TestCase):
         self.assertEqual(30, game.my_health, "My integrity is not working")
         self.assertEqual(30, game.enemy_health, "My opponent has no integrity!")
 
-    def test_spawning(self, adv=False):
-        game = self.make_turn_0_map(adv)
+    def test_spawning(self):
+        game = self.make_turn_0_map()
         self.assertEqual(True, game.attempt_spawn("SI", [[13, 0]]), "We cannot spawn a soldier!")
         self.assertEqual(False, game.attempt_spawn("SI", [[13, 13]]), "We can spawn a soldier in the middle of the map?!?!")
         self.assertEqual(False, game.can_spawn("FF", [14, 14]), "Apparently I can place towers on my opponent's side")
@@ -166,8 +179,139 @@ class BasicTests(unittest.TestCase):
         self.assertEqual([("DF", 13, 6)], game._build_stack, "Build queue is wrong!")
         self.assertEqual([("SI", 13, 0), ("SI", 13, 0), ("SI", 13, 0)], game._deploy_stack, "Deploy queue is wrong!")
 
-    def test_trivial_functions(self, adv=False):
-        game = self.make_turn_0_map(adv)
+    def test_bulk_spawning(self):
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        bits = game.get_resource(game.BITS)
+        self.assertEqual(int(bits), game.attempt_spawn("PI", [13, 0], 1000))
+        self.assertEqual([("PI", 13, 0)] * int(bits), game._deploy_stack)
+        self.assertLess(game.get_resource(game.BITS), 1)
+        self.assertEqual(0, game.attempt_spawn("PI", [14, 0], 1000), "Nothing should be spawned without bits")
+
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        game.attempt_spawn("SI", [13, 0])
+        first = game.game_map[13, 0][0]
+        game.attempt_spawn("PI", [[13, 0], [13, 13], [14, 0]], 2)
+        units = game.game_map[13, 0]
+        forked = game.fork()
+        self.assertIs(first, units[0], "Units read before a stack was added should be kept")
+        self.assertEqual(["SI", "PI", "PI"], [unit.unit_type for unit in units])
+        self.assertEqual([15.0, 15.0], [unit.stability for unit in units[1:]])
+        self.assertEqual([[0, 13, 0]] * 3, [[unit.player_index, unit.x, unit.y] for unit in units])
+        game.game_map.add_units("PI", [14, 0], 2)
+        forked.game_map.add_units("PI", [14, 0], 1)
+        self.assertEqual(4, len(game.game_map[14, 0]))
+        self.assertEqual(3, len(forked.game_map[14, 0]), "Stacks added after a fork should not be shared")
+        self.assertEqual(1, game.attempt_spawn("DF", [13, 6], 3), "Firewalls should not stack")
+
+    def test_checkpoint_rollback(self):
+        game = GameState(self.make_turn_0_map().config, random_turn_string(11, 60))
+        game.suppress_warnings(True)
+
+        def board(game_state):
+            game_map = game_state.game_map
+            return ([[(unit.unit_type, unit.player_index, unit.stability) for unit in game_map[location]] for location in game_map],
+                    bytes(game_map.get_stationary_mask()), [game_map.attacker_count_at(location, 0) for location in game_map],
+                    game_state.find_path_to_edge([13, 0]), list(game_state._build_stack), list(game_state._deploy_stack),
+                    game_state.get_resource(game_state.CORES), game_state.get_resource(game_state.BITS))
+
+        before = board(game)
+        destructor = next(unit for location in game.game_map for unit in game.game_map[location] if unit.unit_type == "DF" and unit.player_index == 0)
+        outer = game.checkpoint()
+        game.attempt_spawn("DF", [[12, 1], [13, 2], [14, 2]])
+        game.attempt_spawn("PI", [13, 0], 3)
+        game.attempt_remove([destructor.x, destructor.y])
+        game.game_map.remove_unit([destructor.x, destructor.y])
+        middle = board(game)
+        inner = game.checkpoint()
+        game.attempt_spawn("FF", [[10, 3], [11, 2]])
+        game.attempt_spawn("PI", [13, 0], 2)
+        forked = game.fork()
+        game.commit(inner)
+        self.assertEqual(3 + 2 + 2, len(game.game_map[13, 0]) + len(game.game_map[10, 3]) + len(game.game_map[11, 2]))
+        inner = game.checkpoint()
+        game.attempt_spawn("EF", [9, 4])
+        game.rollback(inner)
+        self.assertEqual(0, len(game.game_map[9, 4]))
+        game.rollback(outer)
+        self.assertEqual(before, board(game), "Rolling back should restore the map, stacks and resources")
+        self.assertEqual(5, len(forked.game_map[13, 0]), "A fork should keep the changes made before it")
+        self.assertEqual(2, len(forked._deploy_stack) - len(middle[5]))
+
+        game.game_map.add_units("PI", [14, 0], 2)
+        self.assertEqual([], game._checkpoints)
+        outer = game.checkpoint()
+        game.attempt_spawn("DF", [13, 1])
+        game.commit()
+        self.assertEqual(["DF"], [unit.unit_type for unit in game.game_map[13, 1]])
+        game.rollback(outer)
+        self.assertEqual(["DF"], [unit.unit_type for unit in game.game_map[13, 1]], "A committed checkpoint cannot be rolled back")
+
+        destructor = game.game_map[destructor.x, destructor.y][0]
+        token = game.checkpoint()
+        game.game_map.remove_unit([destructor.x, destructor.y])
+        game.rollback(token)
+        self.assertIs(destructor, game.game_map[destructor.x, destructor.y][0], "Rolling back should restore the same units")
+
+    def test_apply_turn(self):
+        config = self.make_turn_0_map().config
+        turn_1 = json.loads(random_turn_string(11, 60, turn_number=1, removals=0))
+        turn_2 = json.loads(json.dumps(turn_1))
+        turn_2["turnInfo"][1] = 2
+        turn_2["p1Stats"][2] = 7.5
+        destroyed = turn_2["p1Units"][2].pop()
+        damaged = turn_2["p1Units"][0][0]
+        damaged[2] -= 1
+        flagged = turn_2["p2Units"][0][0]
+        turn_2["p2Units"][6].append(list(flagged))
+        turn_2["p2Units"][2].append([13, 27, 75.0, "built"])
+        turn_2 = json.dumps(turn_2)
+        turn_1 = json.dumps(turn_1)
+
+        def board(game_state):
+            game_map = game_state.game_map
+            return ([[(unit.unit_type, unit.player_index, unit.stability, unit.pending_removal) for unit in game_map[location]] for location in game_map],
+                    bytes(game_map.get_stationary_mask()), [game_map.attacker_count_at(location, 0) for location in game_map],
+                    game_state.find_path_to_edge([13, 0]), game_state.turn_number, game_state.get_resource(game_state.BITS))
+
+        expected = board(GameState(config, turn_2))
+        for plan_first_turn in [False, True]:
+            game = GameState(config, turn_1)
+            game.suppress_warnings(True)
+            game.apply(turn_1)
+            kept = game.game_map[int(damaged[0]), int(damaged[1])][0]
+            if plan_first_turn:
+                game = GameState(config, turn_1)
+                game.suppress_warnings(True)
+                kept = game.game_map[int(damaged[0]), int(damaged[1])][0]
+            self.assertEqual(0, game.checkpoint(), "apply should not leave a checkpoint open")
+            game.attempt_spawn("DF", [[12, 1], [13, 2]])
+            game.commit()
+            game.commit()
+            token = game.checkpoint()
+            game.attempt_spawn("PI", [13, 0], 2)
+            game.attempt_remove([int(damaged[0]), int(damaged[1])])
+            game.rollback(token)
+            self.assertEqual(["DF", "DF"], [game.game_map[location][0].unit_type for location in [[12, 1], [13, 2]]])
+            self.assertEqual([], game.game_map[13, 0])
+            game.checkpoint()
+            game.attempt_spawn("PI", [13, 0], 2)
+            game.attempt_remove([int(damaged[0]), int(damaged[1])])
+            changes = game.apply(turn_2)
+            self.assertEqual(expected, board(game))
+            self.assertEqual([], game._build_stack + game._deploy_stack)
+            self.assertEqual([[destroyed[:2]], []], [[[unit.x, unit.y] for unit in units] for units in changes.removed])
+            self.assertEqual([[], [[13, 27]]], [[[unit.x, unit.y] for unit in units] for units in changes.added])
+            self.assertEqual([[(damaged[:2], 1.0)], []], [[([unit.x, unit.y], lost) for unit, lost in units] for units in changes.damaged])
+            self.assertEqual([[], [flagged[:2]]], [[[unit.x, unit.y] for unit in units] for units in changes.pending_removal])
+            self.assertEqual(sorted([destroyed[:2], [13, 27], damaged[:2], flagged[:2]]), changes.locations())
+            self.assertIs(kept, game.game_map[int(damaged[0]), int(damaged[1])][0], "Unchanged units should be kept")
+            self.assertFalse(game.apply(turn_2), "Nothing changes between two identical turns")
+            self.assertEqual(expected, board(game))
+
+    def test_trivial_functions(self):
+        game = self.make_turn_0_map()
 
         #Distance Between locations
         self.assertEqual(1, game.game_map.distance_between_locations([0, 0], [0,-1]), "The distance between 0,0 and 0,-1 should be 1")
@@ -176,8 +320,8 @@ class BasicTests(unittest.TestCase):
         self.assertEqual(0, len(game.game_map.get_locations_in_range([-500,-500], 10)), "Invalid tiles are being marked as in range")
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "A location should be in range of itself")
     
-    def test_get_units(self, adv=False):
-        game = self.make_turn_0_map(adv)
+    def test_get_units(self):
+        game = self.make_turn_0_map()
         self.assertEqual(0, len(game.game_map[13,13]), "There should not be a unit on this location")
         for _ in range(3):
             game.game_map.add_unit("EI", [13,13])
@@ -186,13 +330,614 @@ class BasicTests(unittest.TestCase):
             game.game_map.add_unit("FF", [13,13])
         self.assertEqual(1, len(game.game_map[13,13]), "Towers seem to be stacking")
         
-    def test_get_units_in_range(self, adv=False):
-        game = self.make_turn_0_map(adv)
+    def test_get_units_in_range(self):
+        game = self.make_turn_0_map()
         self.assertEqual(1, len(game.game_map.get_locations_in_range([13,13], 0)), "We should be in 0 range of ourself")
         self.assertEqual(37, len(game.game_map.get_locations_in_range([13,13], 3)), "Wrong number of tiles in range")
 
-    def _test_get_attackers(self):
-        game = self.make_turn_0_map(True)
+    def test_geometry_tables(self):
+        game = self.make_turn_0_map()
+        game_map = game.game_map
+        for radius in [0, 1, 2.5, 3, 3.5, 4.5, 5]:
+            for location in game_map:
+                x, y = location
+                expected = [[i, j] for i in range(int(x - radius), int(x + radius + 1)) for j in range(int(y - radius), int(y + radius + 1))
+                            if game_map.in_arena_bounds([i, j]) and game_map.distance_between_locations(location, [i, j]) < radius + 0.51]
+                self.assertEqual(expected, game_map.get_locations_in_range(location, radius), "Wrong locations in range {} of {}".format(radius, location))
+        self.assertEqual(420, len(list(game_map)), "The arena should hold 420 locations")
+        self.assertTrue(game_map.in_arena_bounds([13.5, 0]), "Non integer locations inside the board should be in bounds")
+        self.assertFalse(game_map.in_arena_bounds([28, 13]), "Locations past the board should be out of bounds")
+        self.assertTrue(game.can_spawn("PI", [0, 13]), "The bottom left edge should be a spawn location")
+        self.assertFalse(game.can_spawn("PI", [13, 13]), "The middle of the board should not be a spawn location")
+        self.assertTrue(game_map.is_on_edge([27, 14], game_map.TOP_RIGHT), "[27, 14] is on the top right edge")
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_board_arrays(self):
+        game = self.make_turn_0_map()
+        turn = """{"p2Units":[[[13,14,60.0,"1"]],[],[[14,14,50.0,"2"],[10,15,75.0,"3"]],[],[],[],[]],"turnInfo":[0,3,-1],"p1Stats":[30.0,25.0,5.0,0],"p1Units":[[[13,13,60.0,"4"]],[[12,12,30.0,"5"]],[],[[14,0,15.0,"6"],[14,0,15.0,"7"]],[],[],[[13,13,0.0,"8"]]],"p2Stats":[30.0,25.0,5.0,0],"events":{}}"""
+        game = GameState(game.config, turn)
+        game.suppress_warnings(True)
+        board = game.board_arrays
+        self.assertEqual(2, board.count(player_index=0), "I should have 2 firewalls")
+        self.assertEqual(2, board.count("DF", 1), "My opponent should have 2 destructors")
+        self.assertEqual(2, board.count(player_index=1, region=board.region(valid_y=[14])), "My opponent should have 2 firewalls on row 14")
+        self.assertEqual(125.0, board.stability_sum("DF"), "Destructor stability should sum to 125")
+        self.assertTrue(board.pending_removal[13, 13], "[13, 13] should be pending removal")
+        self.assertEqual(2, board.information_count[0, 14, 0], "I should have 2 pings at [14, 0]")
+        game.game_map.remove_unit([14, 14])
+        game.attempt_spawn("FF", [5, 10])
+        game.attempt_spawn("PI", [13, 0], 2)
+        self.assertEqual(1, board.count("DF", 1), "The view should see removed units")
+        self.assertEqual(3, board.count(player_index=0), "The view should see spawned units")
+        self.assertEqual(2, board.information_count[0, 13, 0], "The view should see spawned information units")
+        rebuilt = BoardArrays(game.game_map)
+        for layer in ["unit_type", "owner", "stability", "pending_removal", "information_count"]:
+            self.assertTrue((getattr(rebuilt, layer) == getattr(board, layer)).all(), "Layer {} is out of sync".format(layer))
+
+    def test_lazy_parse(self):
+        config = self.make_turn_0_map().config
+        turn_string = random_turn_string(5, 120)
+        state = json.loads(turn_string)
+        game = GameState(config, turn_string)
+        game.suppress_warnings(True)
+        for location in game.game_map:
+            for player_index in range(2):
+                self.assertEqual(len(game.get_attackers(location, player_index)), game.game_map.attacker_count_at(location, player_index), "Threat of parsed destructors is wrong at {}".format(location))
+        expected_units = 0
+        for player_index, units in enumerate([state["p1Units"], state["p2Units"]]):
+            for type_index, unit_list in enumerate(units[:6]):
+                for x, y, stability, _ in unit_list:
+                    expected_units += 1
+                    unit = game.game_map[x, y][0]
+                    self.assertEqual(config["unitInformation"][type_index]["shorthand"], unit.unit_type, "Wrong unit type at {}".format([x, y]))
+                    self.assertEqual(player_index, unit.player_index, "Wrong owner at {}".format([x, y]))
+                    self.assertEqual(stability, unit.stability, "Wrong stability at {}".format([x, y]))
+                    self.assertEqual([x, y], [unit.x, unit.y], "Wrong unit location")
+            for x, y, _, _ in units[6]:
+                self.assertTrue(game.game_map[x, y][0].pending_removal, "{} should be pending removal".format([x, y]))
+        self.assertEqual(expected_units, sum(len(game.game_map[location]) for location in game.game_map), "Wrong number of units")
+
+    def test_fork(self):
+        config = self.make_turn_0_map().config
+        turn_string = random_turn_string(7, 80)
+        removed = json.loads(turn_string)["p1Units"][2][0][:2]
+        game = GameState(config, turn_string)
+        game.suppress_warnings(True)
+        touched = game.game_map[removed]
+        fork = game.fork()
+        fork.suppress_warnings(True)
+        self.assertIs(config, fork.config)
+        self.assertIsNot(touched[0], fork.game_map[removed][0], "A fork should get its own copies of units already read")
+        game.fork()
+        self.assertIs(touched, game.game_map[removed], "Forking should not replace the original's units")
+        self.assertTrue(fork.attempt_spawn("PI", [13, 0], 2))
+        self.assertEqual([], game._deploy_stack, "Deploying on a fork should not change the original")
+        self.assertNotEqual(game.get_resource(game.BITS), fork.get_resource(game.BITS))
+
+        fork.game_map.remove_unit(removed)
+        fork.game_map.add_unit("DF", [13, 13], 0)
+        self.assertEqual(["DF"], [unit.unit_type for unit in game.game_map[removed]], "Changing a fork should not change the original map")
+        self.assertIs(touched[0], game.game_map[removed][0], "Forking should not replace the original's units")
+        self.assertEqual([], fork.game_map[removed])
+        self.assertEqual([], game.game_map[13, 13])
+        original = GameState(config, turn_string)
+        edited = GameState(config, turn_string)
+        edited.game_map.remove_unit(removed)
+        edited.game_map.add_unit("DF", [13, 13], 0)
+        for location in game.game_map:
+            self.assertEqual(original.game_map.attacker_count_at(location, 1), game.game_map.attacker_count_at(location, 1), "Original threat changed at {}".format(location))
+            self.assertEqual(edited.game_map.attacker_count_at(location, 1), fork.game_map.attacker_count_at(location, 1), "Fork threat is wrong at {}".format(location))
+
+        for location in game.game_map:
+            for unit in game.game_map[location]:
+                unit.stability = -1
+            self.assertNotIn(-1, [unit.stability for unit in fork.game_map[location]],
+                             "Fork units should not change with the original at {}".format(location))
+
+    def test_simulator(self):
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        game.attempt_spawn("PI", [13, 0], 5)
+        result = ActionSimulator(game).simulate()
+        self.assertEqual([5, 0], result.breaches, "Pings on an empty board should all breach")
+        self.assertEqual([5.0, 0.0], result.health_damage)
+        self.assertEqual(2 * (len(game.find_path_to_edge([13, 0])) - 1), result.frames, "Pings should move every other frame")
+
+        # A ping picks the weaker of two enemy firewalls at the same distance, like get_target
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        game.game_map.add_unit("FF", [12, 2], 1, 20.0)
+        game.game_map.add_unit("FF", [14, 2], 1, 10.0)
+        ping = GameUnit("PI", game.config, 0, None, 13, 0)
+        self.assertEqual([14, 2], [game.get_target(ping).x, game.get_target(ping).y])
+        simulator = ActionSimulator(game)
+        simulator.simulate([("PI", [13, 0], 1, 0)], max_frames=1)
+        self.assertEqual((20.0, 9.0), (simulator.firewall_stability([12, 2]), simulator.firewall_stability([14, 2])))
+
+        # Emps break a filter blocking the way and path through the gap
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        for x in range(28):
+            if game.game_map.in_arena_bounds([x, 14]):
+                game.game_map.add_unit("FF", [x, 14], 1, 60.0 if x != 27 else 5.0)
+        simulator = ActionSimulator(game)
+        result = simulator.simulate([("EI", [13, 0], 2, 0)])
+        self.assertIn([27, 14], result.structures_destroyed[0])
+        self.assertEqual(2, result.breaches[0], "Emps should path through the broken wall")
+        self.assertEqual(0, simulator.firewall_stability([27, 14]))
+        self.assertEqual(result.breaches, simulator.simulate([("EI", [13, 0], 2, 0)]).breaches, "Simulations should not change the board")
+
+    def test_worker_pool(self):
+        config = self.make_turn_0_map().config
+        game = GameState(config, random_turn_string(11, 60))
+        game.suppress_warnings(True)
+        game.attempt_spawn("FF", [13, 3])
+        game.attempt_spawn("PI", [14, 0], 3)
+        candidates = [("PI", location, 4) for location in game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT)] + [("EI", [13, 0], "bad count")]
+        serial = WorkerPool(config, processes=0).map_candidates(game, candidates, score_candidate)
+        self.assertIsNone(serial[-1], "A failing scorer should give None")
+        self.assertEqual(3, len(game._deploy_stack), "Scoring should not change the game state")
+
+        pool = WorkerPool(config, processes=2)
+        try:
+            self.assertEqual(serial, pool.map_candidates(game, candidates, score_candidate))
+            game.attempt_spawn("PI", [14, 0], 2)
+            self.assertEqual(WorkerPool(config, processes=0).map_candidates(game, candidates, score_candidate),
+                             pool.map_candidates(game, candidates, score_candidate), "Workers should see the changed board")
+        finally:
+            pool.close()
+
+        pool = WorkerPool(config, processes=2)
+        try:
+            def nested_scorer(game_state, candidate):
+                return candidate
+            self.assertEqual([1, 2], pool.map_candidates(game, [1, 2], nested_scorer), "A scorer that cannot be pickled should run here")
+            self.assertEqual([None, 2], pool.map_candidates(game, [1, 2], unpicklable_score), "A score that cannot be pickled should be None")
+            parent = os.getpid()
+            self.assertEqual([1, 2, 3], pool.map_candidates(game, [(parent, 1), (parent, 2), (parent, 3)], exit_in_worker),
+                             "The candidates of a worker that died should be scored here")
+        finally:
+            pool.close()
+
+        pool = WorkerPool(config, processes=1)
+        budget = TurnBudget(0.2)
+        try:
+            with redirect_stdout(io.StringIO()):
+                budget.start_watchdog()
+                start = time.perf_counter()
+                self.assertEqual([None], pool.map_candidates(game, [5], sleep_scorer), "Candidates not scored in time should be None")
+                self.assertLess(time.perf_counter() - start, 2)
+        finally:
+            budget.stop_watchdog()
+            pool.close()
+
+    def test_turn_budget(self):
+        game = self.make_turn_0_map()
+        game.suppress_warnings(True)
+        game.attempt_spawn("FF", [13, 3])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            budget = TurnBudget(0.05)
+            budget.set_best(game)
+            game.attempt_spawn("FF", [14, 3])
+            budget.start_watchdog()
+            self.assertIs(budget, active_budget())
+            while not budget.submitted and budget.elapsed() < 5:
+                time.sleep(0.01)
+            self.assertTrue(budget.timed_out, "The watchdog should submit once the deadline passes")
+            game.submit_turn()
+            budget.stop_watchdog()
+        self.assertIsNone(active_budget())
+        self.assertEqual([json.dumps([("FF", 13, 3)]), "[]"], output.getvalue().splitlines(), "Only the registered plan should be sent")
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            budget = TurnBudget(60)
+            budget.start_watchdog()
+            self.assertGreater(budget.remaining(), 59)
+            game.submit_turn()
+            game.submit_turn()
+            budget.stop_watchdog()
+        self.assertFalse(budget.timed_out)
+        self.assertEqual([json.dumps([("FF", 13, 3), ("FF", 14, 3)]), "[]"], output.getvalue().splitlines(), "A turn should be sent once")
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            budget = TurnBudget(0.02)
+            budget.start_watchdog()
+            time.sleep(0.1)
+            self.assertFalse(budget.submitted, "Without a registered plan the watchdog should not submit")
+            self.assertFalse(budget.submit_best())
+            game.submit_turn()
+            budget.stop_watchdog()
+        self.assertEqual([json.dumps([("FF", 13, 3), ("FF", 14, 3)]), "[]"], output.getvalue().splitlines(), "A late turn should still be sent")
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            budget = TurnBudget(0.05)
+            budget.start_watchdog()
+            budget.set_best(game)
+            while not budget.submitted and budget.elapsed() < 5:
+                time.sleep(0.01)
+            budget.stop_watchdog()
+        self.assertTrue(budget.timed_out, "Registering a plan after the watchdog started should arm it")
+
+    def test_classify_message(self):
+        game = self.make_turn_0_map()
+        self.assertEqual(CONFIG_MESSAGE, classify_message(json.dumps(game.config)))
+        self.assertEqual(TURN_MESSAGE, classify_message(game.serialized_string))
+        self.assertEqual(ACTION_FRAME_MESSAGE, classify_message('{"p1Units":[],"turnInfo": [ 1 ,3,7],"events":{}}'))
+        self.assertEqual(END_MESSAGE, classify_message('{"turnInfo":[2.0,3,-1]}'))
+        self.assertEqual(UNKNOWN_MESSAGE, classify_message("hello"))
+        self.assertEqual(UNKNOWN_MESSAGE, classify_message('{"turnInfo":["x"]}'))
+
+    def test_dispatch(self):
+        game = self.make_turn_0_map()
+        frame = game.serialized_string.replace('"turnInfo":[0,0,-1]', '"turnInfo":[1,0,3]')
+        lines = [json.dumps(game.config), frame, game.serialized_string, frame, '{"turnInfo":[2,0,-1]}']
+
+        class Recorder(AlgoCore):
+            def __init__(self):
+                super().__init__()
+                self.calls = []
+
+            def on_turn(self, turn_string, parsed_state):
+                self.calls.append(("turn", parsed_state["turnInfo"][0]))
+                GameState(self.config, turn_string, parsed_state).submit_turn()
+
+            def on_action_frame(self, turn_string):
+                self.calls.append(("frame", turn_string))
+
+        class Unsubscribed(AlgoCore):
+            def on_turn(self, turn_string):
+                GameState(self.config, turn_string).submit_turn()
+
+        stdin = sys.stdin
+        try:
+            output = io.StringIO()
+            with redirect_stdout(output):
+                sys.stdin = io.StringIO("\n".join(lines) + "\n")
+                algo = Recorder()
+                algo.start()
+                sys.stdin = io.StringIO("\n".join(lines) + "\n")
+                Unsubscribed().start()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(game.config, algo.config)
+        self.assertEqual([("frame", frame + "\n"), ("turn", 0), ("frame", frame + "\n")], algo.calls)
+        self.assertEqual(["[]", "[]", "[]", "[]"], output.getvalue().splitlines())
+
+    def test_speculation(self):
+        game = self.make_turn_0_map()
+        state = json.loads(game.serialized_string)
+        state["p1Units"][0].append([13, 3, 60.0, "1"])
+        state["p2Units"][2].append([13, 20, 75.0, "2"])
+        state["p2Units"][6].append([13, 20, 0.0, "3"])
+        frame = dict(state, turnInfo=[1, 0, 7])
+        turn = dict(state, turnInfo=[0, 1, -1], p2Units=[[], [], [], [], [], [], []])
+
+        def planner(game_state):
+            game_state.attempt_spawn("FF", [14, 3])
+            return len(game_state.game_map[13, 3])
+
+        speculator = Speculator(game.config, planner)
+        try:
+            speculator.offer(json.dumps(frame))
+            speculation = speculator.collect(turn, 5)
+            self.assertIsNotNone(speculation, "Removed firewalls should not invalidate the plan")
+            self.assertEqual((1, 7), (speculation.result, speculation.frame))
+            self.assertFalse(speculation.game_state.contains_stationary_unit([14, 3]), "The planner should get a fork")
+            speculator.offer(json.dumps(frame))
+            self.assertIsNone(speculator.collect(dict(turn, p1Units=[[], [], [], [], [], [], []]), 5), "A changed board should invalidate the plan")
+            self.assertIsNone(speculator.collect(turn), "A plan should only be handed out once")
+        finally:
+            speculator.close()
+
+        started = threading.Event()
+        stopped = threading.Event()
+        def slow_planner(game_state):
+            started.set()
+            deadline = time.perf_counter() + 5
+            while not speculation_cancelled() and time.perf_counter() < deadline:
+                time.sleep(0.001)
+            stopped.set()
+
+        speculator = Speculator(game.config, slow_planner)
+        try:
+            speculator.offer(json.dumps(frame))
+            self.assertTrue(started.wait(5))
+            self.assertFalse(speculation_cancelled(), "Only planner threads are cancelled")
+            self.assertIsNone(speculator.collect(turn, 0.01))
+            self.assertTrue(stopped.wait(1), "Collecting should cancel a plan still being made")
+        finally:
+            speculator.close()
+
+        # The unit type globals are read by the main thread while planner threads make game states
+        unit_types = game_state_module.UNIT_TYPE_TO_INDEX
+        GameState(game.config, json.dumps(frame))
+        self.assertIs(unit_types, game_state_module.UNIT_TYPE_TO_INDEX, "Making a game state should not rebuild the unit types")
+
+        class Speculating(AlgoCore):
+            def speculate(self, game_state):
+                return game_state.turn_number
+
+            def on_turn(self, turn_string):
+                results.append(self.speculation and self.speculation.result)
+                self.submit_default_turn()
+
+        results = []
+        lines = [json.dumps(game.config), json.dumps(frame), json.dumps(turn), '{"turnInfo":[2,1,-1]}']
+        stdin = sys.stdin
+        try:
+            with redirect_stdout(io.StringIO()):
+                sys.stdin = io.StringIO("\n".join(lines) + "\n")
+                Speculating().start()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual([0], results)
+
+    def test_frame_tracker(self):
+        game = self.make_turn_0_map()
+        game.game_map.add_unit("DF", [13, 13], 0)
+        game.game_map.add_unit("FF", [14, 14], 1)
+        game.game_map.add_unit("FF", [13, 14], 1)
+        game.game_map[13, 14][0].pending_removal = True
+        tracker = FrameTracker(game)
+
+        def frame(number, **events):
+            return {"turnInfo": [1, 0, number], "events": dict({name: [] for name in ["spawn", "death", "damage", "shield", "move", "breach"]}, **events)}
+
+        tracker.update(json.dumps(frame(0, spawn=[[[12, 1], 2, "7", 1], [[13, 0], 3, "8", 1], [[14, 27], 3, "9", 2]])))
+        tracker.update(frame(1, move=[[[13, 0], [13, 1], [], 3, "8", 1]], shield=[[[12, 1], [13, 1], 3.0, 1, "5", "8", 1]],
+                             damage=[[[14, 14], 40.0, 0, "3", 2], [[13, 1], 2.0, 3, "8", 1]]))
+        self.assertEqual([3, 0, 13, 1, 16.0], tracker.information_units["8"])
+        self.assertEqual(20.0, tracker.stability[14 * 28 + 14])
+        tracker.update(frame(2, death=[[[14, 14], 0, "3", 2, False], [[13, 1], 3, "8", 1, False], [[13, 14], 0, "4", 2, True]],
+                             breach=[[[13, 0], 1.0, 3, "9", 2]]))
+        self.assertEqual(2, tracker.frame)
+        self.assertEqual([[13, 1]], tracker.death_locations("PI", 0))
+        self.assertEqual([[14, 14]], [[death.x, death.y] for death in tracker.destroyed_firewalls(1)])
+        self.assertEqual([[14, 14], [13, 14]], tracker.death_locations("FF", include_removed=True))
+        self.assertEqual(1, len(tracker.breaches))
+        self.assertEqual(["9"], list(tracker.information_units))
+
+        prediction = tracker.predict_game_state()
+        self.assertTrue(prediction.contains_stationary_unit([12, 1]))
+        self.assertTrue(prediction.contains_stationary_unit([13, 13]))
+        self.assertFalse(prediction.contains_stationary_unit([14, 14]))
+        self.assertFalse(prediction.contains_stationary_unit([13, 14]))
+        self.assertTrue(game.contains_stationary_unit([14, 14]), "The tracked game state should not change")
+
+    def test_instrumentation(self):
+        game = self.make_turn_0_map()
+        turn_1 = game.serialized_string.replace('"turnInfo":[0,0,-1]', '"turnInfo":[0,1,-1]')
+        lines = [json.dumps(game.config), game.serialized_string, turn_1, '{"turnInfo":[2,1,-1]}']
+        original = GameState.get_attackers
+
+        class Instrumented(AlgoCore):
+            def get_instrumentation_output(self):
+                return output
+
+            def on_turn(self, turn_string):
+                game_state = GameState(self.config, turn_string)
+                with instrument.span("plan"):
+                    game_state.find_path_to_edge([13, 0])
+                    game_state.get_attackers([13, 13], 0)
+                    game_state.attempt_spawn("FF", [13, 3])
+                instrument.count("plans", 2)
+                game_state.submit_turn()
+
+        stdin = sys.stdin
+        try:
+            for output in [None, io.StringIO()]:
+                with redirect_stdout(io.StringIO()):
+                    sys.stdin = io.StringIO("\n".join(lines) + "\n")
+                    Instrumented().start()
+        finally:
+            sys.stdin = stdin
+        self.assertIs(original, GameState.get_attackers, "The entry points should be put back once the game ends")
+        self.assertIsNone(instrument.active_instrumentation())
+        self.assertIs(instrument.span("plan"), instrument.span("other"), "Spans should do nothing while instrumentation is off")
+
+        summaries = [dict(part.split("=") for part in line.split(" ")) for line in output.getvalue().splitlines()]
+        self.assertEqual(["0", "1"], [summary["turn"] for summary in summaries])
+        for summary in summaries:
+            self.assertEqual("1", summary["parse"].split("/")[0])
+            self.assertEqual("1", summary["plan"].split("/")[0])
+            self.assertEqual("1", summary["find_path_to_edge"].split("/")[0])
+            self.assertEqual("1", summary["navigate_multiple_endpoints"].split("/")[0])
+            self.assertEqual("2/0.000/0.000", summary["plans"])
+            calls, total, own = summary["plan"].split("/")
+            self.assertLess(float(own), float(total), "Entry points called in a span should not count towards its self time")
+            self.assertGreaterEqual(float(summary["ms"]), float(total))
+
+    def test_recorder(self):
+        game = self.make_turn_0_map()
+        frame = game.serialized_string.replace('"turnInfo":[0,0,-1]', '"turnInfo":[1,0,3]')
+        turn_1 = game.serialized_string.replace('"turnInfo":[0,0,-1]', '"turnInfo":[0,1,-1]')
+        lines = [json.dumps(game.config), game.serialized_string, frame, turn_1, '{"turnInfo":[2,1,-1]}']
+
+        class Recording(AlgoCore):
+            def get_recording_path(self):
+                return path
+
+            def on_turn(self, turn_string):
+                game_state = GameState(self.config, turn_string)
+                game_state.attempt_spawn("FF", [13, 3])
+                game_state.submit_turn()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.rec")
+            stdin = sys.stdin
+            try:
+                with redirect_stdout(io.StringIO()):
+                    sys.stdin = io.StringIO("\n".join(lines) + "\n")
+                    Recording().start()
+            finally:
+                sys.stdin = stdin
+            recording = GameRecording(path)
+            self.assertEqual("zlib", recording.codec)
+            self.assertEqual([0, 1], recording.turns())
+            self.assertEqual(lines, recording.received())
+            self.assertEqual([(RECEIVED, turn_1), (SENT, json.dumps([["FF", 13, 3]])), (SENT, "[]"), (RECEIVED, lines[-1])], recording.read_block(1))
+            self.assertEqual([(RECEIVED, lines[0])], recording.read_block(CONFIG_BLOCK))
+
+            for codec in ["zlib", "lzma"]:
+                recorder = GameRecorder(path, codec)
+                for line in lines[:3]:
+                    recorder.record_received(line)
+                recorder.close()
+                with open(path, "rb") as file:
+                    data = file.read()
+                with open(path, "wb") as file:
+                    # Leaves out the index of the config and turn 0 blocks, as if the algo had crashed
+                    file.write(data[:-(2 * 12 + 16)])
+                recording = GameRecording(path)
+                self.assertEqual(codec, recording.codec)
+                self.assertEqual(lines[:3], recording.received())
+
+    def test_bench(self):
+        game = self.make_turn_0_map()
+        turn_1 = game.serialized_string.replace('"turnInfo":[0,0,-1]', '"turnInfo":[0,1,-1]')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "game.rec")
+            recorder = GameRecorder(path)
+            for line in [json.dumps(game.config), game.serialized_string, turn_1]:
+                recorder.record_received(line)
+            recorder.close()
+            boards = fixture_boards(GameRecording(path))
+        self.assertEqual([name for name, _, _, _ in FIXTURES] + ["recorded turn 0", "recorded turn 1"], [name for name, _, _ in boards])
+        self.assertEqual(turn_1, boards[-1][2])
+
+        results = BenchResults(1, "[recorded turn 1]", io.StringIO())
+        bench_boards(results, boards)
+        self.assertEqual(["GameState.__init__", "can_spawn", "attempt_spawn", "get_locations_in_range", "get_attackers", "get_target", "navigate_multiple_endpoints"],
+                         [name.split(" ")[0] for name in results.ops_per_sec])
+        self.assertTrue(all(ops > 0 for ops in results.ops_per_sec.values()))
+
+        baseline = {"ops_per_sec": {"a": 100.0, "b": 100.0}}
+        self.assertEqual(["b"], compare({"a": 90.0, "b": 80.0, "c": 1.0}, baseline, 0.15, io.StringIO()))
+
+    def test_replay(self):
+        game = self.make_turn_0_map()
+        turn_1 = game.serialized_string.replace('"turnInfo":[0,0,-1]', '"turnInfo":[0,1,-1]')
+
+        class Spawning(AlgoCore):
+            def on_turn(self, turn_string, parsed_state):
+                game_state = GameState(self.config, turn_string, parsed_state)
+                game_state.attempt_spawn("FF", [random.randint(10, 17), 3])
+                game_state.submit_turn()
+
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = GameRecorder(os.path.join(directory, "game.rec"))
+            recorder.record_received(json.dumps(game.config))
+            for turn_string in [game.serialized_string, turn_1]:
+                recorder.record_received(turn_string)
+                recorder.record_sent(json.dumps([["FF", 13, 3]]))
+                recorder.record_sent("[]")
+            recorder.close()
+            recording = GameRecording(recorder.path)
+
+            results = replay(recording, Spawning, profile_turns=[1], seed=4)
+            self.assertEqual([0, 1], [result.turn_number for result in results])
+            self.assertEqual([2, 2], [len(result.commands) for result in results])
+            self.assertEqual([result.commands for result in results], [result.commands for result in replay(recording, Spawning, seed=4)],
+                             "Replays with the same seed should send the same commands")
+            self.assertIsNone(results[0].profile)
+            self.assertIsNotNone(results[1].profile)
+            self.assertEqual(slowest(results, 2)[0].seconds, max(result.seconds for result in results))
+
+            class Recorded(AlgoCore):
+                def on_turn(self, turn_string):
+                    game_state = GameState(self.config, turn_string)
+                    game_state.attempt_spawn("FF", [13, 3])
+                    game_state.submit_turn()
+
+            self.assertEqual([True, True], [result.matches for result in replay(recording, Recorded)])
+            self.assertEqual([False, False], [result.matches for result in replay(recording, AlgoCore)])
+
+    def test_local_engine(self):
+        strategy = """
+import sys
+sys.path.insert(0, {path!r})
+import gamelib
+
+class Strategy(gamelib.AlgoCore):
+    def on_turn(self, turn_string):
+        game_state = gamelib.GameState(self.config, turn_string)
+        game_state.suppress_warnings(True)
+        game_state.attempt_spawn("DF", [[3, 12], [24, 12], [10, 11], [17, 11]])
+        {attack}
+        game_state.submit_turn()
+{frames}
+if __name__ == "__main__":
+    Strategy().start()
+"""
+        frames = """
+    def on_action_frame(self, turn_string, parsed_state):
+        if parsed_state["events"]["breach"]:
+            gamelib.debug_write("breach")
+"""
+        path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as directory:
+            algo_dirs = [os.path.join(directory, name) for name in ["pings", "walls"]]
+            attacks = ['game_state.attempt_spawn("PI", [13, 0], 100)', "pass"]
+            for algo_dir, attack, on_action_frame in zip(algo_dirs, attacks, [frames, "# def on_action_frame(self, turn_string):\n"]):
+                os.mkdir(algo_dir)
+                with open(os.path.join(algo_dir, "algo_strategy.py"), "w") as file:
+                    file.write(strategy.format(path=path, attack=attack, frames=on_action_frame))
+            self.assertEqual([True, False], [subscribes_to_frames(algo_dir) for algo_dir in algo_dirs],
+                             "Only real overrides of on_action_frame should subscribe to frames")
+            declared = os.path.join(directory, "declared")
+            os.mkdir(declared)
+            with open(os.path.join(declared, "algo_strategy.py"), "w") as file:
+                file.write(strategy.format(path=path, attack="pass", frames=frames))
+            with open(os.path.join(declared, "algo.json"), "w") as file:
+                json.dump({"language": "python", "actionFrames": False}, file)
+            self.assertFalse(subscribes_to_frames(declared), "algo.json should be able to turn frames off")
+            game_config = self.make_turn_0_map().config
+            with open(os.path.join(directory, "debug.txt"), "w+") as debug:
+                engine = LocalEngine(algo_dirs, game_config, max_turns=30, stderr=debug)
+                result = engine.play()
+                debug.seek(0)
+                output = debug.read()
+        self.assertEqual(0, result.winner, "Pings against no attackers should win, {}".format(output))
+        self.assertEqual("health", result.reason)
+        self.assertLessEqual(result.health[0], game_config["resources"]["startingHP"])
+        self.assertEqual(0.0, result.health[1], "Health should stop at 0")
+        self.assertEqual([result.turns, result.turns], [len(latencies) for latencies in result.latencies])
+        self.assertIn("breach", output, "The algo overriding on_action_frame should get frames with breach events")
+        self.assertNotIn("Traceback", output)
+
+    def test_tournament(self):
+        with tempfile.TemporaryDirectory() as directory:
+            zip_path = os.path.join(directory, "walls.zip")
+            with zipfile.ZipFile(zip_path, "w") as archive:
+                archive.writestr("walls/algo_strategy.py", "")
+            work_dir = os.path.join(directory, "work")
+            name, digest, algo_dir = tournament.unpack(zip_path, work_dir)
+            self.assertEqual("walls", name)
+            self.assertEqual(os.path.join(work_dir, "walls", "walls"), algo_dir)
+            marker = os.path.join(algo_dir, "marker")
+            open(marker, "w").close()
+            tournament.unpack(zip_path, work_dir)
+            self.assertTrue(os.path.exists(marker), "An unchanged zip should not be unpacked again")
+
+        algos = [("a", "1" * 64, "a"), ("b", "2" * 64, "b"), ("c", "3" * 64, "c")]
+        matches = tournament.schedule(algos, 2)
+        self.assertEqual(6, len(matches))
+        self.assertEqual(len(matches), len({match_id for match_id, _, _ in matches}))
+        self.assertEqual(("a", "b"), (matches[0][1][0], matches[0][2][0]))
+        self.assertEqual(("b", "a"), (matches[1][1][0], matches[1][2][0]), "Sides should alternate")
+
+        results = [{"match": matches[0][0], "winner": 0, "latency_ms": [[1.0, 3.0], [2.0]]},
+                   {"match": matches[1][0], "winner": None, "latency_ms": [[4.0], [5.0]]}]
+        rows = tournament.standings(results)
+        self.assertEqual([("a", 2, 1, 1, [1.0, 3.0, 5.0]), ("b", 2, 0, 1, [2.0, 4.0])], rows)
+        self.assertEqual(3.0, tournament.percentile([1.0, 3.0, 5.0], 0.5))
+
+    def test_get_attackers(self):
+        game = self.make_turn_0_map()
         
         self.assertEqual([], game.get_attackers([13,13], 0), "Are we being attacked by a ghost?")
         game.game_map.add_unit("DF", [12,12], 0)
@@ -206,17 +951,59 @@ class BasicTests(unittest.TestCase):
         game.game_map.add_unit("DF", [13,14], 1)
         game.game_map.add_unit("DF", [14,14], 1)
         self.assertEqual(3, len(game.get_attackers([13,13], 0)), "We should be in danger from 3 places")
+        game.game_map[13, 15].append(GameUnit("DF", game.config, 1, None, 13, 15))
+        game.suppress_warnings(False)
+        warnings = io.StringIO()
+        with redirect_stderr(warnings):
+            self.assertEqual(4, len(game.get_attackers([13,13], 0)), "Scanned locations should see an appended destructor")
+        game.suppress_warnings(True)
+        self.assertIn("threat grid counts 3 but there are 4", warnings.getvalue())
 
-    def test_print_unit(self, adv=False):
-        game = self.make_turn_0_map(adv)
+    def test_threat_grid(self):
+        game = self.make_turn_0_map()
+        rng = random.Random(3)
+        arena = list(game.game_map)
+        for _ in range(300):
+            location = rng.choice(arena)
+            if rng.random() < 0.3:
+                game.game_map.remove_unit(location)
+            else:
+                game.game_map.add_unit(rng.choice(["DF", "DF", "FF", "PI"]), location, rng.randint(0, 1))
+        destructor_info = game.config["unitInformation"][2]
+        for location in arena:
+            for player_index in range(2):
+                # Counted by scanning the cells in range, without the threat grid that get_attackers returns early on
+                attackers = [unit for in_range in game.game_map.get_locations_in_range(location, destructor_info["range"])
+                             for unit in game.game_map[in_range] if unit.unit_type == "DF" and unit.player_index != player_index]
+                self.assertEqual(len(attackers), game.game_map.attacker_count_at(location, player_index), "Threat count is stale at {}".format(location))
+                self.assertEqual(len(attackers) * destructor_info["damage"], game.game_map.damage_at(location, player_index), "Threat damage is stale at {}".format(location))
+                self.assertEqual(len(attackers), len(game.get_attackers(location, player_index)))
+        path = game.find_paths_from_all_edges()[0] or [[13, 0]]
+        self.assertEqual(sum(game.game_map.damage_at(location, 0) for location in path), game.game_map.path_damage(path, 0))
+
+    def test_print_unit(self):
+        game = self.make_turn_0_map()
 
         game.game_map.add_unit("FF", [14,13], 1)
         got_string = str(game.game_map[14,13][0])
         expected_string = "Enemy FF, stability: 60.0 location: [14, 13] "
         self.assertEqual(got_string, expected_string, "Expected {} from print_unit test got {} ".format(expected_string, got_string))
 
-    def test_future_bits(self, adv=False):
-        game = self.make_turn_0_map(adv)
+    def test_unit_stats(self):
+        game = self.make_turn_0_map()
+        first = GameUnit("DF", game.config, 0, None, 3, 12)
+        second = GameUnit("DF", game.config, 1, 20.0, 4, 12)
+        self.assertIs(first.stats, second.stats, "Units of the same type should share their stats")
+        self.assertEqual((4.0, 3.0, 75.0, 3, True, 0), (first.damage, first.range, first.max_stability, first.cost, first.stationary, first.speed))
+        self.assertEqual((75.0, 20.0), (first.stability, second.stability), "Stability should default to max stability")
+        self.assertEqual(10.0, GameUnit("EF", game.config).damage, "Encryptor damage should be its shield amount")
+        ping = GameUnit("PI", game.config)
+        self.assertEqual((False, 0.5, 1.0, 1.0), (ping.stationary, ping.speed, ping.damage_f, ping.damage_i))
+        self.assertFalse(hasattr(ping, "__dict__"), "Units should use slots")
+        self.assertIs(first.stats, GameUnit("DF", json.loads(json.dumps(game.config))).stats, "Equal configs should share their stats")
+
+    def test_future_bits(self):
+        game = self.make_turn_0_map()
 
         self.future_turn_testing_function(game, 8.3, 1)
         self.future_turn_testing_function(game, 10.5, 2)
@@ -239,7 +1026,199 @@ class BasicTests(unittest.TestCase):
         self.future_turn_testing_function(game, 17.9, 19)
         self.future_turn_testing_function(game, 18.9, 20)
 
+    def test_resource_projection(self):
+        game = self.make_turn_0_map()
+        resources = game.config["resources"]
+
+        def reference_bits(bits, turn_number, turns_in_future):
+            # The turn by turn loop project_future_bits used before the projection table
+            for increment in range(1, turns_in_future + 1):
+                current_turn = turn_number + increment
+                bits *= (1 - resources["bitDecayPerRound"])
+                bits += resources["bitsPerRound"] + (current_turn // resources["turnIntervalForBitSchedule"])
+                bits = round(bits, 1)
+            return bits
+
+        rng = random.Random(4)
+        for _ in range(200):
+            game.turn_number = rng.randrange(100)
+            bits = round(rng.uniform(0, 40), rng.choice([1, 3]))
+            turns = rng.randrange(1, 100)
+            self.assertEqual(reference_bits(bits, game.turn_number, turns), game.project_future_bits(turns, 0, bits))
+        self.assertIs(game.resource_projection, GameState(game.config, game.serialized_string).resource_projection)
+
+        game.turn_number = 0
+        for player_index in range(2):
+            bits = game.get_resource(game.BITS, player_index)
+            self.assertEqual(reference_bits(bits, 0, 12), game.bits_at(12, player_index))
+            turn = game.turn_when_affordable("EI", 5, player_index)
+            self.assertGreaterEqual(game.bits_at(turn, player_index), 15)
+            self.assertTrue(all(game.bits_at(earlier, player_index) < 15 for earlier in range(turn)))
+        self.assertEqual(0, game.turn_when_affordable("PI", 1))
+        self.assertIsNone(game.turn_when_affordable("PI", 10000))
+        cores = game.get_resource(game.CORES)
+        self.assertEqual(cores + 3 * resources["coresPerRound"], game.cores_at(3))
+        turn = game.turn_when_affordable("DF", 20)
+        self.assertGreaterEqual(game.cores_at(turn), 60)
+        self.assertLess(game.cores_at(turn - 1), 60)
+
     def future_turn_testing_function(self, game, expected, turns):
         actual = game.project_future_bits(turns)
         self.assertAlmostEqual(actual, expected, 0, "Expected {} power {} turns from now, got {}".format(expected, turns, actual))
 
+    def test_pathfinding_matches_reference(self):
+        game = self.make_turn_0_map()
+        rng = random.Random(1337)
+        arena = list(game.game_map)
+        for board in range(20):
+            game = self.make_turn_0_map()
+            density = rng.choice([0.0, 0.1, 0.3, 0.5, 0.7])
+            for location in arena:
+                if rng.random() < density:
+                    game.game_map.add_unit(rng.choice(["FF", "EF", "DF"]), location, location[1] // 14)
+            bottom_edges = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT) + game.game_map.get_edge_locations(game.game_map.BOTTOM_RIGHT)
+            starts = rng.sample(bottom_edges, 4) + rng.sample(arena, 6)
+            for start in starts:
+                if game.contains_stationary_unit(start):
+                    continue
+                for edge in range(4):
+                    end_points = game.game_map.get_edge_locations(edge)
+                    expected = reference_path(start, end_points, game)
+                    actual = game.find_path_to_edge(start, edge)
+                    self.assertEqual(expected, actual, "Path from {} to edge {} differs on board {}".format(start, edge, board))
+
+    def test_pathing_context_reuses_wall_scan(self):
+        game = self.make_turn_0_map()
+        game.attempt_spawn("FF", [[13, 1], [14, 1]])
+        first = game.find_path_to_edge([13, 0])
+        game.find_path_to_edge([14, 0])
+        game.find_path_to_edge([5, 8])
+        self.assertEqual(1, game._pathing_context.scans, "Walls should only be scanned once for unchanged walls")
+        game.attempt_spawn("PI", [13, 0], 3)
+        game.attempt_remove([13, 1])
+        game.find_path_to_edge([13, 0])
+        self.assertEqual(1, game._pathing_context.scans, "Information units and removals should not invalidate the walls")
+        game.game_map.remove_unit([13, 1])
+        self.assertNotEqual(first, game.find_path_to_edge([13, 0]), "Removing a wall should change the path")
+        self.assertEqual(2, game._pathing_context.scans, "Removing a wall should invalidate the walls")
+        game.game_map.add_unit("FF", [13, 1], 0)
+        self.assertEqual(first, game.find_path_to_edge([13, 0]), "Adding the wall back should restore the path")
+        self.assertEqual(3, game._pathing_context.scans, "Adding a wall should invalidate the walls")
+        x, y = game.find_path_to_edge([5, 8])[1]
+        game.game_map[x, y].append(GameUnit("FF", game.config, 0, None, x, y))
+        self.assertIn([x, y], game.find_path_to_edge([5, 8]), "A wall appended to a location directly is not seen by pathing")
+        game.suppress_warnings(False)
+        warnings = io.StringIO()
+        with redirect_stderr(warnings):
+            self.assertTrue(game.contains_stationary_unit([x, y]))
+        game.suppress_warnings(True)
+        self.assertIn(str([x, y]), warnings.getvalue(), "A wall appended to a location directly should be warned about")
+        game._pathing_context.invalidate()
+        self.assertNotIn([x, y], game.find_path_to_edge([5, 8]), "An invalidated context should see the appended wall")
+
+    def test_paths_from_all_edges(self):
+        rng = random.Random(7)
+        for board in range(15):
+            game = self.make_turn_0_map()
+            density = rng.choice([0.0, 0.2, 0.4, 0.6])
+            for location in game.game_map:
+                if rng.random() < density:
+                    game.game_map.add_unit("FF", location, location[1] // 14)
+            starts = game.game_map.get_edge_locations(game.game_map.BOTTOM_LEFT) + game.game_map.get_edge_locations(game.game_map.BOTTOM_RIGHT)
+            expected = [game.find_path_to_edge(start) for start in starts]
+            self.assertEqual(expected, game.find_paths_from_all_edges(), "Batched paths differ on board {}".format(board))
+            expected = [game.find_path_to_edge(start, game.game_map.TOP_LEFT) for start in starts]
+            self.assertEqual(expected, game.find_paths_from_all_edges(game.game_map.TOP_LEFT), "Batched paths differ on board {}".format(board))
+
+
+def reference_path(start, end_points, game_state):
+    """The original Node based pathfinding, kept to check the array backed pathfinder against"""
+    size = game_state.ARENA_SIZE
+    half = game_state.HALF_ARENA
+    in_bounds = game_state.game_map.in_arena_bounds
+    blocked = [[bool(in_bounds([x, y]) and game_state.contains_stationary_unit([x, y])) for y in range(size)] for x in range(size)]
+    pathlength = [[-1] * size for _ in range(size)]
+    direction = [-1 if end_points[0][0] < half else 1, -1 if end_points[0][1] < half else 1]
+
+    def neighbors(location):
+        x, y = location
+        return [n for n in [[x, y + 1], [x, y - 1], [x + 1, y], [x - 1, y]] if in_bounds(n) and not blocked[n[0]][n[1]]]
+
+    def idealness(location):
+        if location in end_points:
+            return sys.maxsize
+        value = 28 * location[1] if direction[1] == 1 else 28 * (27 - location[1])
+        return value + (location[0] if direction[0] == 1 else 27 - location[0])
+
+    visited = {tuple(start)}
+    queue = [start]
+    best, most_ideal = idealness(start), start
+    while queue:
+        for neighbor in neighbors(queue.pop(0)):
+            if idealness(neighbor) > best:
+                best, most_ideal = idealness(neighbor), neighbor
+            if tuple(neighbor) not in visited:
+                visited.add(tuple(neighbor))
+                queue.append(neighbor)
+
+    queue = list(end_points) if most_ideal in end_points else [most_ideal]
+    for location in queue:
+        pathlength[location[0]][location[1]] = 0
+    while queue:
+        current = queue.pop(0)
+        if blocked[current[0]][current[1]]:
+            continue
+        for neighbor in neighbors(current):
+            if pathlength[neighbor[0]][neighbor[1]] == -1:
+                pathlength[neighbor[0]][neighbor[1]] = pathlength[current[0]][current[1]] + 1
+                queue.append(neighbor)
+
+    def better_direction(prev_tile, new_tile, prev_best, previous_move):
+        if previous_move == 1 and not new_tile[0] == prev_best[0]:
+            return not prev_tile[1] == new_tile[1]
+        if previous_move == 2 and not new_tile[1] == prev_best[1]:
+            return not prev_tile[0] == new_tile[0]
+        if previous_move == 0:
+            return not prev_tile[1] == new_tile[1]
+        if new_tile[1] == prev_best[1]:
+            return new_tile[0] > prev_best[0] if direction[0] == 1 else new_tile[0] < prev_best[0]
+        if new_tile[0] == prev_best[0]:
+            return new_tile[1] > prev_best[1] if direction[1] == 1 else new_tile[1] < prev_best[1]
+        return True
+
+    path = [start]
+    current = start
+    move = 0
+    while not pathlength[current[0]][current[1]] == 0:
+        best_move, best_length = current, pathlength[current[0]][current[1]]
+        for neighbor in neighbors(current):
+            length = pathlength[neighbor[0]][neighbor[1]]
+            if length > best_length or (length == best_length and not better_direction(current, neighbor, best_move, move)):
+                continue
+            best_move, best_length = neighbor, length
+        move = 2 if current[0] == best_move[0] else 1
+        path.append(best_move)
+        current = best_move
+    return path
+
+def unpicklable_score(game_state, candidate):
+    """A WorkerPool scorer whose score for 1 cannot be pickled"""
+    return (lambda: candidate) if candidate == 1 else candidate
+
+def exit_in_worker(game_state, candidate):
+    """A WorkerPool scorer that kills any worker process it runs in"""
+    parent, score = candidate
+    if os.getpid() != parent:
+        os._exit(1)
+    return score
+
+def sleep_scorer(game_state, candidate):
+    """A WorkerPool scorer slower than any test budget"""
+    time.sleep(candidate)
+    return candidate
+
+def score_candidate(game_state, candidate):
+    """A WorkerPool scorer for test_worker_pool"""
+    unit_type, location, num = candidate
+    spawned = game_state.attempt_spawn(unit_type, location, num)
+    return (spawned, len(game_state._deploy_stack), game_state.get_resource(game_state.BITS), ActionSimulator(game_state).simulate().breaches)
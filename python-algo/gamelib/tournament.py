@@ -0,0 +1,231 @@
+"""
+Ranks zipped algos by playing every pair against each other with the local engine. Run from the algo folder with
+
+    python -m gamelib.tournament ../*.zip [--games 2] [--results tournament.jsonl] [--work-dir .tournament]
+
+Each zip is unpacked once into its own folder under the work directory, and only again when the zip changes.
+Matches run in parallel, one per two cores since each match runs two algos, and each result is appended to the
+results file as soon as it is known, one json object per line. Rerunning the same command skips the matches already in the results file, so an
+interrupted tournament picks up where it stopped. A table of win rates and answer latency percentiles is printed
+at the end, from every result in the file.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sys
+import zipfile
+
+from .engine import LocalEngine, DEFAULT_MAX_TURNS
+from .config import DEFAULT_CONFIG
+
+SOURCE_FILE = ".tournament-source"
+
+def file_digest(path):
+    """Hashes a file
+
+    Returns:
+        The hex sha256 of the file's contents
+
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def find_algo_dir(root):
+    """Finds the folder holding algo_strategy.py under an unpacked zip, the shallowest one if there are several
+
+    Returns:
+        The folder, or None if there is no algo_strategy.py
+    """
+    found = None
+    for directory, _, files in os.walk(root):
+        if "algo_strategy.py" in files and (found is None or directory.count(os.sep) < found.count(os.sep)):
+            found = directory
+    return found
+
+def unpack(zip_path, work_dir):
+    """Unpacks a zipped algo into work_dir/<zip name>, unless the same zip was unpacked there before
+
+    The sha256 of the zip is kept in the folder, so a zip is unpacked again only when its contents change.
+
+    Args:
+        * zip_path: The zip file
+        * work_dir: The folder holding every unpacked algo
+
+    Returns:
+        The name of the algo, the sha256 of its zip, and the folder holding its algo_strategy.py
+
+    """
+    name = os.path.splitext(os.path.basename(zip_path))[0]
+    target = os.path.join(work_dir, name)
+    digest = file_digest(zip_path)
+    source_file = os.path.join(target, SOURCE_FILE)
+    if os.path.exists(source_file):
+        with open(source_file) as file:
+            if file.read().strip() == digest:
+                return name, digest, find_algo_dir(target)
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(target)
+    with zipfile.ZipFile(zip_path) as archive:
+        archive.extractall(target)
+    with open(source_file, "w") as file:
+        file.write(digest)
+    return name, digest, find_algo_dir(target)
+
+def schedule(algos, games):
+    """Lists the matches of a round robin, each pair playing games matches with sides alternating
+
+    Args:
+        * algos: A list of (name, digest, algo_dir) tuples as returned by unpack
+        * games: The number of matches each pair plays
+
+    Returns:
+        A list of (match_id, first, second) tuples, where first and second are entries of algos. The match id
+        names both algos and their zip digests, so the matches of a changed zip are played again.
+
+    """
+    matches = []
+    for pair in itertools.combinations(sorted(algos), 2):
+        for game in range(games):
+            first, second = pair if game % 2 == 0 else pair[::-1]
+            match_id = "{}@{}|{}@{}|{}".format(first[0], first[1][:12], second[0], second[1][:12], game)
+            matches.append((match_id, first, second))
+    return matches
+
+def play_match(match_id, first_dir, second_dir, config, max_turns):
+    """Plays one match, run in a worker process
+
+    Returns:
+        A json compatible dict of the result
+    """
+    result = LocalEngine([first_dir, second_dir], config, max_turns).play()
+    return {
+        "match": match_id,
+        "winner": result.winner,
+        "reason": result.reason,
+        "turns": result.turns,
+        "health": result.health,
+        "latency_ms": [[round(seconds * 1000, 1) for seconds in latencies] for latencies in result.latencies]
+    }
+
+def read_results(path):
+    """Reads a results file, ignoring a last line cut short by an interruption
+
+    Returns:
+        A dict mapping match ids to results
+    """
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            results[result["match"]] = result
+    return results
+
+def _ends_with_newline(path):
+    with open(path, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
+
+def percentile(values, fraction):
+    """The value below which the given fraction of the sorted values lie, by the nearest rank"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def standings(results):
+    """Tallies wins and answer latencies per algo
+
+    Args:
+        * results: The results read from a results file
+
+    Returns:
+        A list of (name, played, wins, draws, latencies in ms sorted) tuples, best win rate first
+
+    """
+    table = {}
+    for result in results:
+        players = [entry.split("@")[0] for entry in result["match"].split("|")[:2]]
+        for player_index, name in enumerate(players):
+            row = table.setdefault(name, [0, 0, 0, []])
+            row[0] += 1
+            if result["winner"] is None:
+                row[2] += 1
+            elif result["winner"] == player_index:
+                row[1] += 1
+            row[3].extend(result["latency_ms"][player_index])
+    rows = [(name, played, wins, draws, sorted(latencies)) for name, (played, wins, draws, latencies) in table.items()]
+    return sorted(rows, key=lambda row: (row[2] + row[3] / 2) / row[1], reverse=True)
+
+def report(rows, out=None):
+    """Writes the standings as a table to out, stdout by default"""
+    out = out or sys.stdout
+    out.write("{:<28} {:>6} {:>6} {:>6} {:>7} {:>9} {:>9} {:>9} {:>9}\n".format(
+        "algo", "played", "wins", "draws", "win %", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for name, played, wins, draws, latencies in rows:
+        out.write("{:<28} {:>6} {:>6} {:>6} {:>7.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}\n".format(
+            name, played, wins, draws, 100 * (wins + draws / 2) / played, percentile(latencies, 0.5),
+            percentile(latencies, 0.9), percentile(latencies, 0.99), latencies[-1] if latencies else 0.0))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m gamelib.tournament", description="Plays a round robin between zipped algos")
+    parser.add_argument("zips", nargs="+", help="the zipped algos")
+    parser.add_argument("--games", type=int, default=2, help="the number of matches each pair plays, alternating sides")
+    parser.add_argument("--results", default="tournament.jsonl", help="the file results are appended to and resumed from")
+    parser.add_argument("--work-dir", default=".tournament", help="the folder the zips are unpacked into")
+    parser.add_argument("--processes", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="the number of matches played at once, defaults to half the cores since each match runs two algos")
+    parser.add_argument("--config", help="a game config json file, defaults to gamelib.config.DEFAULT_CONFIG")
+    parser.add_argument("--max-turns", type=int, default=DEFAULT_MAX_TURNS, help="the turn after which the healthier algo wins")
+    args = parser.parse_args(argv)
+
+    config = DEFAULT_CONFIG
+    if args.config:
+        with open(args.config) as file:
+            config = json.load(file)
+    os.makedirs(args.work_dir, exist_ok=True)
+    algos = []
+    for zip_path in args.zips:
+        name, digest, algo_dir = unpack(zip_path, args.work_dir)
+        if algo_dir is None:
+            sys.stderr.write("{} has no algo_strategy.py, skipping it\n".format(zip_path))
+            continue
+        algos.append((name, digest, os.path.abspath(algo_dir)))
+
+    done = read_results(args.results)
+    matches = schedule(algos, args.games)
+    pending = [match for match in matches if match[0] not in done]
+    sys.stdout.write("{} matches, {} already played\n".format(len(matches), len(matches) - len(pending)))
+    with open(args.results, "a") as results_file, \
+            concurrent.futures.ProcessPoolExecutor(max(1, args.processes)) as executor:
+        if results_file.tell() and not _ends_with_newline(args.results):
+            # An interrupted run may have left half a line
+            results_file.write("\n")
+        futures = [executor.submit(play_match, match_id, first[2], second[2], config, args.max_turns)
+                   for match_id, first, second in pending]
+        for count, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            try:
+                result = future.result()
+            except Exception as e:
+                sys.stderr.write("match failed: {}\n".format(e))
+                continue
+            results_file.write(json.dumps(result, separators=(",", ":")) + "\n")
+            results_file.flush()
+            done[result["match"]] = result
+            sys.stdout.write("[{}/{}] {}\n".format(count, len(pending), result["match"]))
+
+    current = {match_id for match_id, _, _ in matches}
+    report(standings([result for match_id, result in done.items() if match_id in current]))
+
+if __name__ == "__main__":
+    main()
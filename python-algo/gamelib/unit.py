@@ -1,8 +1,65 @@
+from collections import namedtuple
+
 def is_stationary(unit_type, firewall_types):
     return unit_type in firewall_types
 
+"""
+The stats every unit of a type shares. Fields that do not apply to a type are None,
+for example damage_f for firewalls.
+"""
+UnitStats = namedtuple("UnitStats", ["unit_type", "type_index", "stationary", "speed", "damage", "damage_f", "damage_i", "range", "max_stability", "cost"])
+
+# The fields of each unitInformation entry the stats are made from
+_STAT_FIELDS = ("shorthand", "damage", "shieldAmount", "damageF", "damageI", "speed", "range", "stability", "cost")
+
+# Maps the stat fields of a config's unit types to their stats, so configs with the same units share them
+_STATS_BY_UNITS = {}
+# The last config looked up and its stats, since a game looks up the same config for every unit
+_last = (None, None)
+
+def get_unit_stats(config):
+    """Gets the shared stats of every unit type in a config, resolving them once per set of unit types
+
+    Args:
+        * config (JSON): Contains information about the game
+
+    Returns:
+        A dict mapping each unit type to its UnitStats
+
+    """
+    global _last
+    last_config, last_stats = _last
+    if config is last_config:
+        return last_stats
+    key = tuple(tuple(type_config.get(field) for field in _STAT_FIELDS) for type_config in config["unitInformation"][:6])
+    stats = _STATS_BY_UNITS.get(key)
+    if stats is None:
+        stats = _STATS_BY_UNITS[key] = _make_unit_stats(config)
+    _last = (config, stats)
+    return stats
+
+def _make_unit_stats(config):
+    unit_information = config["unitInformation"]
+    firewall_types = [unit_information[index]["shorthand"] for index in range(3)]
+    encryptor = unit_information[1]["shorthand"]
+    stats = {}
+    # The last entry is the removal pseudo unit, which has no stats
+    for type_index, type_config in enumerate(unit_information[:6]):
+        unit_type = type_config["shorthand"]
+        stationary = is_stationary(unit_type, firewall_types)
+        if stationary:
+            damage = type_config["shieldAmount"] if unit_type == encryptor else type_config["damage"]
+            stats[unit_type] = UnitStats(unit_type, type_index, True, 0, damage, None, None,
+                                         type_config["range"], type_config["stability"], type_config["cost"])
+        else:
+            stats[unit_type] = UnitStats(unit_type, type_index, False, type_config["speed"], None, type_config["damageF"], type_config["damageI"],
+                                         type_config["range"], type_config["stability"], type_config["cost"])
+    return stats
+
 class GameUnit:
-    """Holds information about a Unit. 
+    """Holds information about a Unit.
+
+    Type information such as damage and range is read from a UnitStats record shared by all units of the same type.
 
     Attributes:
         * unit_type (string): This unit's type
@@ -19,8 +76,11 @@ class GameUnit:
         * max_stability (float): The starting stability of this unit. Note than stability can be increased beyond this value by encryptors
         * stability (float): The current health of this unit
         * cost (int): The resource cost of this unit
+        * stats (:obj: UnitStats): The stats shared by all units of this type
 
     """
+    __slots__ = ("unit_type", "config", "player_index", "pending_removal", "x", "y", "stability", "stats")
+
     def __init__(self, unit_type, config, player_index=None, stability=None, x=-1, y=-1):
         """ Initialize unit variables using args passed
 
@@ -31,26 +91,58 @@ class GameUnit:
         self.pending_removal = False
         self.x = x
         self.y = y
-        self.__serialize_type()
-        self.stability = self.max_stability if not stability else stability
-
-    def __serialize_type(self):
-        from .game_state import FIREWALL_TYPES, UNIT_TYPE_TO_INDEX, ENCRYPTOR
-        self.stationary = is_stationary(self.unit_type, FIREWALL_TYPES)
-        type_config = self.config["unitInformation"][UNIT_TYPE_TO_INDEX[self.unit_type]]
-        if self.stationary:
-            self.speed = 0
-            if self.unit_type == ENCRYPTOR:
-                self.damage = type_config["shieldAmount"]
-            else:
-                self.damage = type_config["damage"]
-        else:
-            self.speed = type_config["speed"]
-            self.damage_f = type_config["damageF"]
-            self.damage_i = type_config["damageI"]
-        self.range = type_config["range"]
-        self.max_stability = type_config["stability"]
-        self.cost = type_config["cost"]
+        self.stats = get_unit_stats(config)[unit_type]
+        self.stability = self.stats.max_stability if not stability else stability
+
+    @property
+    def stationary(self):
+        return self.stats.stationary
+
+    @property
+    def speed(self):
+        return self.stats.speed
+
+    @property
+    def damage(self):
+        return self.stats.damage
+
+    @property
+    def damage_f(self):
+        return self.stats.damage_f
+
+    @property
+    def damage_i(self):
+        return self.stats.damage_i
+
+    @property
+    def range(self):
+        return self.stats.range
+
+    @property
+    def max_stability(self):
+        return self.stats.max_stability
+
+    @property
+    def cost(self):
+        return self.stats.cost
+
+    def copy(self):
+        """Makes a copy of this unit that shares its stats
+
+        Returns:
+            A new GameUnit with the same state
+
+        """
+        unit = GameUnit.__new__(GameUnit)
+        unit.unit_type = self.unit_type
+        unit.config = self.config
+        unit.player_index = self.player_index
+        unit.pending_removal = self.pending_removal
+        unit.x = self.x
+        unit.y = self.y
+        unit.stability = self.stability
+        unit.stats = self.stats
+        return unit
 
     def __toString(self):
         owner = "Friendly" if self.player_index == 0 else "Enemy"
@@ -62,4 +154,3 @@ class GameUnit:
 
     def __repr__(self):
         return self.__toString()
-
@@ -3,6 +3,22 @@ import sys
 
 BANNER_TEXT = "---------------- Starting Your Algo --------------------"
 
+"""
+Message types returned by classify_message. The turn, action frame and end types match turnInfo[0].
+"""
+CONFIG_MESSAGE = -1
+TURN_MESSAGE = 0
+ACTION_FRAME_MESSAGE = 1
+END_MESSAGE = 2
+UNKNOWN_MESSAGE = None
+
+_TURN_INFO_KEY = '"turnInfo"'
+
+"""
+The GameRecorder sent commands are copied to, see set_command_recorder.
+"""
+_command_recorder = None
+
 
 def get_command():
     """Gets input from stdin
@@ -21,14 +37,66 @@ def get_command():
         exit()
     return ret
 
+def read_turn_info(line):
+    """Reads the turnInfo list of a message from the game without parsing the rest of it as json
+
+    Args:
+        * line: A line received from the game
+
+    Returns:
+        The turnInfo values as a list of ints, or None if the line has no readable turnInfo
+
+    """
+    index = line.find(_TURN_INFO_KEY)
+    if index < 0:
+        return None
+    index = line.find("[", index + len(_TURN_INFO_KEY))
+    end = line.find("]", index)
+    if index < 0 or end < 0:
+        return None
+    try:
+        return [int(float(value)) for value in line[index + 1:end].split(",")]
+    except ValueError:
+        return None
+
+def classify_message(line):
+    """Finds the type of a message from the game without parsing it as json
+
+    Only the characters after the turnInfo key are read, so this is cheap even for the largest action frames.
+
+    Args:
+        * line: A line received from the game
+
+    Returns:
+        CONFIG_MESSAGE, TURN_MESSAGE, ACTION_FRAME_MESSAGE or END_MESSAGE, or the turnInfo[0] value of an unknown
+        turn message type. UNKNOWN_MESSAGE if the line is not a message from the game.
+
+    """
+    if line.find(_TURN_INFO_KEY) < 0:
+        return CONFIG_MESSAGE if "replaySave" in line else UNKNOWN_MESSAGE
+    turn_info = read_turn_info(line)
+    return turn_info[0] if turn_info else UNKNOWN_MESSAGE
+
 def send_command(cmd):
     """Sends your turn to standard output.
     Should usually only be called by 'GameState.submit_turn()'
 
     """
+    if _command_recorder is not None:
+        _command_recorder.record_sent(cmd.strip())
     sys.stdout.write(cmd.strip() + "\n")
     sys.stdout.flush()
 
+def set_command_recorder(recorder):
+    """Sets the GameRecorder that every command sent with send_command is also recorded to
+
+    Args:
+        * recorder: The GameRecorder, or None to stop recording sent commands
+
+    """
+    global _command_recorder
+    _command_recorder = recorder
+
 def debug_write(*msg):
     """Prints a message to the games debug output
 
@@ -0,0 +1,366 @@
+import json
+import math
+import multiprocessing
+import pickle
+import queue
+import traceback
+from array import array
+from multiprocessing import shared_memory
+
+from .game_state import GameState
+from .navigation import GRID_CELLS, CELL_X, CELL_Y
+from .budget import active_budget
+from .util import debug_write
+
+"""
+The board is published to the workers through one shared memory block, laid out as
+
+    header      HEADER_FIELDS float64 values, see WorkerPool.__publish
+    unit_type   GRID_CELLS bytes, the type index + 1 of the firewall on each location, 0 for none
+    owner       GRID_CELLS bytes, the player index of each firewall
+    removal     GRID_CELLS bytes, 1 for firewalls pending removal
+    stability   GRID_CELLS float32 values
+    deploys     MAX_DEPLOYS (type index, x, y) int16 triples, the deploy stack of the turn so far
+
+Locations are indexed by x * ARENA_SIZE + y.
+"""
+
+HEADER_FIELDS = 11
+MAX_DEPLOYS = 1024
+_HEADER_BYTES = 8 * HEADER_FIELDS
+_TYPE_OFFSET = _HEADER_BYTES
+_OWNER_OFFSET = _TYPE_OFFSET + GRID_CELLS
+_REMOVAL_OFFSET = _OWNER_OFFSET + GRID_CELLS
+_STABILITY_OFFSET = _REMOVAL_OFFSET + GRID_CELLS
+_DEPLOY_OFFSET = _STABILITY_OFFSET + 4 * GRID_CELLS
+_BLOCK_BYTES = _DEPLOY_OFFSET + 2 * 3 * MAX_DEPLOYS
+
+"""
+How often, in seconds, map_candidates checks that the workers are alive while it waits for them
+"""
+POLL_SECONDS = 0.05
+
+def _read_board(config, buffer):
+    """Rebuilds a GameState from a published board
+
+    Returns:
+        The generation of the board and the GameState
+
+    """
+    header = array('d')
+    header.frombytes(bytes(buffer[:_HEADER_BYTES]))
+    generation, turn_number, my_health, enemy_health, my_time, enemy_time, my_cores, my_bits, enemy_cores, enemy_bits, deploy_count = header
+    unit_type = bytes(buffer[_TYPE_OFFSET:_OWNER_OFFSET])
+    owner = bytes(buffer[_OWNER_OFFSET:_REMOVAL_OFFSET])
+    removal = bytes(buffer[_REMOVAL_OFFSET:_STABILITY_OFFSET])
+    stability = array('f')
+    stability.frombytes(bytes(buffer[_STABILITY_OFFSET:_DEPLOY_OFFSET]))
+    deploys = array('h')
+    deploys.frombytes(bytes(buffer[_DEPLOY_OFFSET:_DEPLOY_OFFSET + 6 * int(deploy_count)]))
+
+    units = [[[] for _ in range(7)] for _ in range(2)]
+    for index in range(GRID_CELLS):
+        if unit_type[index]:
+            player_units = units[owner[index]]
+            player_units[unit_type[index] - 1].append([CELL_X[index], CELL_Y[index], stability[index], ""])
+            if removal[index]:
+                player_units[6].append([CELL_X[index], CELL_Y[index], 0.0, ""])
+    turn_string = json.dumps({
+        "turnInfo": [0, int(turn_number), -1],
+        "p1Stats": [my_health, my_cores, my_bits, my_time],
+        "p2Stats": [enemy_health, enemy_cores, enemy_bits, enemy_time],
+        "p1Units": units[0],
+        "p2Units": units[1],
+        "events": {}
+    })
+    game_state = GameState(config, turn_string)
+    game_state.suppress_warnings(True)
+    shorthands = [unit_information["shorthand"] for unit_information in config["unitInformation"]]
+    for i in range(0, len(deploys), 3):
+        deploy_type, x, y = shorthands[deploys[i]], deploys[i + 1], deploys[i + 2]
+        game_state.game_map.add_unit(deploy_type, [x, y], 0)
+        game_state._deploy_stack.append((deploy_type, x, y))
+    return int(generation), game_state
+
+def _score(scorer, game_state, chunk):
+    """Scores a chunk of (position, candidate) pairs, each on its own fork of the game state
+    """
+    results = []
+    for position, candidate in chunk:
+        try:
+            results.append((position, scorer(game_state.fork(), candidate), None))
+        except Exception:
+            results.append((position, None, traceback.format_exc()))
+    return results
+
+def _pickle_results(results):
+    """Pickles scored results, replacing the scores that cannot be pickled with an error
+    """
+    try:
+        return pickle.dumps(results)
+    except Exception:
+        picklable = []
+        for position, score, error in results:
+            try:
+                pickle.dumps(score)
+                picklable.append((position, score, error))
+            except Exception:
+                picklable.append((position, None, "The score could not be pickled\n" + traceback.format_exc()))
+        return pickle.dumps(picklable)
+
+def _worker_loop(worker_index, config, board, tasks, results):
+    """Scores tasks until it gets None
+
+    Tasks are (generation, chunk id, pickled (scorer, chunk)) tuples. For each task the worker first puts
+    (worker_index, chunk id, None) on the results queue, so the pool knows which chunk is lost if the worker dies,
+    then (worker_index, chunk id, pickled results), or an error message if the task could not be scored at all.
+    """
+    generation = -1
+    game_state = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_generation, chunk_id, payload = task
+        results.put((worker_index, chunk_id, None))
+        try:
+            scorer, chunk = pickle.loads(payload)
+            if task_generation != generation:
+                generation, game_state = _read_board(config, board.buf)
+            results.put((worker_index, chunk_id, _pickle_results(_score(scorer, game_state, chunk))))
+        except Exception:
+            results.put((worker_index, chunk_id, traceback.format_exc()))
+
+class WorkerPool:
+    """Scores candidate plans in parallel on worker processes
+
+    The workers are forked when the pool is created, so create it in on_game_start where the startup cost
+    is not counted against a turn. Each turn the board is written once to shared memory, see map_candidates,
+    and only small candidate descriptors and scores go through the task queues.
+    Where fork is not available, or with processes=0, candidates are scored in this process instead.
+    Candidates that cannot be sent to a worker, or whose worker died, are also scored in this process, and
+    map_candidates stops waiting for the workers when the turn's budget runs out, see gamelib.budget.
+
+    Attributes:
+        * config (JSON): Contains information about the game
+        * processes (int): The number of worker processes, 0 when scoring in this process
+
+    """
+    def __init__(self, config, processes=None):
+        """Starts the workers
+
+        Args:
+            * config (JSON): Contains information about the game
+            * processes: The number of worker processes. Defaults to one per CPU, less one for this process.
+
+        """
+        self.config = config
+        if processes is None:
+            processes = max(1, (multiprocessing.cpu_count() or 1) - 1)
+        if "fork" not in multiprocessing.get_all_start_methods():
+            debug_write("WorkerPool: fork is not available, scoring candidates in this process")
+            processes = 0
+        self.processes = processes
+        self.__generation = 0
+        self.__calls = 0
+        self.__published = None
+        self.__workers = []
+        self.__board = None
+        if not processes:
+            return
+
+        context = multiprocessing.get_context("fork")
+        self.__board = shared_memory.SharedMemory(create=True, size=_BLOCK_BYTES)
+        self.__tasks = context.Queue()
+        self.__results = context.Queue()
+        for worker_index in range(processes):
+            worker = context.Process(target=_worker_loop, args=(worker_index, config, self.__board, self.__tasks, self.__results), daemon=True)
+            worker.start()
+            self.__workers.append(worker)
+
+    def __publish(self, game_state):
+        """Writes the board of a game state to shared memory, unless it was the last one written and is unchanged
+        """
+        key = (id(game_state), game_state.turn_number, game_state.game_map.unit_version, len(game_state._deploy_stack))
+        if key == self.__published:
+            return
+        if len(game_state._deploy_stack) > MAX_DEPLOYS:
+            debug_write("WorkerPool: only the first {} deployed units are sent to the workers".format(MAX_DEPLOYS))
+
+        unit_type = bytearray(GRID_CELLS)
+        owner = bytearray(GRID_CELLS)
+        removal = bytearray(GRID_CELLS)
+        stability = array('f', bytes(4 * GRID_CELLS))
+        game_map = game_state.game_map
+        mask = game_map.get_stationary_mask()
+        for index in range(GRID_CELLS):
+            if not mask[index]:
+                continue
+            for unit in game_map[CELL_X[index], CELL_Y[index]]:
+                if unit.stationary:
+                    unit_type[index] = unit.stats.type_index + 1
+                    owner[index] = unit.player_index
+                    removal[index] = unit.pending_removal
+                    stability[index] = unit.stability
+                    break
+
+        type_index = {unit_information["shorthand"]: index for index, unit_information in enumerate(self.config["unitInformation"])}
+        deploys = array('h')
+        for deploy_type, x, y in game_state._deploy_stack[:MAX_DEPLOYS]:
+            deploys.extend((type_index[deploy_type], x, y))
+
+        self.__generation += 1
+        resources = game_state._player_resources
+        header = array('d', [self.__generation, game_state.turn_number, game_state.my_health, game_state.enemy_health,
+                             game_state.my_time, game_state.enemy_time, resources[0]['cores'], resources[0]['bits'],
+                             resources[1]['cores'], resources[1]['bits'], len(deploys) // 3])
+        buffer = self.__board.buf
+        buffer[:_HEADER_BYTES] = header.tobytes()
+        buffer[_TYPE_OFFSET:_OWNER_OFFSET] = unit_type
+        buffer[_OWNER_OFFSET:_REMOVAL_OFFSET] = owner
+        buffer[_REMOVAL_OFFSET:_STABILITY_OFFSET] = removal
+        buffer[_STABILITY_OFFSET:_DEPLOY_OFFSET] = stability.tobytes()
+        buffer[_DEPLOY_OFFSET:_DEPLOY_OFFSET + 2 * len(deploys)] = deploys.tobytes()
+        self.__published = key
+
+    def map_candidates(self, game_state, candidates, scorer):
+        """Scores each candidate on its own fork of the game state
+
+        The workers see the stationary units of the map, the units deployed with attempt_spawn and both players'
+        resources, health and time, but not the build stack or information units added to the map by other means.
+
+        Args:
+            * game_state: The GameState to evaluate the candidates on
+            * candidates: A list of small picklable descriptors, such as (unit_type, location, num)
+            * scorer: A module level function taking (game_state, candidate) and returning a picklable score.
+              The game state it gets is a fork it may change freely. A scorer that cannot be pickled, such as
+              a nested function, is run in this process.
+
+        Returns:
+            A list with the score of each candidate, in order. The score is None for candidates whose scorer raised an exception
+            or returned a score that cannot be pickled, and for those still being scored when the turn's budget ran out.
+
+        """
+        candidates = list(candidates)
+        if self.processes:
+            try:
+                pickle.dumps(scorer)
+            except Exception:
+                debug_write("WorkerPool: the scorer cannot be pickled, scoring candidates in this process")
+                return self.__scores(candidates, _score(scorer, game_state, list(enumerate(candidates))))
+        if not self.processes:
+            return self.__scores(candidates, _score(scorer, game_state, list(enumerate(candidates))))
+
+        self.__publish(game_state)
+        self.__calls += 1
+        # A few chunks per worker balances uneven candidates without flooding the queues
+        chunk_size = max(1, math.ceil(len(candidates) / (4 * self.processes)))
+        pending = {}
+        results = []
+        for start in range(0, len(candidates), chunk_size):
+            chunk = [(position, candidates[position]) for position in range(start, min(start + chunk_size, len(candidates)))]
+            chunk_id = (self.__calls, start)
+            try:
+                payload = pickle.dumps((scorer, chunk))
+            except Exception:
+                results.extend(_score(scorer, game_state, chunk))
+                continue
+            pending[chunk_id] = chunk
+            self.__tasks.put((self.__generation, chunk_id, payload))
+        results.extend(self.__collect(game_state, scorer, pending))
+        return self.__scores(candidates, results)
+
+    def __collect(self, game_state, scorer, pending):
+        """Waits for the results of the chunks sent to the workers
+
+        Chunks whose worker died or failed are scored in this process. If the turn's budget runs out first,
+        the chunks not scored yet are dropped and their candidates get no score.
+
+        Returns:
+            The (position, score, error) results of the chunks
+
+        """
+        results = []
+        # The chunk each worker is scoring
+        running = {}
+        died = False
+        budget = active_budget()
+        while pending:
+            timeout = POLL_SECONDS
+            if budget is not None:
+                timeout = min(timeout, budget.remaining())
+                if timeout <= 0:
+                    debug_write("WorkerPool: the turn's time ran out with {} candidates not scored".format(sum(map(len, pending.values()))))
+                    self.__drop_tasks()
+                    return results
+            try:
+                worker_index, chunk_id, payload = self.__results.get(timeout=timeout)
+            except queue.Empty:
+                for worker_index, worker in enumerate(self.__workers):
+                    if worker is not None and not worker.is_alive():
+                        debug_write("WorkerPool: worker {} died".format(worker_index))
+                        self.__workers[worker_index] = None
+                        died = True
+                        lost = running.pop(worker_index, None)
+                        if lost in pending:
+                            results.extend(_score(scorer, game_state, pending.pop(lost)))
+                if not any(self.__workers) or (died and not running and self.__tasks.empty()):
+                    # A worker that died before saying which chunk it took leaves that chunk with no one to score it
+                    self.__drop_tasks()
+                    if not any(self.__workers):
+                        debug_write("WorkerPool: no workers are left, scoring candidates in this process")
+                        self.processes = 0
+                    for chunk in pending.values():
+                        results.extend(_score(scorer, game_state, chunk))
+                    return results
+                continue
+            if chunk_id not in pending:
+                # A late result of a chunk given up on by an earlier call
+                continue
+            if payload is None:
+                running[worker_index] = chunk_id
+            elif isinstance(payload, str):
+                debug_write("WorkerPool: a worker could not score a chunk, scoring it in this process\n{}".format(payload))
+                results.extend(_score(scorer, game_state, pending.pop(chunk_id)))
+            else:
+                results.extend(pickle.loads(payload))
+                del pending[chunk_id]
+            if payload is not None and running.get(worker_index) == chunk_id:
+                del running[worker_index]
+        return results
+
+    def __drop_tasks(self):
+        """Takes the tasks no worker has started off the queue
+        """
+        try:
+            while True:
+                self.__tasks.get_nowait()
+        except queue.Empty:
+            pass
+
+    def __scores(self, candidates, results):
+        """Puts scored results in candidate order, reporting errors
+        """
+        scores = [None] * len(candidates)
+        for position, score, error in results:
+            if error is not None:
+                debug_write("WorkerPool: scoring candidate {} failed\n{}".format(candidates[position], error))
+            scores[position] = score
+        return scores
+
+    def close(self):
+        """Stops the workers and frees the shared memory
+        """
+        workers = [worker for worker in self.__workers if worker is not None]
+        for _ in workers:
+            self.__tasks.put(None)
+        for worker in workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+        self.__workers = []
+        self.processes = 0
+        if self.__board is not None:
+            self.__board.close()
+            self.__board.unlink()
+            self.__board = None